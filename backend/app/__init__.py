@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, Request, current_app
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from pymongo import MongoClient
@@ -8,24 +8,60 @@ import os
 # Load environment variables
 load_dotenv()
 
+from .metrics import mongo_listeners, init_app as init_metrics
+
 # Initialize extensions
 jwt = JWTManager()
-client = MongoClient(os.getenv("MONGO_URI"))
+client = MongoClient(os.getenv("MONGO_URI"), event_listeners=mongo_listeners())
 db = client.get_database() # The DB name is in the URI
 
-def create_app():
+# Endpoints allowed a larger body than MAX_CONTENT_LENGTH, by path suffix
+LARGE_UPLOAD_LIMITS = {
+    '/admin/bulk-register-students': 'BULK_MAX_CONTENT_LENGTH',
+    '/teacher/mark-attendance-video': 'VIDEO_MAX_CONTENT_LENGTH',
+}
+
+class AppRequest(Request):
+    """Allows bulk and video upload endpoints a larger body than MAX_CONTENT_LENGTH."""
+    @property
+    def max_content_length(self):
+        for suffix, config_key in LARGE_UPLOAD_LIMITS.items():
+            if self.path.endswith(suffix):
+                return current_app.config[config_key]
+        return super().max_content_length
+
+def create_app(start_jobs=True):
+    """
+    Builds the Flask app. A pre-fork server passes start_jobs=False and calls
+    job_queue.start() in each worker instead, since threads started in the
+    master do not survive the fork.
+    """
     app = Flask(__name__)
+    app.request_class = AppRequest
     
     # Configuration
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload size
+    app.config['ENSURE_INDEXES'] = os.getenv("ENSURE_INDEXES", "true").lower() == "true"
+    app.config['BULK_MAX_CONTENT_LENGTH'] = int(os.getenv("BULK_MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+    app.config['VIDEO_MAX_CONTENT_LENGTH'] = int(os.getenv("VIDEO_MAX_UPLOAD_MB", "100")) * 1024 * 1024
     
     # Initialize extensions with app
     CORS(app)
     jwt.init_app(app)
+    init_metrics(app)
 
     # Import and register blueprints
     from .routes import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
+
+    if app.config['ENSURE_INDEXES']:
+        from .indexes import ensure_indexes
+        ensure_indexes()
+
+    # Start job workers (a no-op for the in-process backend)
+    if start_jobs:
+        from .jobs import job_queue
+        job_queue.start()
     
     return app
\ No newline at end of file
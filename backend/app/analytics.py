@@ -0,0 +1,162 @@
+import datetime
+from collections import defaultdict
+from . import db
+from . import rollups
+
+
+def prefix_range(prefix):
+    """
+    Range predicate matching exactly the strings that start with `prefix`.
+    Unlike a ^prefix $regex it is a plain index range scan.
+    """
+    return {"$gte": prefix, "$lt": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def period_filter(period):
+    """
+    Attendance filter for a "YYYY", "YYYY-MM" or "YYYY-MM-DD" period, as a
+    range on the typed `day` field. Anything else falls back to a prefix
+    range on the `date` string.
+    """
+    for fmt, step in (("%Y-%m-%d", "day"), ("%Y-%m", "month"), ("%Y", "year")):
+        try:
+            start = datetime.datetime.strptime(period, fmt)
+        except (TypeError, ValueError):
+            continue
+        if start.strftime(fmt) != period:
+            continue
+        if step == "day":
+            end = start + datetime.timedelta(days=1)
+        elif step == "month":
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            end = start.replace(year=start.year + 1)
+        return {"day": {"$gte": start, "$lt": end}}
+    return {"date": prefix_range(period)}
+
+
+def _percentage(records, students, sessions):
+    possible = students * sessions
+    return (records / possible) * 100 if possible > 0 else 0
+
+
+def former_course_records(selected_course_ids):
+    """
+    Attendance that students of the selected courses (all students when none
+    are selected) still hold in courses they have since left. The rollup
+    only counts a student's current course, and moves are rare, so these few
+    records are read directly.
+    """
+    student_filter = {"role": "student", rollups.FORMER_COURSES + ".0": {"$exists": True}}
+    if selected_course_ids:
+        student_filter["course_id"] = {"$in": selected_course_ids}
+    current_course, former = {}, set()
+    for student in db.users.find(student_filter, {"course_id": 1, rollups.FORMER_COURSES: 1}):
+        current_course[student['_id']] = student.get('course_id')
+        former.update(student[rollups.FORMER_COURSES])
+    if selected_course_ids:
+        former &= set(selected_course_ids)
+    if not current_course or not former:
+        return []
+    cursor = db.attendance.find(
+        {"student_id": {"$in": list(current_course)}, "course_id": {"$in": list(former)}},
+        {"student_id": 1, "course_id": 1, "date": 1}
+    )
+    return [record for record in cursor if record.get('course_id') != current_course[record['student_id']]]
+
+
+def admin_analytics(selected_course_ids, course_filter):
+    """
+    Computes the admin dashboard figures from the attendance_daily rollup, so
+    the cost depends on the number of courses and session dates rather than
+    on the size of the attendance history.
+    """
+    student_filter = {"role": "student"}
+    if selected_course_ids:
+        student_filter["course_id"] = {"$in": selected_course_ids}
+    students_per_course = {
+        row["_id"]: row["count"]
+        for row in db.users.aggregate([{"$match": student_filter}, {"$group": {"_id": "$course_id", "count": {"$sum": 1}}}])
+    }
+    total_students = sum(students_per_course.values())
+    if total_students == 0:
+        return {"totalStudents": 0, "overallAttendancePercentage": 0, "courseAnalytics": []}
+
+    daily_filter = {"present": {"$gt": 0}}
+    if selected_course_ids:
+        daily_filter["course_id"] = {"$in": selected_course_ids}
+    per_course = defaultdict(lambda: {"records": 0, "sessions": 0})
+    overall_records, overall_dates = 0, set()
+    for day in db[rollups.DAILY].find(daily_filter, {"course_id": 1, "date": 1, "present": 1}):
+        stats = per_course[day["course_id"]]
+        stats["records"] += day["present"]
+        stats["sessions"] += 1
+        overall_records += day["present"]
+        overall_dates.add(day["date"])
+    for record in former_course_records(selected_course_ids):
+        overall_records += 1
+        overall_dates.add(record['date'])
+    overall_percentage = _percentage(overall_records, total_students, len(overall_dates))
+
+    course_analytics = []
+    for course in db.courses.find(course_filter if selected_course_ids else {}, {"name": 1}):
+        course_id_str = str(course['_id'])
+        students_in_course = students_per_course.get(course_id_str, 0)
+        if students_in_course == 0:
+            course_analytics.append({"name": course['name'], "attendance": 0})
+            continue
+        stats = per_course[course_id_str]
+        course_percentage = _percentage(stats["records"], students_in_course, stats["sessions"])
+        course_analytics.append({"name": course['name'], "attendance": round(course_percentage, 2)})
+
+    return {
+        "totalStudents": total_students,
+        "overallAttendancePercentage": round(overall_percentage, 2),
+        "courseAnalytics": course_analytics
+    }
+
+
+def teacher_course_analytics(course_id, month_str):
+    """
+    Computes a course's monthly attendance percentage and the present/absent
+    split of its last 7 sessions from the attendance_daily rollup.
+    """
+    students_in_course_count = db.users.count_documents({"role": "student", "course_id": course_id})
+
+    if students_in_course_count == 0:
+        return {
+            "studentsInCourse": 0,
+            "overallAttendancePercentage": 0,
+            "dailyStats": [],
+            "totalClasses": 0
+        }
+
+    session_filter = {"course_id": course_id, "present": {"$gt": 0}}
+    month_filter = {**session_filter, **period_filter(month_str)} if month_str else session_filter
+    month_days = list(db[rollups.DAILY].find(month_filter, {"present": 1}))
+    month_records = sum(day["present"] for day in month_days)
+
+    recent = db[rollups.DAILY].find(session_filter, {"date": 1, "present": 1}).sort("date", -1).limit(7)
+    daily_stats = [
+        {"date": day["date"], "Present": day["present"], "Absent": students_in_course_count - day["present"]}
+        for day in recent
+    ]
+    return {
+        "studentsInCourse": students_in_course_count,
+        "overallAttendancePercentage": round(_percentage(month_records, students_in_course_count, len(month_days)), 2),
+        "dailyStats": daily_stats,
+        "totalClasses": len(month_days)
+    }
+
+
+def course_session_dates(course_id, after=None):
+    """
+    Returns the sorted session calendar of a course from the rollup, or only
+    the sessions later than `after`.
+    """
+    query = {"course_id": course_id, "records": {"$gt": 0}}
+    if after is not None:
+        query["date"] = {"$gt": after}
+    cursor = db[rollups.DAILY].find(query, {"date": 1}).sort("date", 1)
+    return [day["date"] for day in cursor]
+
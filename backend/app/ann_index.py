@@ -0,0 +1,232 @@
+import copy
+import os
+import threading
+import time
+import numpy as np
+from . import db
+from .services import face_distance_matrix
+from .encoding_format import unpack_encoding, stack_encodings
+
+# Index implementation used for school-wide identification: "ivf" or "exact"
+ANN_INDEX = os.getenv("ANN_INDEX", "ivf")
+# Number of IVF partitions searched per query; higher is slower but more accurate
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Number of IVF partitions; 0 picks roughly sqrt(number of students)
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+# Seconds before the school index is rebuilt from Mongo in the background
+ANN_INDEX_TTL = float(os.getenv("ANN_INDEX_TTL", "900"))
+
+
+class ExactIndex:
+    """
+    Brute-force index over 128-d encodings. Serves as the reference the IVF
+    index is measured against, and as the fallback for small schools.
+    """
+    def __init__(self):
+        self.ids = np.empty(0, dtype=object)
+        self.matrix = np.empty((0, 128), dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def build(self, ids, matrix):
+        self.ids = np.array(ids, dtype=object)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, 128)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self._positions = {student_id: pos for pos, student_id in enumerate(self.ids)}
+        return self
+
+    def copy(self):
+        """
+        A copy that can be patched while searches go on in the original.
+        Arrays that add() replaces rather than writes to are shared.
+        """
+        clone = copy.copy(self)
+        clone.alive = self.alive.copy()
+        clone._positions = dict(self._positions)
+        return clone
+
+    def add(self, student_id, encoding):
+        self.remove(student_id)
+        row = unpack_encoding(encoding).reshape(1, 128)
+        pos = len(self.ids)
+        self.ids = np.append(self.ids, np.array([student_id], dtype=object))
+        self.matrix = np.vstack([self.matrix, row])
+        self.alive = np.append(self.alive, True)
+        self._positions[student_id] = pos
+        return pos
+
+    def remove(self, student_id):
+        pos = self._positions.pop(student_id, None)
+        if pos is not None:
+            self.alive[pos] = False
+        return pos
+
+    def _candidates(self, query, **params):
+        return np.flatnonzero(self.alive)
+
+    def search(self, query, k=2, **params):
+        """
+        Returns the k nearest (student_id, distance) pairs for one encoding,
+        closest first.
+        """
+        candidates = self._candidates(query, **params)
+        if not len(candidates):
+            return []
+        distances = face_distance_matrix(self.matrix[candidates], query)[0]
+        k = min(k, len(candidates))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(self.ids[candidates[i]], float(distances[i])) for i in nearest]
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: encodings are partitioned by k-means and a query only
+    scans the `nprobe` partitions whose centroids are closest to it.
+    """
+    def __init__(self, nlist=ANN_NLIST, nprobe=ANN_NPROBE, iterations=10, seed=0):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.empty((0, 128), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.lists = []
+
+    def build(self, ids, matrix):
+        super().build(ids, matrix)
+        self._train()
+        return self
+
+    def copy(self):
+        clone = super().copy()
+        # add() replaces the list of the cell it extends
+        clone.lists = list(self.lists)
+        return clone
+
+    def _train(self):
+        n = len(self.ids)
+        if n == 0:
+            self.centroids = np.empty((0, 128), dtype=np.float32)
+            self.assignments = np.empty(0, dtype=np.int32)
+            self.lists = []
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+        centroids = self.matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = np.argmin(face_distance_matrix(centroids, self.matrix), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.matrix)
+            counts = np.bincount(assignments, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        self.centroids = centroids
+        self.assignments = np.argmin(face_distance_matrix(centroids, self.matrix), axis=1).astype(np.int32)
+        self.lists = [list(np.flatnonzero(self.assignments == c)) for c in range(nlist)]
+
+    def add(self, student_id, encoding):
+        pos = super().add(student_id, encoding)
+        if not len(self.centroids):
+            self._train()
+            return pos
+        cell = int(np.argmin(face_distance_matrix(self.centroids, self.matrix[pos])[0]))
+        self.assignments = np.append(self.assignments, np.int32(cell))
+        self.lists[cell] = self.lists[cell] + [pos]
+        return pos
+
+    def _candidates(self, query, nprobe=None, **params):
+        if not len(self.centroids):
+            return np.empty(0, dtype=np.int64)
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        centroid_distances = face_distance_matrix(self.centroids, query)[0]
+        cells = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        positions = np.concatenate([np.asarray(self.lists[c], dtype=np.int64) for c in cells])
+        return positions[self.alive[positions]]
+
+
+def create_index(kind=ANN_INDEX):
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex()
+    raise ValueError(f"Unknown ANN index type: {kind}")
+
+
+class SchoolIndex:
+    """
+    Process-level index over every enrolled student's face encoding, used to
+    identify a student without knowing their course. Built lazily from Mongo,
+    patched by the admin routes and rebuilt in the background after its TTL.
+    Patches are applied to a copy that then replaces the index, so searches
+    run without the lock on an index that never changes under them.
+    """
+    def __init__(self, kind=ANN_INDEX, ttl=ANN_INDEX_TTL):
+        self.kind = kind
+        self.ttl = ttl
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._pending = []
+
+    def _build(self):
+        students = list(db.users.find(
+            {"role": "student", "face_encoding": {"$exists": True}},
+            {"face_encoding": 1, "face_encoding_format": 1}
+        ))
+        ids = [s['_id'] for s in students]
+        matrix = stack_encodings(students)
+        return create_index(self.kind).build(ids, matrix)
+
+    def _rebuild_in_background(self):
+        try:
+            index = self._build()
+            with self._lock:
+                # Replay writes that happened while the new index was loading
+                for operation, args in self._pending:
+                    getattr(index, operation)(*args)
+                self._index, self._built_at = index, time.monotonic()
+        except Exception as e:
+            print(f"Error rebuilding school face index: {e}")
+        finally:
+            with self._lock:
+                self._pending = []
+                self._rebuilding = False
+
+    def get(self):
+        with self._lock:
+            if self._index is None:
+                self._index, self._built_at = self._build(), time.monotonic()
+            elif time.monotonic() - self._built_at > self.ttl and not self._rebuilding:
+                self._rebuilding = True
+                self._pending = []
+                threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+            return self._index
+
+    def search(self, query, k=2, **params):
+        return self.get().search(query, k=k, **params)
+
+    def _apply(self, operation, *args):
+        with self._lock:
+            if self._index is None:
+                return
+            index = self._index.copy()
+            getattr(index, operation)(*args)
+            self._index = index
+            if self._rebuilding:
+                self._pending.append((operation, args))
+
+    def add_student(self, student_id, encoding):
+        self._apply("add", student_id, encoding)
+
+    def remove_student(self, student_id):
+        self._apply("remove", student_id)
+
+
+school_index = SchoolIndex()
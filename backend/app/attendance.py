@@ -0,0 +1,191 @@
+import atexit
+import datetime
+import os
+import threading
+from collections import defaultdict
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from . import db
+from . import rollups
+from .metrics import stage
+from .response_cache import analytics_cache
+from .timeline import session_calendars
+
+# Queue attendance upserts in each process and write them in batches instead
+# of one round trip per request
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() == "true"
+# Queued records that trigger an immediate flush
+ATTENDANCE_FLUSH_SIZE = int(os.getenv("ATTENDANCE_FLUSH_SIZE", "500"))
+# Seconds between flushes of whatever is queued
+ATTENDANCE_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "1"))
+# Flush the queued attendance of a course before its analytics or reports are read
+ATTENDANCE_READ_YOUR_WRITES = os.getenv("ATTENDANCE_READ_YOUR_WRITES", "true").lower() == "true"
+
+
+def today_str():
+    return datetime.datetime.now().strftime("%Y-%m-%d")
+
+
+def parse_day(date_str):
+    """Returns the typed `day` value stored next to a "%Y-%m-%d" date string."""
+    return datetime.datetime.strptime(date_str, "%Y-%m-%d")
+
+
+def _record_created(records, indexes):
+    """Counts the records at `indexes` of a write in the rollups and session calendars."""
+    created = defaultdict(list)
+    for index in indexes:
+        course_id, date, student_id = records[index]
+        created[(course_id, date)].append(student_id)
+    for (course_id, date), student_ids in created.items():
+        with stage("rollups"):
+            rollups.record_new_attendance(course_id, date, student_ids)
+        session_calendars.add_session(course_id, date)
+
+
+def _upsert_present(records, ordered=False):
+    """
+    Upserts a "Present" record for every (course_id, date, student_id) in one
+    bulk_write, counts the newly created ones in the rollups and invalidates
+    the affected courses' cached analytics. Returns the number created.
+    """
+    operations = [
+        UpdateOne(
+            {"student_id": student_id, "course_id": course_id, "date": date},
+            {"$set": {"status": "Present", "day": parse_day(date)}},
+            upsert=True
+        )
+        for course_id, date, student_id in records
+    ]
+    with stage("upsert"):
+        result = db.attendance.bulk_write(operations, ordered=ordered)
+    _record_created(records, result.upserted_ids)
+    if result.upserted_count or result.modified_count:
+        analytics_cache.bump(*{course_id for course_id, _, _ in records}, school=False)
+    return result.upserted_count
+
+
+class AttendanceBuffer:
+    """
+    Write-behind queue of "Present" upserts for this process. Marks of the
+    same student, course and date coalesce into one record; a background
+    thread writes the queue as an ordered bulk_write once
+    ATTENDANCE_FLUSH_SIZE records are waiting or every
+    ATTENDANCE_FLUSH_INTERVAL seconds. The upserts are idempotent, so records
+    of a failed batch are queued again and retried by the next flush.
+    """
+    def __init__(self, flush_size=ATTENDANCE_FLUSH_SIZE, interval=ATTENDANCE_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.interval = interval
+        self.flushed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, records):
+        with self._lock:
+            for record in records:
+                self._pending[record] = True
+            full = len(self._pending) >= self.flush_size
+            if self._thread is None or not self._thread.is_alive():
+                # Started on first use, so each forked worker runs its own
+                self._thread = threading.Thread(target=self._run, name="attendance-flush", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def _take(self, course_ids):
+        with self._lock:
+            if course_ids is None:
+                batch = list(self._pending)
+                self._pending.clear()
+            else:
+                wanted = set(course_ids)
+                batch = [record for record in self._pending if record[0] in wanted]
+                for record in batch:
+                    del self._pending[record]
+        return batch
+
+    def _requeue(self, records):
+        with self._lock:
+            for record in records:
+                self._pending.setdefault(record, True)
+
+    def flush(self, course_ids=None):
+        """
+        Writes the queued records, or only those of the given courses.
+        Returns the number of records written.
+        """
+        with self._flush_lock:
+            batch = self._take(course_ids)
+            if not batch:
+                return 0
+            try:
+                _upsert_present(batch, ordered=True)
+            except BulkWriteError as e:
+                # An ordered batch stops at the first error: everything before
+                # it is written, the failed record and the rest are retried
+                _record_created(batch, [upserted["index"] for upserted in e.details.get("upserted", [])])
+                analytics_cache.bump(*{course_id for course_id, _, _ in batch}, school=False)
+                errors = e.details.get("writeErrors") or [{"index": 0}]
+                written = errors[0]["index"]
+                self._requeue(batch[written:])
+                print(f"Error flushing attendance, {len(batch) - written} records queued again: {errors[0].get('errmsg')}")
+                self.flushed += written
+                return written
+            except Exception as e:
+                self._requeue(batch)
+                print(f"Error flushing attendance, {len(batch)} records queued again: {e}")
+                return 0
+            self.flushed += len(batch)
+            return len(batch)
+
+    def discard_student(self, student_id):
+        """Drops queued records of a student, e.g. one being deleted."""
+        with self._lock:
+            for record in [r for r in self._pending if r[2] == student_id]:
+                del self._pending[record]
+
+
+attendance_buffer = AttendanceBuffer()
+# Write whatever is still queued when the worker shuts down
+atexit.register(attendance_buffer.flush)
+
+
+def read_your_writes(course_ids=None):
+    """
+    Writes the queued attendance of the given courses (all when None) before
+    they are read, so a dashboard shows attendance marked moments ago.
+    """
+    if ATTENDANCE_READ_YOUR_WRITES and len(attendance_buffer):
+        attendance_buffer.flush(course_ids)
+
+
+def mark_present(course_id, student_ids, date=None):
+    """
+    Upserts a "Present" record for every student enrolled in course_id in one
+    bulk_write, counts the newly created ones in the rollups and invalidates
+    the course's cached analytics.
+    Returns the number of records that did not exist before, or None when
+    ATTENDANCE_WRITE_BEHIND queued them instead.
+    """
+    date = date or today_str()
+    parse_day(date)
+    records = [(course_id, date, student_id) for student_id in student_ids]
+    if not records:
+        return 0
+    if ATTENDANCE_WRITE_BEHIND:
+        attendance_buffer.add(records)
+        return None
+    return _upsert_present(records)
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+import numpy as np
+from . import db
+from .encoding_format import unpack_encoding, stack_encodings
+from .metrics import stage
+
+# Seconds a loaded course stays valid. Every worker process has its own copy,
+# so this bounds how long a write made through another worker goes unseen.
+CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "300"))
+
+
+class CourseEmbeddings:
+    """
+    Face encodings of every student in one course, stored as a contiguous
+    float32 matrix with parallel arrays of student ids and names.
+    """
+    def __init__(self, student_ids, names, matrix):
+        self.student_ids = student_ids
+        self.names = names
+        self.matrix = matrix
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def position(self, student_id):
+        hits = np.flatnonzero(self.student_ids == student_id)
+        return int(hits[0]) if len(hits) else None
+
+
+class EmbeddingCache:
+    """
+    Process-level index of per-course face encodings. Courses are loaded from
+    Mongo on first use and patched in place by the admin routes that change
+    a student's face, course or existence.
+    """
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._courses = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_id):
+        """Returns the CourseEmbeddings for a course, loading it if needed."""
+        with self._lock:
+            entry = self._courses.get(course_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+        entry = self._load(course_id)
+        with self._lock:
+            self._courses[course_id] = entry
+        return entry
+
+    def _load(self, course_id):
+        with stage("roster"):
+            cursor = db.users.find(
+                {"role": "student", "course_id": course_id, "face_encoding": {"$exists": True}},
+                {"name": 1, "face_encoding": 1, "face_encoding_format": 1}
+            )
+            students = list(cursor)
+            student_ids = np.array([s['_id'] for s in students], dtype=object)
+            names = [s.get('name') for s in students]
+            matrix = stack_encodings(students)
+        return CourseEmbeddings(student_ids, names, matrix)
+
+    def invalidate(self, course_id=None):
+        """Drops one course, or every course when no id is given."""
+        with self._lock:
+            if course_id is None:
+                self._courses.clear()
+            else:
+                self._courses.pop(course_id, None)
+
+    def add_student(self, course_id, student_id, name, face_encoding):
+        """Appends a newly registered student to an already loaded course."""
+        with self._lock:
+            entry = self._courses.get(course_id)
+            if entry is None:
+                return
+            row = unpack_encoding(face_encoding).reshape(1, -1)
+            self._courses[course_id] = CourseEmbeddings(
+                np.append(entry.student_ids, np.array([student_id], dtype=object)),
+                entry.names + [name],
+                np.vstack([entry.matrix, row])
+            )
+            self._courses[course_id].loaded_at = entry.loaded_at
+
+    def update_student(self, student_id, face_encoding=None, name=None):
+        """
+        Patches the encoding and/or name of a student wherever it is cached.
+        Returns False if the student is not in any loaded course.
+        """
+        found = False
+        with self._lock:
+            for entry in self._courses.values():
+                pos = entry.position(student_id)
+                if pos is None:
+                    continue
+                found = True
+                # Copy on write so a request matching against the old matrix
+                # never sees a half-updated row.
+                if face_encoding is not None:
+                    matrix = entry.matrix.copy()
+                    matrix[pos] = unpack_encoding(face_encoding)
+                    entry.matrix = matrix
+                if name is not None:
+                    names = list(entry.names)
+                    names[pos] = name
+                    entry.names = names
+        return found
+
+    def remove_student(self, student_id):
+        """Removes a student from every cached course it appears in."""
+        with self._lock:
+            for course_id, entry in list(self._courses.items()):
+                pos = entry.position(student_id)
+                if pos is None:
+                    continue
+                keep = np.ones(len(entry), dtype=bool)
+                keep[pos] = False
+                patched = CourseEmbeddings(
+                    entry.student_ids[keep],
+                    [n for i, n in enumerate(entry.names) if i != pos],
+                    entry.matrix[keep]
+                )
+                patched.loaded_at = entry.loaded_at
+                self._courses[course_id] = patched
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,57 @@
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+# Stored alongside every packed encoding so the layout can change later
+ENCODING_FORMAT = "float32-le-v1"
+ENCODING_DTYPE = np.dtype('<f4')
+ENCODING_SIZE = 128
+ENCODING_BYTES = ENCODING_SIZE * ENCODING_DTYPE.itemsize
+
+
+def pack_encoding(encoding):
+    """Packs a 128-d face encoding into a compact float32 BSON Binary."""
+    return Binary(np.asarray(encoding, dtype=ENCODING_DTYPE).tobytes(), USER_DEFINED_SUBTYPE)
+
+
+def encoding_fields(encoding):
+    """Returns the user document fields that store a face encoding."""
+    return {"face_encoding": pack_encoding(encoding), "face_encoding_format": ENCODING_FORMAT}
+
+
+def unpack_encoding(value, encoding_format=None, source="Face encoding"):
+    """
+    Decodes a stored face encoding into a float32 array. Accepts the packed
+    Binary format (decoded zero-copy) as well as legacy arrays of doubles,
+    which carry no format tag. Raises ValueError, starting with `source`, for
+    an unknown format or an encoding that is not 128-d.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if encoding_format not in (None, ENCODING_FORMAT):
+            raise ValueError(f"{source} has unknown format {encoding_format!r}")
+        if len(value) != ENCODING_BYTES:
+            raise ValueError(f"{source} has {len(value)} bytes, expected {ENCODING_BYTES}")
+        return np.frombuffer(value, dtype=ENCODING_DTYPE)
+    if encoding_format is not None:
+        raise ValueError(f"{source} is tagged {encoding_format!r} but is not packed")
+    encoding = np.asarray(value, dtype=np.float32)
+    if encoding.shape != (ENCODING_SIZE,):
+        raise ValueError(f"{source} has shape {encoding.shape}, expected ({ENCODING_SIZE},)")
+    return encoding
+
+
+def document_encoding(document):
+    """Decodes the face encoding of a user document (face_encoding and face_encoding_format)."""
+    return unpack_encoding(
+        document['face_encoding'],
+        document.get('face_encoding_format'),
+        source=f"Face encoding of user {document.get('_id')}"
+    )
+
+
+def stack_encodings(documents):
+    """Decodes the face encodings of a sequence of user documents into one (n, 128) float32 matrix."""
+    documents = list(documents)
+    matrix = np.empty((len(documents), ENCODING_SIZE), dtype=np.float32)
+    for i, document in enumerate(documents):
+        matrix[i] = document_encoding(document)
+    return matrix
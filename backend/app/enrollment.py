@@ -0,0 +1,122 @@
+import csv
+import io
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from pymongo.errors import BulkWriteError
+from . import db
+from .pool import get_process_pool, FACE_WORKERS
+from .services import get_face_encoding
+from .encoding_format import encoding_fields
+from .student_search import search_fields
+from .passwords import make_hash
+
+REQUIRED_COLUMNS = ("name", "roll_no", "course_id", "password", "image")
+INSERT_CHUNK_SIZE = 500
+# Students being prepared in the pool at once; the next image is only read
+# from the archive when one of them finishes
+PREPARE_WINDOW = FACE_WORKERS * 4
+
+
+def _prepare_student(image_bytes, password, profile=None):
+    """Runs in a pool worker: encodes the face and hashes the password."""
+    face_encoding = get_face_encoding(io.BytesIO(image_bytes), profile)
+    if face_encoding is None:
+        return None, None
+    return face_encoding, make_hash(password)
+
+
+def _prepare_all(archive, members, rows, pending, profile=None):
+    """
+    Yields (row index, face_encoding, hashed_password) for the pending rows,
+    in completion order, keeping at most PREPARE_WINDOW images in flight.
+    """
+    pool = get_process_pool()
+    queue = iter(pending)
+    in_flight = {}
+    while True:
+        for i in queue:
+            image_bytes = archive.read(members[os.path.basename(rows[i]['image'])])
+            in_flight[pool.submit(_prepare_student, image_bytes, rows[i]['password'], profile)] = i
+            if len(in_flight) >= PREPARE_WINDOW:
+                break
+        if not in_flight:
+            return
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield (in_flight.pop(future), *future.result())
+
+
+def _read_manifest(manifest_file):
+    text = io.TextIOWrapper(manifest_file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {', '.join(missing)}")
+    return [{k: (v or '').strip() for k, v in row.items() if k} for row in reader]
+
+
+def bulk_enroll(manifest_file, images_file, profile=None):
+    """
+    Registers every student listed in a CSV manifest, taking face images from
+    a ZIP archive. Returns (report, inserted) where report has one entry per
+    manifest row and inserted lists the created user documents.
+    Raises ValueError if the manifest or archive cannot be read.
+    """
+    try:
+        archive = zipfile.ZipFile(images_file)
+    except zipfile.BadZipFile:
+        raise ValueError("Images must be uploaded as a ZIP archive")
+    # Match manifest entries by file name, wherever they sit in the archive
+    members = {os.path.basename(n): n for n in archive.namelist() if not n.endswith('/')}
+    rows = _read_manifest(manifest_file)
+
+    report = [{"row": i + 2, "roll_no": row.get('roll_no'), "status": "pending"} for i, row in enumerate(rows)]
+
+    def fail(i, error):
+        report[i]["status"] = "failed"
+        report[i]["error"] = error
+
+    seen = set()
+    for i, row in enumerate(rows):
+        if not all(row.get(c) for c in REQUIRED_COLUMNS):
+            fail(i, "Missing required fields")
+        elif row['roll_no'] in seen:
+            fail(i, "Duplicate roll number in manifest")
+        elif os.path.basename(row['image']) not in members:
+            fail(i, "Image not found in archive")
+        seen.add(row.get('roll_no'))
+
+    pending = [i for i, r in enumerate(report) if r["status"] == "pending"]
+    existing = {u['roll_no'] for u in db.users.find({"roll_no": {"$in": [rows[i]['roll_no'] for i in pending]}}, {"roll_no": 1})}
+    for i in pending:
+        if rows[i]['roll_no'] in existing:
+            fail(i, "Student with this roll number already exists")
+    pending = [i for i in pending if report[i]["status"] == "pending"]
+
+    docs, doc_rows = [], []
+    for i, face_encoding, hashed_password in _prepare_all(archive, members, rows, pending, profile):
+        if face_encoding is None:
+            fail(i, "Could not detect a single face in the image.")
+            continue
+        row = rows[i]
+        docs.append({"name": row['name'], "roll_no": row['roll_no'], "password": hashed_password, "role": "student", "course_id": row['course_id'], **search_fields(row['name'], row['roll_no']), **encoding_fields(face_encoding)})
+        doc_rows.append(i)
+
+    inserted = []
+    for start in range(0, len(docs), INSERT_CHUNK_SIZE):
+        chunk = docs[start:start + INSERT_CHUNK_SIZE]
+        failed = {}
+        try:
+            db.users.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            failed = {err['index']: err.get('errmsg', 'Insert failed') for err in e.details.get('writeErrors', [])}
+        for offset, doc in enumerate(chunk):
+            i = doc_rows[start + offset]
+            if offset in failed:
+                fail(i, failed[offset])
+            else:
+                report[i]["status"] = "created"
+                inserted.append(doc)
+
+    return report, inserted
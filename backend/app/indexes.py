@@ -0,0 +1,39 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from . import db
+
+# (collection, keys, options) for every index the API relies on
+INDEXES = [
+    ("users", [("role", ASCENDING), ("course_id", ASCENDING)], {}),
+    ("users", [("roll_no", ASCENDING)], {"unique": True, "partialFilterExpression": {"roll_no": {"$type": "string"}}}),
+    ("users", [("email", ASCENDING)], {"partialFilterExpression": {"email": {"$type": "string"}}}),
+    # Student listing: _id-ordered pages and name or roll number prefix
+    # searches, each optionally per course
+    ("users", [("role", ASCENDING), ("_id", ASCENDING)], {}),
+    ("users", [("role", ASCENDING), ("course_id", ASCENDING), ("_id", ASCENDING)], {}),
+    ("users", [("role", ASCENDING), ("search_name", ASCENDING), ("_id", ASCENDING)], {}),
+    ("users", [("role", ASCENDING), ("course_id", ASCENDING), ("search_name", ASCENDING), ("_id", ASCENDING)], {}),
+    ("users", [("role", ASCENDING), ("search_roll_no", ASCENDING), ("_id", ASCENDING)], {}),
+    ("users", [("role", ASCENDING), ("course_id", ASCENDING), ("search_roll_no", ASCENDING), ("_id", ASCENDING)], {}),
+    ("attendance", [("student_id", ASCENDING), ("course_id", ASCENDING), ("date", ASCENDING)], {"unique": True}),
+    ("attendance", [("course_id", ASCENDING), ("day", ASCENDING)], {}),
+    ("attendance", [("course_id", ASCENDING), ("date", DESCENDING)], {}),
+    ("attendance", [("student_id", ASCENDING), ("status", ASCENDING), ("day", ASCENDING)], {}),
+    ("attendance_daily", [("course_id", ASCENDING), ("date", ASCENDING)], {"unique": True}),
+    ("attendance_daily", [("course_id", ASCENDING), ("day", ASCENDING)], {}),
+    ("student_monthly", [("student_id", ASCENDING), ("course_id", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+]
+
+
+def ensure_indexes():
+    """
+    Creates the indexes the API relies on. create_index is a no-op for indexes
+    that already exist, so this is safe to run on every startup. An index that
+    cannot be built (e.g. duplicate data under a unique key) is reported and
+    skipped rather than stopping the server.
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            print(f"Could not create index {keys} on {collection}: {e}")
@@ -0,0 +1,229 @@
+import datetime
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import gridfs
+from pymongo import ReturnDocument
+from . import db
+from .pool import FACE_WORKERS
+
+# "local" keeps jobs in this process; "mongo" shares them through db.jobs
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+# Jobs run at the same time in each process
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "0")) or FACE_WORKERS
+# Queued plus running jobs allowed before new submissions are refused
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "100"))
+# Megabytes of uploads held by queued plus running jobs before new submissions
+# are refused; a single upload larger than this is rejected outright
+JOB_MAX_QUEUE_MB = float(os.getenv("JOB_MAX_QUEUE_MB", "512"))
+# Seconds a finished job's result stays available
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "600"))
+# Seconds after which a running Mongo job is assumed abandoned and retried
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "300"))
+JOB_POLL_INTERVAL = 0.5
+
+_handlers = {}
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at JOB_MAX_QUEUE or JOB_MAX_QUEUE_MB."""
+
+
+class PayloadTooLarge(Exception):
+    """Raised when a job's payload alone exceeds JOB_MAX_QUEUE_MB."""
+
+
+def _check_capacity(jobs, queued_bytes, payload, max_queue, max_bytes):
+    size = len(payload) if payload is not None else 0
+    if size > max_bytes:
+        raise PayloadTooLarge()
+    if jobs >= max_queue or queued_bytes + size > max_bytes:
+        raise QueueFull()
+    return size
+
+
+def job_handler(kind):
+    """
+    Registers a function as the handler for a job kind. Handlers take
+    (params, payload) and return a (body, status_code) pair.
+    """
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _run(kind, params, payload):
+    try:
+        body, status_code = _handlers[kind](params, payload)
+        return {"status": "done", "result": body, "status_code": status_code}
+    except Exception as e:
+        print(f"Error running {kind} job: {e}")
+        return {"status": "failed", "result": {"msg": "Job failed"}, "status_code": 500}
+
+
+def _public(job):
+    view = {"job_id": job["_id"], "status": job["status"]}
+    if job["status"] in ("done", "failed"):
+        view["result"] = job.get("result")
+        view["status_code"] = job.get("status_code")
+    return view
+
+
+class LocalJobQueue:
+    """
+    Runs jobs on a thread pool inside this process. Job state and payloads
+    live in memory, so a job can only be polled from the worker process that
+    accepted it.
+    """
+    def __init__(self, concurrency=JOB_CONCURRENCY, max_queue=JOB_MAX_QUEUE, ttl=JOB_RESULT_TTL, max_queue_mb=JOB_MAX_QUEUE_MB):
+        self.max_queue = max_queue
+        self.max_bytes = int(max_queue_mb * 1024 * 1024)
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+        self._jobs = {}
+        self._active = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def depth(self):
+        return self._active
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [k for k, job in self._jobs.items() if job.get("finished_at", time.time()) < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, kind, params, payload=None, owner=None):
+        with self._lock:
+            self._prune()
+            size = _check_capacity(self._active, self._bytes, payload, self.max_queue, self.max_bytes)
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"_id": job_id, "kind": kind, "owner": owner, "status": "queued"}
+            self._active += 1
+            self._bytes += size
+        self._executor.submit(self._execute, job_id, kind, params, payload, size)
+        return job_id
+
+    def _execute(self, job_id, kind, params, payload, size):
+        self._jobs[job_id]["status"] = "running"
+        outcome = _run(kind, params, payload)
+        with self._lock:
+            self._jobs[job_id].update(outcome, finished_at=time.time())
+            self._active -= 1
+            self._bytes -= size
+
+    def get(self, job_id, owner=None):
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        return _public(job)
+
+
+class MongoJobQueue:
+    """
+    Stores jobs in db.jobs so any API worker can accept or poll them. Every
+    process runs JOB_CONCURRENCY threads that claim queued jobs atomically.
+    Payloads go to GridFS (job_payloads), since an uploaded clip can exceed
+    MongoDB's 16 MB document limit, and are deleted once the job finishes.
+    """
+    def __init__(self, concurrency=JOB_CONCURRENCY, max_queue=JOB_MAX_QUEUE, ttl=JOB_RESULT_TTL, max_queue_mb=JOB_MAX_QUEUE_MB):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_bytes = int(max_queue_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.payloads = gridfs.GridFS(db, collection="job_payloads")
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        db.jobs.create_index("finished_at", expireAfterSeconds=self.ttl)
+        db.jobs.create_index([("status", 1), ("created_at", 1)])
+        for n in range(self.concurrency):
+            threading.Thread(target=self._work, name=f"job-{n}", daemon=True).start()
+
+    def depth(self):
+        return db.jobs.count_documents({"status": {"$in": ["queued", "running"]}})
+
+    def _usage(self):
+        """Number of queued plus running jobs and the bytes of their payloads."""
+        rows = list(db.jobs.aggregate([
+            {"$match": {"status": {"$in": ["queued", "running"]}}},
+            {"$group": {"_id": None, "jobs": {"$sum": 1}, "bytes": {"$sum": "$payload_size"}}}
+        ]))
+        return (rows[0]["jobs"], rows[0]["bytes"]) if rows else (0, 0)
+
+    def submit(self, kind, params, payload=None, owner=None):
+        size = _check_capacity(*self._usage(), payload, self.max_queue, self.max_bytes)
+        job_id = uuid.uuid4().hex
+        payload_id = self.payloads.put(payload, job_id=job_id) if payload is not None else None
+        try:
+            db.jobs.insert_one({
+                "_id": job_id, "kind": kind, "owner": owner, "status": "queued",
+                "params": params, "payload_id": payload_id, "payload_size": size,
+                "created_at": datetime.datetime.utcnow()
+            })
+        except Exception:
+            if payload_id is not None:
+                self.payloads.delete(payload_id)
+            raise
+        return job_id
+
+    def _payload(self, job):
+        if job.get("payload_id") is not None:
+            return self.payloads.get(job["payload_id"]).read()
+        # Jobs queued before payloads moved to GridFS
+        return bytes(job["payload"]) if job.get("payload") is not None else None
+
+    def _claim(self):
+        now = datetime.datetime.utcnow()
+        return db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "started_at": {"$lt": now - datetime.timedelta(seconds=JOB_TIMEOUT)}}
+            ]},
+            {"$set": {"status": "running", "started_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+                if job is None:
+                    time.sleep(JOB_POLL_INTERVAL)
+                    continue
+                outcome = _run(job["kind"], job.get("params") or {}, self._payload(job))
+                outcome["finished_at"] = datetime.datetime.utcnow()
+                db.jobs.update_one({"_id": job["_id"]}, {"$set": outcome, "$unset": {"payload": "", "payload_id": ""}})
+                if job.get("payload_id") is not None:
+                    self.payloads.delete(job["payload_id"])
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                time.sleep(JOB_POLL_INTERVAL)
+
+    def get(self, job_id, owner=None):
+        job = db.jobs.find_one({"_id": job_id, "owner": owner}, {"payload": 0, "payload_id": 0, "params": 0})
+        return _public(job) if job else None
+
+
+def create_job_queue(backend=JOB_BACKEND):
+    if backend == "mongo":
+        return MongoJobQueue()
+    if backend == "local":
+        return LocalJobQueue()
+    raise ValueError(f"Unknown job backend: {backend}")
+
+
+job_queue = create_job_queue()
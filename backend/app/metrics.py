@@ -0,0 +1,246 @@
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import Response, request
+from pymongo import monitoring
+
+# Time request stages and Mongo commands, add Server-Timing headers and serve /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Bearer token required to read /metrics; served without authentication when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    """
+    Cumulative latency histogram in the Prometheus text format, with one
+    series per tuple of label values.
+    """
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        position = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += seconds
+
+    def render(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(snapshot):
+            text = _label_text(self.label_names, labels)
+            prefix = text + "," if text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = "{" + text + "}" if text else ""
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+request_seconds = Histogram(
+    "faceauth_http_request_duration_seconds", "Time to handle a request, until the response is returned to the server.",
+    ("method", "route", "status"))
+stage_seconds = Histogram(
+    "faceauth_stage_duration_seconds", "Time spent in one stage of the face, roster and attendance paths.", ("stage",))
+mongo_seconds = Histogram(
+    "faceauth_mongo_command_duration_seconds", "Round trip of one MongoDB command.", ("command", "outcome"))
+auth_queue_seconds = Histogram(
+    "faceauth_auth_queue_wait_seconds", "Time a password hash or check waited for a bcrypt thread.")
+
+
+class RequestTimings:
+    """Stage durations accumulated while one request is handled."""
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total):
+        parts = []
+        for name, (seconds, count) in self.stages.items():
+            part = f"{name};dur={seconds * 1000:.2f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# Timings of the request handled in the current thread, if any
+_current = ContextVar("faceauth_request_timings", default=None)
+
+
+def record_stage(name, seconds):
+    stage_seconds.observe((name,), seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """
+    Context manager timing one stage of the work. The duration goes to the
+    stage histogram and, inside a request, to its Server-Timing header.
+    Stages run in the process pool are recorded in the pool worker and never
+    reach /metrics.
+    """
+    return _Stage(name) if METRICS_ENABLED else _NO_STAGE
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Feeds every MongoDB command's round trip into the metrics."""
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "error")
+
+    def _record(self, event, outcome):
+        # Listeners run in the thread that issued the command
+        seconds = event.duration_micros / 1e6
+        mongo_seconds.observe((event.command_name, outcome), seconds)
+        timings = _current.get()
+        if timings is not None:
+            timings.add("mongo", seconds)
+
+
+def mongo_listeners():
+    """Event listeners for the MongoClient."""
+    return [MongoCommandTimer()] if METRICS_ENABLED else []
+
+
+def _gauges():
+    from .attendance import attendance_buffer
+    from .jobs import job_queue
+    from .passwords import password_executor
+    from .response_cache import analytics_cache
+    values = [
+        ("faceauth_auth_pending", "gauge", "Password operations waiting or running.", password_executor.queue_time_stats()["pending"]),
+        ("faceauth_auth_completed_total", "counter", "Password operations completed.", password_executor.completed),
+        ("faceauth_analytics_cache_hits_total", "counter", "Analytics responses served from the cache.", analytics_cache.hits),
+        ("faceauth_analytics_cache_misses_total", "counter", "Analytics responses rendered.", analytics_cache.misses),
+        ("faceauth_attendance_queued", "gauge", "Attendance records waiting for a write-behind flush.", len(attendance_buffer)),
+        ("faceauth_attendance_flushed_total", "counter", "Attendance records written by write-behind flushes.", attendance_buffer.flushed),
+    ]
+    try:
+        values.append(("faceauth_job_queue_depth", "gauge", "Jobs queued or running.", job_queue.depth()))
+    except Exception as e:
+        print(f"Error reading job queue depth: {e}")
+    lines = []
+    for name, kind, help_text, value in values:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return lines
+
+
+def render_metrics():
+    """Every metric of this worker process in the Prometheus text format."""
+    lines = []
+    for histogram in (request_seconds, stage_seconds, mongo_seconds, auth_queue_seconds):
+        lines += histogram.render()
+    lines += _gauges()
+    return "\n".join(lines) + "\n"
+
+
+def _start_request():
+    _current.set(RequestTimings())
+
+
+def _finish_request(response):
+    timings = _current.get()
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe((request.method, route, str(response.status_code)), total)
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    return response
+
+
+def _end_request(exc=None):
+    _current.set(None)
+
+
+def metrics_view():
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render_metrics(), mimetype=PROMETHEUS_MIMETYPE)
+
+
+def init_app(app):
+    """Times every request of `app` and serves /metrics. Does nothing when METRICS_ENABLED is off."""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
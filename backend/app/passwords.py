@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from .metrics import auth_queue_seconds
+
+# bcrypt work factor for new and re-hashed passwords
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads hashing or checking passwords at once in each process. bcrypt
+# releases the GIL, so this is the number of cores auth can occupy.
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // 4)
+# Password operations waiting or running before new ones are refused
+AUTH_MAX_QUEUE = int(os.getenv("AUTH_MAX_QUEUE", "64"))
+
+
+class AuthBusy(Exception):
+    """Raised when a password operation is submitted while AUTH_MAX_QUEUE are pending."""
+
+
+def _as_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else bytes(value)
+
+
+def make_hash(password, rounds=BCRYPT_ROUNDS):
+    """Hashes a password in the calling thread. Use hash_password from request handlers."""
+    return bcrypt.hashpw(_as_bytes(password), bcrypt.gensalt(rounds))
+
+
+def hash_cost(hashed):
+    """Returns the work factor of a "$2b$12$..." hash, or None if it cannot be read."""
+    try:
+        return int(_as_bytes(hashed).split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _check_and_upgrade(password, hashed):
+    if not bcrypt.checkpw(_as_bytes(password), _as_bytes(hashed)):
+        return False, None
+    if hash_cost(hashed) != BCRYPT_ROUNDS:
+        return True, make_hash(password)
+    return True, None
+
+
+class PasswordExecutor:
+    """
+    Bounded thread pool for bcrypt. Keeps login spikes from taking every core
+    away from face matching, and records how long operations wait for a slot.
+    """
+    def __init__(self, workers=AUTH_WORKERS, max_queue=AUTH_MAX_QUEUE, samples=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue_times = deque(maxlen=samples)
+        self.completed = 0
+
+    def _timed(self, fn, submitted, args):
+        waited = time.monotonic() - submitted
+        self._queue_times.append(waited)
+        auth_queue_seconds.observe((), waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def run(self, fn, *args):
+        """Runs fn(*args) on the pool and waits for it. Raises AuthBusy when full."""
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise AuthBusy()
+            self._pending += 1
+        return self._executor.submit(self._timed, fn, time.monotonic(), args).result()
+
+    def queue_time_stats(self):
+        """Queue time, in seconds, of the most recent operations."""
+        samples = sorted(self._queue_times)
+        if not samples:
+            return {"count": 0, "pending": self._pending, "mean": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": len(samples),
+            "pending": self._pending,
+            "mean": sum(samples) / len(samples),
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            "max": samples[-1],
+        }
+
+
+password_executor = PasswordExecutor()
+
+
+def hash_password(password):
+    """Hashes a password with BCRYPT_ROUNDS on the bounded pool."""
+    return password_executor.run(make_hash, password)
+
+
+def check_password(password, hashed):
+    """
+    Verifies a password on the bounded pool. Returns (ok, new_hash) where
+    new_hash is set when the stored hash used a different work factor and
+    should be replaced.
+    """
+    return password_executor.run(_check_and_upgrade, password, hashed)
@@ -0,0 +1,23 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes for CPU-bound face and password work; 0 uses every core
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Returns the shared process pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=FACE_WORKERS)
+        return _pool
+
+
+def run_in_pool(fn, *args):
+    """Runs fn(*args) in the shared process pool and waits for the result."""
+    return get_process_pool().submit(fn, *args).result()
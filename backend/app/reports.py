@@ -0,0 +1,94 @@
+import csv
+import io
+import tempfile
+from collections import defaultdict
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from . import db
+from .analytics import period_filter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def fetch_course_attendance(course_ids, month_str):
+    """
+    Loads a month of attendance for several courses in one grouped query.
+    Returns (dates, present) where dates maps each course to its sorted session
+    dates and present maps (course_id, student_id) to the set of present dates.
+    """
+    pipeline = [
+        {"$match": {"course_id": {"$in": list(course_ids)}, **period_filter(month_str)}},
+        {"$group": {
+            "_id": {"course_id": "$course_id", "student_id": "$student_id"},
+            "dates": {"$addToSet": "$date"},
+            "present": {"$addToSet": {"$cond": [{"$eq": ["$status", "Present"]}, "$date", None]}},
+        }},
+    ]
+    dates = defaultdict(set)
+    present = {}
+    for group in db.attendance.aggregate(pipeline, allowDiskUse=True):
+        course_id, student_id = group["_id"]["course_id"], group["_id"]["student_id"]
+        dates[course_id].update(group["dates"])
+        present[(course_id, student_id)] = {d for d in group["present"] if d is not None}
+    return {course_id: sorted(d) for course_id, d in dates.items()}, present
+
+
+def report_rows(course_id, students, dates, present):
+    """Yields the header row, then one P/A row per student."""
+    yield ["Roll No", "Student Name"] + dates
+    for student in students:
+        present_dates = present.get((course_id, student['_id']), ())
+        row = [student.get('roll_no', 'N/A'), student.get('name', 'N/A')]
+        row.extend("P" if date in present_dates else "A" for date in dates)
+        yield row
+
+
+def build_xlsx(sheets):
+    """
+    Writes (title, rows) sheets with openpyxl's write-only mode into a
+    temporary file, so rows are never all held in memory. Returns the file
+    positioned at the start; it is deleted once closed.
+    """
+    wb = Workbook(write_only=True)
+    for title, rows in sheets:
+        ws = wb.create_sheet(title=title)
+        rows = iter(rows)
+        header = []
+        for value in next(rows):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center')
+            header.append(cell)
+        ws.append(header)
+        for row in rows:
+            ws.append(row)
+    out = tempfile.TemporaryFile()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def stream_csv(sheets):
+    """
+    Yields CSV text in chunks of about CSV_CHUNK_SIZE. When there is more than
+    one sheet, each one starts with a row holding its title, and sheets are
+    separated by a blank row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    sheets = list(sheets)
+    for n, (title, rows) in enumerate(sheets):
+        if len(sheets) > 1:
+            if n:
+                writer.writerow([])
+            writer.writerow([title])
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CSV_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
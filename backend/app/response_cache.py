@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request, make_response
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+# Seconds a cached analytics response stays valid. Data versions are kept per
+# worker process, so this also bounds how long attendance marked through
+# another worker goes unseen.
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+# Seconds a cached whole-school response stays valid. Attendance marks do not
+# invalidate these, as every mark would, so this bounds how long they go unseen.
+ANALYTICS_SCHOOL_CACHE_TTL = float(os.getenv("ANALYTICS_SCHOOL_CACHE_TTL", "10"))
+# Maximum number of cached responses per worker; least recently used go first
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "1024"))
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of rendered analytics responses. Keys embed the data
+    version of every course a response depends on, so bumping a course makes
+    its old entries unreachable; they age out through the LRU or the TTL.
+    Whole-school responses are keyed on a school version that attendance
+    marks leave alone, and expire after the shorter school TTL instead.
+    """
+    def __init__(self, max_entries=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._school_version = 0
+        self._lock = threading.Lock()
+
+    def versions(self, course_ids=None):
+        """
+        Returns the version part of a cache key: the version of each given
+        course, or the school version when the response covers every course.
+        """
+        with self._lock:
+            if course_ids is None:
+                return ("*", self._school_version)
+            return tuple((c, self._versions.get(c, 0)) for c in sorted(set(course_ids), key=str))
+
+    def bump(self, *course_ids, school=True):
+        """
+        Marks the analytics of the given courses as changed, and those of the
+        whole school unless `school` is False (attendance marks).
+        """
+        with self._lock:
+            if school:
+                self._school_version += 1
+            for course_id in course_ids:
+                self._versions[course_id] = self._versions.get(course_id, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            expires = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+analytics_cache = ResponseCache()
+
+
+def _conditional(body, mimetype, etag):
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # Browsers may keep the body but must revalidate it with If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def cached_analytics(courses, per_user=False):
+    """
+    Caches successful GET responses of an analytics route and answers
+    If-None-Match with 304. `courses` receives the route's view arguments and
+    returns the course ids the response depends on, or None for all courses.
+    Use per_user for responses that depend on who is asking. Queued
+    attendance of those courses is written first (read_your_writes).
+    Apply below the auth decorator.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from .attendance import attendance_buffer, read_your_writes
+            course_ids = courses(**kwargs)
+            if len(attendance_buffer):
+                read_your_writes(course_ids)
+            if analytics_cache.max_entries <= 0:
+                return fn(*args, **kwargs)
+            key = (
+                request.path,
+                tuple(sorted(request.args.items(multi=True))),
+                get_jwt().get("role"),
+                get_jwt_identity() if per_user else None,
+                analytics_cache.versions(course_ids),
+            )
+            cached = analytics_cache.get(key)
+            if cached is not None:
+                return _conditional(*cached)
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response.add_etag()
+            cached = (response.get_data(), response.mimetype, response.get_etag()[0])
+            analytics_cache.put(key, cached, ANALYTICS_SCHOOL_CACHE_TTL if course_ids is None else None)
+            return _conditional(*cached)
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+import datetime
+from collections import Counter, defaultdict
+from pymongo import UpdateOne
+from . import db
+
+# Per-course, per-date counters. `records` counts every attendance record of
+# the course on that date (its session calendar); `present` only counts
+# records of students currently enrolled in the course.
+DAILY = "attendance_daily"
+# Per-student, per-course, per-month present counts.
+MONTHLY = "student_monthly"
+# Student field listing the courses a student has left. Their attendance in
+# those courses is outside the rollups but still counts towards the admin
+# overall figure.
+FORMER_COURSES = "former_course_ids"
+
+
+def _day(date):
+    try:
+        return datetime.datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _daily_update(course_id, date, records=0, present=0):
+    return UpdateOne(
+        {"course_id": course_id, "date": date},
+        {"$inc": {"records": records, "present": present}, "$setOnInsert": {"day": _day(date)}},
+        upsert=True
+    )
+
+
+def _monthly_update(student_id, course_id, month, present):
+    return UpdateOne(
+        {"student_id": student_id, "course_id": course_id, "month": month},
+        {"$inc": {"present": present}},
+        upsert=True
+    )
+
+
+def record_new_attendance(course_id, date, student_ids):
+    """Counts freshly inserted Present records of students enrolled in course_id."""
+    if not student_ids:
+        return
+    db[DAILY].bulk_write([_daily_update(course_id, date, len(student_ids), len(student_ids))])
+    db[MONTHLY].bulk_write(
+        [_monthly_update(student_id, course_id, date[:7], 1) for student_id in student_ids],
+        ordered=False
+    )
+
+
+def _student_records(student_id):
+    cursor = db.attendance.find({"student_id": student_id}, {"course_id": 1, "date": 1, "status": 1})
+    return [r for r in cursor if isinstance(r.get('date'), str)]
+
+
+def _drop_empty_days(course_ids):
+    db[DAILY].delete_many({"course_id": {"$in": list(course_ids)}, "records": {"$lte": 0}})
+
+
+def remove_student(student_id, current_course_id):
+    """
+    Subtracts a student's attendance before it is deleted. Call this before
+    removing the attendance records themselves. Returns the affected courses.
+    """
+    operations = []
+    courses = set()
+    for record in _student_records(student_id):
+        course_id, date = record.get('course_id'), record['date']
+        counted = course_id == current_course_id and record.get('status') == "Present"
+        operations.append(_daily_update(course_id, date, -1, -1 if counted else 0))
+        courses.add(course_id)
+    if operations:
+        db[DAILY].bulk_write(operations, ordered=False)
+        _drop_empty_days(courses)
+    db[MONTHLY].delete_many({"student_id": student_id})
+    return courses
+
+
+def move_student(student_id, old_course_id, new_course_id):
+    """Moves a student's present counts when they change course."""
+    if old_course_id == new_course_id:
+        return
+    db.users.update_one({"_id": student_id}, {"$addToSet": {FORMER_COURSES: old_course_id}})
+    operations, months = [], Counter()
+    for record in _student_records(student_id):
+        if record.get('status') != "Present":
+            continue
+        course_id, date = record.get('course_id'), record['date']
+        if course_id == old_course_id:
+            operations.append(_daily_update(course_id, date, present=-1))
+        elif course_id == new_course_id:
+            operations.append(_daily_update(course_id, date, present=1))
+            months[date[:7]] += 1
+    if operations:
+        db[DAILY].bulk_write(operations, ordered=False)
+    db[MONTHLY].delete_many({"student_id": student_id, "course_id": old_course_id})
+    if months:
+        db[MONTHLY].bulk_write(
+            [_monthly_update(student_id, new_course_id, month, count) for month, count in months.items()],
+            ordered=False
+        )
+
+
+def compute_rollups():
+    """
+    Recomputes both rollups from the raw attendance collection. Also returns
+    the courses other than their own that each student has attendance in.
+    """
+    current_course = {u['_id']: u.get('course_id') for u in db.users.find({"role": "student"}, {"course_id": 1})}
+    records, present, monthly = Counter(), Counter(), Counter()
+    former = defaultdict(set)
+    cursor = db.attendance.find({}, {"student_id": 1, "course_id": 1, "date": 1, "status": 1})
+    for record in cursor.batch_size(10000):
+        key = (record.get('course_id'), record.get('date'))
+        if not isinstance(key[1], str):
+            continue
+        records[key] += 1
+        student_id = record.get('student_id')
+        if student_id not in current_course:
+            continue
+        if current_course[student_id] != key[0]:
+            former[student_id].add(key[0])
+        elif record.get('status') == "Present":
+            present[key] += 1
+            monthly[(student_id, key[0], key[1][:7])] += 1
+    daily_docs = [
+        {"course_id": course_id, "date": date, "day": _day(date), "records": count, "present": present[(course_id, date)]}
+        for (course_id, date), count in records.items()
+    ]
+    monthly_docs = [
+        {"student_id": student_id, "course_id": course_id, "month": month, "present": count}
+        for (student_id, course_id, month), count in monthly.items()
+    ]
+    return daily_docs, monthly_docs, former
+
+
+def rebuild(chunk_size=10000):
+    """
+    Rebuilds both rollups into scratch collections and swaps them in with a
+    rename, so readers never see a half-built rollup.
+    """
+    daily_docs, monthly_docs, former = compute_rollups()
+    for name, docs, keys in (
+        (DAILY, daily_docs, [("course_id", 1), ("date", 1)]),
+        (MONTHLY, monthly_docs, [("student_id", 1), ("course_id", 1), ("month", 1)]),
+    ):
+        scratch = db[f"{name}_rebuild"]
+        scratch.drop()
+        for start in range(0, len(docs), chunk_size):
+            scratch.insert_many(docs[start:start + chunk_size])
+        scratch.create_index(keys, unique=True)
+        if docs:
+            scratch.rename(name, dropTarget=True)
+        else:
+            db[name].delete_many({})
+    # Also covers course changes made before they were tracked
+    for student_id, course_ids in former.items():
+        db.users.update_one({"_id": student_id}, {"$addToSet": {FORMER_COURSES: {"$each": sorted(course_ids, key=str)}}})
+    return len(daily_docs), len(monthly_docs)
+
+
+def verify():
+    """
+    Compares the stored rollups with a fresh recomputation. Returns a list of
+    (collection, key, stored, expected) mismatches.
+    """
+    daily_docs, monthly_docs, _ = compute_rollups()
+    mismatches = []
+    expected = {(d["course_id"], d["date"]): (d["records"], d["present"]) for d in daily_docs}
+    stored = {(d["course_id"], d["date"]): (d.get("records", 0), d.get("present", 0)) for d in db[DAILY].find({"records": {"$gt": 0}})}
+    for key in expected.keys() | stored.keys():
+        if expected.get(key) != stored.get(key):
+            mismatches.append((DAILY, key, stored.get(key), expected.get(key)))
+    expected = {(d["student_id"], d["course_id"], d["month"]): d["present"] for d in monthly_docs}
+    stored = {(d["student_id"], d["course_id"], d["month"]): d.get("present", 0) for d in db[MONTHLY].find({"present": {"$gt": 0}})}
+    for key in expected.keys() | stored.keys():
+        if expected.get(key) != stored.get(key):
+            mismatches.append((MONTHLY, key, stored.get(key), expected.get(key)))
+    return mismatches
@@ -1,27 +1,61 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for
 from . import db
-from .services import get_face_encoding, match_face
+from .services import get_face_encoding, encode_faces, match_encodings, best_match, resolve_duplicate_matches, get_profile, MATCH_TOLERANCE, MATCH_MARGIN, GROUP_DETECTION_MAX_SIDE, ENROLL_PROFILE, MATCH_PROFILE
+from .attendance import mark_present, attendance_buffer, read_your_writes
+from .embedding_cache import embedding_cache
+from .encoding_format import encoding_fields
+from .student_search import search_fields, search_target
+from .ann_index import school_index
+from .enrollment import bulk_enroll
+from .analytics import admin_analytics, teacher_course_analytics, prefix_range
+from .timeline import student_timeline, session_calendars
+from . import rollups
+from .jobs import job_queue, job_handler, QueueFull, PayloadTooLarge
+from .pool import run_in_pool
+from .video import encode_video, dedupe_faces, video_supported
+from .sessions import live_sessions, TooManySessions
+from .passwords import hash_password, check_password, AuthBusy, password_executor
+from .response_cache import analytics_cache, cached_analytics
+from .reports import fetch_course_attendance, report_rows, build_xlsx, stream_csv, XLSX_MIMETYPE
 from .utils import role_required
+from .metrics import stage
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-import bcrypt
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import datetime
 from collections import defaultdict
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
+import base64
+import json
+import os
+import shutil
+import tempfile
 from io import BytesIO
-from flask import send_file
+from flask import send_file, Response, stream_with_context
 
 api_bp = Blueprint('api', __name__)
 
+def _profile_param(default):
+    """Name of the recognition profile requested with a `profile` field. Raises ValueError if unknown."""
+    return get_profile(request.values.get('profile'), default).name
+
 # --- AUTH ROUTES ---
 @api_bp.route('/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     identifier = data.get('identifier')
     password = data.get('password')
-    user = db.users.find_one({"$or": [{"email": identifier}, {"roll_no": identifier}]})
-    if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+    user = db.users.find_one({"$or": [{"email": identifier}, {"roll_no": identifier}]}, {"password": 1, "role": 1, "name": 1})
+    try:
+        with stage("password"):
+            valid, upgraded_hash = check_password(password, user['password']) if user else (False, None)
+    except AuthBusy:
+        response = jsonify(msg="Server is busy, please try again shortly.")
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    if valid:
+        if upgraded_hash:
+            # Re-hash with the current BCRYPT_ROUNDS unless the password changed meanwhile
+            db.users.update_one({"_id": user['_id'], "password": user['password']}, {"$set": {"password": upgraded_hash}})
         user_id = str(user['_id'])
         role = user['role']
         additional_claims = {"role": role}
@@ -40,26 +74,103 @@ def register_student():
     password = request.form.get('password')
     if 'face_image' not in request.files: return jsonify(msg="No face image provided"), 400
     face_image = request.files['face_image']
+    try:
+        profile = _profile_param(ENROLL_PROFILE)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
     if db.users.find_one({"roll_no": roll_no}): return jsonify(msg="Student with this roll number already exists"), 409
-    face_encoding = get_face_encoding(face_image)
+    face_encoding = get_face_encoding(face_image, profile)
     if face_encoding is None: return jsonify(msg="Could not detect a single face in the image."), 400
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    user_doc = {"name": name, "roll_no": roll_no, "password": hashed_password, "role": "student", "course_id": course_id, "face_encoding": face_encoding}
-    db.users.insert_one(user_doc)
+    try:
+        hashed_password = hash_password(password)
+    except AuthBusy:
+        return jsonify(msg="Server is busy, please try again shortly."), 503
+    user_doc = {"name": name, "roll_no": roll_no, "password": hashed_password, "role": "student", "course_id": course_id, **search_fields(name, roll_no), **encoding_fields(face_encoding)}
+    try:
+        result = db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Registered concurrently since the check above
+        return jsonify(msg="Student with this roll number already exists"), 409
+    embedding_cache.add_student(course_id, result.inserted_id, name, face_encoding)
+    school_index.add_student(result.inserted_id, face_encoding)
+    analytics_cache.bump(course_id)
     return jsonify(msg="Student registered successfully"), 201
 
+@api_bp.route('/admin/bulk-register-students', methods=['POST'])
+@role_required('admin')
+def bulk_register_students():
+    if 'manifest' not in request.files: return jsonify(msg="No CSV manifest provided"), 400
+    if 'images' not in request.files: return jsonify(msg="No images archive provided"), 400
+    try:
+        profile = _profile_param(ENROLL_PROFILE)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    if request.form.get('async', 'false').lower() in ('1', 'true'):
+        try:
+            manifest = request.files['manifest'].read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return jsonify(msg="Manifest must be UTF-8 encoded"), 400
+        params = {"manifest": manifest, "profile": profile}
+        return _enqueue_job("bulk_register_students", params, request.files['images'].read())
+    body, status = _bulk_register(request.files['manifest'].stream, request.files['images'].stream, profile)
+    return jsonify(body), status
+
+def _bulk_register(manifest_stream, images_stream, profile=None):
+    """
+    Enrolls a manifest and image archive. Shared by the synchronous route and
+    the job queue, so it returns a (body, status_code) pair.
+    """
+    try:
+        report, inserted = bulk_enroll(manifest_stream, images_stream, profile)
+    except ValueError as e:
+        return {"msg": str(e)}, 400
+
+    enrolled_courses = {doc['course_id'] for doc in inserted}
+    for course_id in enrolled_courses:
+        embedding_cache.invalidate(course_id)
+    if enrolled_courses:
+        analytics_cache.bump(*enrolled_courses)
+    for doc in inserted:
+        school_index.add_student(doc['_id'], doc['face_encoding'])
+
+    failed = sum(1 for r in report if r["status"] != "created")
+    return {
+        "msg": f"Registered {len(inserted)} students, {failed} failed",
+        "created": len(inserted),
+        "failed": failed,
+        "results": report
+    }, 201 if inserted else 400
+
+@job_handler("bulk_register_students")
+def _run_bulk_register_job(params, payload):
+    return _bulk_register(BytesIO(params["manifest"].encode('utf-8')), BytesIO(payload), params.get("profile"))
+
+@api_bp.route('/admin/auth-stats', methods=['GET'])
+@role_required('admin')
+def get_auth_stats():
+    """Queue time of recent password hashing and verification in this worker."""
+    return jsonify(password_executor.queue_time_stats())
+
+def _selected_courses():
+    course_ids_str = request.args.get('courses')
+    return course_ids_str.split(',') if course_ids_str else None
+
+def _student_course(student_id):
+    """Returns the course a student's analytics depend on, for the analytics cache key."""
+    try:
+        student = db.users.find_one({"_id": ObjectId(student_id)}, {"course_id": 1})
+    except Exception:
+        return []
+    return [student.get('course_id')] if student else []
+
 @api_bp.route('/admin/analytics', methods=['GET'])
 @role_required('admin')
+@cached_analytics(_selected_courses)
 def get_admin_analytics():
-    course_ids_str = request.args.get('courses')
-    selected_course_ids = course_ids_str.split(',') if course_ids_str else []
+    selected_course_ids = _selected_courses() or []
     
-    # --- SETUP FILTERS ---
-    student_filter = {"role": "student"}
     course_filter = {}
-    
     if selected_course_ids:
-        student_filter["course_id"] = {"$in": selected_course_ids}
         # Handle querying courses by _id, which is likely an ObjectId
         try:
             object_ids = [ObjectId(cid) for cid in selected_course_ids]
@@ -68,62 +179,7 @@ def get_admin_analytics():
             # Fallback for non-ObjectId strings (e.g., 'CS101')
             course_filter["_id"] = {"$in": selected_course_ids}
             
-    # --- OVERALL ANALYTICS (Corrected) ---
-    
-    # 1. Get the list of *currently existing* student IDs. This is the source of truth.
-    current_students_cursor = db.users.find(student_filter, {"_id": 1})
-    current_student_ids = [s['_id'] for s in current_students_cursor]
-    total_students = len(current_student_ids)
-
-    if total_students == 0:
-        return jsonify({"totalStudents": 0, "overallAttendancePercentage": 0, "courseAnalytics": []})
-
-    # 2. Build attendance filter based ONLY on these existing students.
-    attendance_filter = {"student_id": {"$in": current_student_ids}}
-    if selected_course_ids:
-        attendance_filter["course_id"] = {"$in": selected_course_ids}
-        
-    # 3. Perform calculations using the consistent student list.
-    total_attendance_records = db.attendance.count_documents(attendance_filter)
-    distinct_dates = db.attendance.distinct("date", attendance_filter)
-    total_possible_attendance = total_students * len(distinct_dates)
-    overall_percentage = (total_attendance_records / total_possible_attendance) * 100 if total_possible_attendance > 0 else 0
-
-    # --- COURSE-BY-COURSE ANALYTICS (Corrected) ---
-    courses_to_analyze = list(db.courses.find(course_filter if selected_course_ids else {}))
-    
-    course_analytics = []
-    for course in courses_to_analyze:
-        course_id_str = str(course['_id'])
-        
-        # Get current students for THIS specific course.
-        students_in_course_cursor = db.users.find({"role": "student", "course_id": course_id_str}, {"_id": 1})
-        student_ids_in_course = [s['_id'] for s in students_in_course_cursor]
-        students_in_course_count = len(student_ids_in_course)
-
-        if students_in_course_count == 0:
-            course_analytics.append({"name": course['name'], "attendance": 0})
-            continue
-
-        # Filter attendance by THIS course's current students.
-        course_attendance_filter = {
-            "course_id": course_id_str,
-            "student_id": {"$in": student_ids_in_course}
-        }
-        
-        attendance_in_course = db.attendance.count_documents(course_attendance_filter)
-        distinct_dates_in_course = db.attendance.distinct("date", course_attendance_filter)
-        
-        possible_in_course = students_in_course_count * len(distinct_dates_in_course)
-        course_percentage = (attendance_in_course / possible_in_course) * 100 if possible_in_course > 0 else 0
-        
-        course_analytics.append({"name": course['name'], "attendance": round(course_percentage, 2)})
-
-    return jsonify({
-        "totalStudents": total_students, 
-        "overallAttendancePercentage": round(overall_percentage, 2), 
-        "courseAnalytics": course_analytics
-    })
+    return jsonify(admin_analytics(selected_course_ids, course_filter))
 
 
 # --- TEACHER ROUTES ---
@@ -131,84 +187,253 @@ def get_admin_analytics():
 @role_required('teacher')
 def mark_attendance():
     course_id = request.form.get('course_id')
+    mode = request.form.get('mode', 'single')
     if 'live_image' not in request.files: return jsonify(msg="No image captured"), 400
     live_image = request.files['live_image']
-    students = list(db.users.find({"role": "student", "course_id": course_id, "face_encoding": {"$exists": True}}))
-    if not students: return jsonify(msg="No students with face data for this course"), 404
-    known_encodings = [s['face_encoding'] for s in students]
-    match_index = match_face(known_encodings, live_image.stream)
-    if match_index is not None:
-        matched_student = students[match_index]
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        db.attendance.update_one(
-            {"student_id": matched_student['_id'], "course_id": course_id, "date": today}, 
-            {"$set": {"status": "Present"}}, 
-            upsert=True
-        )
-        return jsonify(msg=f"Attendance marked for {matched_student['name']}"), 200
+    try:
+        profile = _profile_param(MATCH_PROFILE)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    if request.form.get('async', 'false').lower() in ('1', 'true'):
+        params = {"course_id": course_id, "mode": mode, "profile": profile}
+        return _enqueue_job("mark_attendance", params, live_image.read())
+    body, status = _mark_attendance(course_id, mode, live_image.stream, profile=profile)
+    return jsonify(body), status
+
+def _mark_attendance(course_id, mode, image_stream, encoder=encode_faces, profile=None):
+    """
+    Marks attendance from one captured image. Shared by the synchronous route
+    and the job queue, so it returns a (body, status_code) pair.
+    """
+    roster = embedding_cache.get(course_id)
+    if not len(roster): return {"msg": "No students with face data for this course"}, 404
+    if mode == 'group':
+        return _mark_group_attendance(course_id, roster, image_stream, encoder, profile)
+    encoded = encoder(image_stream, None, profile)
+    if encoded is None: return {"msg": "Could not read the captured image."}, 400
+    if not encoded[1]: return {"msg": "No faces found in the image."}, 404
+    match = best_match(roster.matrix, encoded[1])
+    if match is not None:
+        match_index = match["index"]
+        mark_present(course_id, [roster.student_ids[match_index]])
+        return {"msg": f"Attendance marked for {roster.names[match_index]}", "distance": round(match["distance"], 4)}, 200
     else:
+        return {"msg": "No match found."}, 404
+
+def _mark_faces(course_id, roster, faces, encodings):
+    """
+    Matches several faces against the roster at once and marks the matched
+    students present in one batch. `faces` holds the dict reported for each
+    encoding; the distance and any identified student are added to it.
+    Returns the (matched, unmatched, ambiguous) faces.
+    """
+    results = resolve_duplicate_matches(match_encodings(roster.matrix, encodings))
+    matched, unmatched, ambiguous = [], [], []
+    present_ids = []
+    for face, result in zip(faces, results):
+        face["distance"] = None if result["distance"] is None else round(result["distance"], 4)
+        if result["status"] == "unmatched":
+            unmatched.append(face)
+            continue
+        face["student_id"] = str(roster.student_ids[result["index"]])
+        face["name"] = roster.names[result["index"]]
+        if result["status"] == "matched":
+            matched.append(face)
+            present_ids.append(roster.student_ids[result["index"]])
+        else:
+            ambiguous.append(face)
+
+    mark_present(course_id, present_ids)
+    return matched, unmatched, ambiguous
+
+def _mark_group_attendance(course_id, roster, image_stream, encoder, profile=None):
+    encoded = encoder(image_stream, GROUP_DETECTION_MAX_SIDE, profile)
+    if encoded is None: return {"msg": "Could not read the captured image."}, 400
+    face_locations, face_encodings = encoded
+    if not face_encodings: return {"msg": "No faces found in the image."}, 404
+
+    faces = [{"box": list(location)} for location in face_locations]
+    matched, unmatched, ambiguous = _mark_faces(course_id, roster, faces, face_encodings)
+    return {
+        "msg": f"Attendance marked for {len(matched)} of {len(face_encodings)} detected faces",
+        "matched": matched,
+        "unmatched": unmatched,
+        "ambiguous": ambiguous
+    }, 200 if matched else 404
+
+@api_bp.route('/teacher/mark-attendance-video', methods=['POST'])
+@role_required('teacher')
+def mark_attendance_video():
+    course_id = request.form.get('course_id')
+    if 'video' not in request.files: return jsonify(msg="No video provided"), 400
+    if not video_supported(): return jsonify(msg="Video attendance is not available on this server"), 501
+    video = request.files['video']
+    try:
+        profile = _profile_param(MATCH_PROFILE)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    suffix = os.path.splitext(video.filename or '')[1]
+    if request.form.get('async', 'false').lower() in ('1', 'true'):
+        params = {"course_id": course_id, "suffix": suffix, "profile": profile}
+        return _enqueue_job("mark_attendance_video", params, video.read())
+    body, status = _mark_video_attendance(course_id, video.stream, suffix, profile)
+    return jsonify(body), status
+
+def _mark_video_attendance(course_id, video_stream, suffix='', profile=None):
+    """
+    Marks attendance from a short clip: faces are sampled across frames,
+    deduplicated by encoding and matched against the roster once.
+    """
+    roster = embedding_cache.get(course_id)
+    if not len(roster): return {"msg": "No students with face data for this course"}, 404
+    # OpenCV reads from a path, and pool workers open the file themselves
+    with tempfile.NamedTemporaryFile(suffix=suffix) as clip:
+        shutil.copyfileobj(video_stream, clip)
+        clip.flush()
+        encoded = encode_video(clip.name, profile=profile)
+    if encoded is None: return {"msg": "Could not read the video."}, 400
+    analysed_frames, sightings = encoded
+    people = dedupe_faces(sightings)
+    if not people: return {"msg": "No faces found in the video.", "frames": analysed_frames}, 404
+
+    faces = [{"frame": p["frame"], "box": p["box"], "frames": p["frames"]} for p in people]
+    matched, unmatched, ambiguous = _mark_faces(course_id, roster, faces, [p["encoding"] for p in people])
+    return {
+        "msg": f"Attendance marked for {len(matched)} of {len(people)} people seen in {analysed_frames} frames",
+        "frames": analysed_frames,
+        "matched": matched,
+        "unmatched": unmatched,
+        "ambiguous": ambiguous
+    }, 200 if matched else 404
+
+@job_handler("mark_attendance_video")
+def _run_mark_attendance_video_job(params, payload):
+    return _mark_video_attendance(params["course_id"], BytesIO(payload), params.get("suffix", ''), params.get("profile"))
+
+@api_bp.route('/teacher/sessions', methods=['POST'])
+@role_required('teacher')
+def open_live_session():
+    course_id = (request.get_json(silent=True) or {}).get('course_id') or request.form.get('course_id')
+    if not course_id: return jsonify(msg="course_id is required"), 400
+    try:
+        profile = get_profile((request.get_json(silent=True) or {}).get('profile') or request.values.get('profile'))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    if not live_sessions.enabled:
+        return jsonify(msg="Live sessions need the server to run a single worker process."), 501
+    try:
+        session = live_sessions.open(course_id, get_jwt_identity(), profile)
+    except TooManySessions:
+        response = jsonify(msg="Server is busy, please try again shortly.")
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    if session is None: return jsonify(msg="No students with face data for this course"), 404
+    return jsonify(session.summary()), 201
+
+@api_bp.route('/teacher/sessions/<session_id>/frames', methods=['POST'])
+@role_required('teacher')
+def post_live_session_frame(session_id):
+    session = live_sessions.get(session_id, owner=get_jwt_identity())
+    if session is None: return jsonify(msg="Session not found"), 404
+    if 'frame' not in request.files: return jsonify(msg="No frame provided"), 400
+    result = session.process_frame(request.files['frame'].stream)
+    if result is None: return jsonify(msg="Could not read the captured frame."), 400
+    return jsonify(result), 200
+
+@api_bp.route('/teacher/sessions/<session_id>', methods=['GET'])
+@role_required('teacher')
+def get_live_session(session_id):
+    session = live_sessions.get(session_id, owner=get_jwt_identity())
+    if session is None: return jsonify(msg="Session not found"), 404
+    return jsonify(session.summary()), 200
+
+@api_bp.route('/teacher/sessions/<session_id>', methods=['DELETE'])
+@role_required('teacher')
+def close_live_session(session_id):
+    session = live_sessions.close(session_id, owner=get_jwt_identity())
+    if session is None: return jsonify(msg="Session not found"), 404
+    return jsonify(session.summary()), 200
+
+def _encode_faces_in_pool(image_stream, max_side, profile=None):
+    return run_in_pool(encode_faces, image_stream, max_side, profile)
+
+@job_handler("mark_attendance")
+def _run_mark_attendance_job(params, payload):
+    return _mark_attendance(params["course_id"], params["mode"], BytesIO(payload), encoder=_encode_faces_in_pool, profile=params.get("profile"))
+
+
+# --- JOB ROUTES ---
+def _enqueue_job(kind, params, payload):
+    try:
+        job_id = job_queue.submit(kind, params, payload, owner=get_jwt_identity())
+    except PayloadTooLarge:
+        return jsonify(msg="Upload is too large to queue; send it without async=true."), 413
+    except QueueFull:
+        response = jsonify(msg="Server is busy, please try again shortly.")
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    status_url = url_for('api.get_job', job_id=job_id)
+    response = jsonify(msg="Job accepted", job_id=job_id, status_url=status_url)
+    response.headers["Location"] = status_url
+    return response, 202
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    job = job_queue.get(job_id, owner=get_jwt_identity())
+    if job is None: return jsonify(msg="Job not found"), 404
+    return jsonify(job), 200
+
+
+@api_bp.route('/kiosk/identify', methods=['POST'])
+@role_required('teacher')
+def kiosk_identify():
+    """Identifies a student against the whole school and marks them present in their course."""
+    if 'live_image' not in request.files: return jsonify(msg="No image captured"), 400
+    try:
+        profile = _profile_param(MATCH_PROFILE)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    encoded = encode_faces(request.files['live_image'].stream, profile=profile)
+    if encoded is None: return jsonify(msg="Could not read the captured image."), 400
+    face_locations, face_encodings = encoded
+    if not face_encodings: return jsonify(msg="No faces found in the image."), 404
+
+    # The kiosk expects one person in front of the camera: use the largest face
+    areas = [(bottom - top) * (right - left) for top, right, bottom, left in face_locations]
+    query = face_encodings[areas.index(max(areas))]
+    # Optional recall/latency trade-off; the index caps it at its partition count
+    nprobe = request.form.get('nprobe', type=int)
+    if nprobe is not None and nprobe < 1: return jsonify(msg="nprobe must be a positive integer"), 400
+    candidates = school_index.search(query, k=2, nprobe=nprobe)
+    if not candidates or candidates[0][1] > MATCH_TOLERANCE:
         return jsonify(msg="No match found."), 404
+    student_id, distance = candidates[0]
+    if len(candidates) > 1 and candidates[1][1] <= MATCH_TOLERANCE and candidates[1][1] - distance < MATCH_MARGIN:
+        return jsonify(msg="Match is ambiguous, please try again."), 409
+
+    student = db.users.find_one({"_id": student_id, "role": "student"}, {"name": 1, "course_id": 1})
+    if not student: return jsonify(msg="No match found."), 404
+    mark_present(student['course_id'], [student_id])
+    return jsonify(
+        msg=f"Attendance marked for {student.get('name')}",
+        student_id=str(student_id),
+        course_id=student['course_id'],
+        distance=round(distance, 4)
+    ), 200
 
 
 @api_bp.route('/teacher/analytics/<course_id>', methods=['GET'])
 @role_required('teacher')
+@cached_analytics(lambda course_id: [course_id])
 def get_teacher_course_analytics(course_id):
     month_str = request.args.get('month', datetime.datetime.now().strftime("%Y-%m"))
-
-    # 1. Get the list of *currently existing* student IDs for this course.
-    current_students_cursor = db.users.find({"role": "student", "course_id": course_id}, {"_id": 1})
-    current_student_ids = [s['_id'] for s in current_students_cursor]
-    students_in_course_count = len(current_student_ids)
-
-    if students_in_course_count == 0:
-        return jsonify({
-            "studentsInCourse": 0,
-            "overallAttendancePercentage": 0,
-            "dailyStats": [],
-            "totalClasses": 0
-        })
-
-    # 2. Build filters based ONLY on these existing students.
-    attendance_filter = {
-        "course_id": course_id,
-        "student_id": {"$in": current_student_ids},
-        "date": {"$regex": f"^{month_str}"}
-    }
-    
-    # 3. Recalculate monthly percentage correctly.
-    total_attendance_records = db.attendance.count_documents(attendance_filter)
-    distinct_dates_for_month = db.attendance.distinct("date", attendance_filter)
-    
-    total_possible_attendance = students_in_course_count * len(distinct_dates_for_month)
-    overall_percentage = (total_attendance_records / total_possible_attendance) * 100 if total_possible_attendance > 0 else 0
-
-    # 4. Correct the daily stats for the last 7 sessions.
-    all_class_dates = db.attendance.distinct("date", {"course_id": course_id, "student_id": {"$in": current_student_ids}})
-    recent_dates = sorted(list(all_class_dates), reverse=True)[:7]
-
-    daily_stats = []
-    for date_str in recent_dates:
-        # Count "Present" records for *current* students on that specific day.
-        present_count = db.attendance.count_documents({
-            "course_id": course_id, 
-            "date": date_str, 
-            "status": "Present",
-            "student_id": {"$in": current_student_ids}
-        })
-        # Absent count is now correct and can no longer be negative.
-        absent_count = students_in_course_count - present_count
-        daily_stats.append({"date": date_str, "Present": present_count, "Absent": absent_count})
-
-    return jsonify({
-        "studentsInCourse": students_in_course_count,
-        "overallAttendancePercentage": round(overall_percentage, 2),
-        "dailyStats": daily_stats,
-        "totalClasses": len(distinct_dates_for_month)
-    })
+    return jsonify(teacher_course_analytics(course_id, month_str))
 
 # --- STUDENT ROUTE ---
 @api_bp.route('/student/attendance', methods=['GET'])
 @jwt_required()
+@cached_analytics(lambda: _student_course(get_jwt_identity()), per_user=True)
 def get_student_attendance():
     current_user_id = get_jwt_identity()
     try:
@@ -216,74 +441,140 @@ def get_student_attendance():
     except Exception:
         return jsonify(msg="Invalid student ID in token"), 400
     
-    student = db.users.find_one({"_id": student_obj_id})
+    student = db.users.find_one({"_id": student_obj_id}, {"name": 1, "course_id": 1})
     if not student: return jsonify(msg="Student not found"), 404
     
     view_mode = request.args.get('view', 'daily')
-    student_course_id = student.get("course_id")
-    
-    all_session_dates = sorted(db.attendance.distinct("date", {"course_id": student_course_id}))
-    student_present_dates = {rec['date'] for rec in db.attendance.find({"student_id": student_obj_id, "status": "Present"})}
+    timeline = student_timeline(student)
     
     if view_mode == 'weekly':
-        weekly_stats = defaultdict(lambda: {"sessions": 0, "present": 0})
-        for date_str in all_session_dates:
-            try:
-                dt_obj = datetime.datetime.strptime(date_str.strip(), "%Y-%m-%d")
-                year, week_num, _ = dt_obj.isocalendar()
-                week_key = f"{year}-W{week_num:02d}"
-                weekly_stats[week_key]["sessions"] += 1
-                if date_str in student_present_dates: weekly_stats[week_key]["present"] += 1
-            except (ValueError, TypeError):
-                continue
-        timeline = []
-        for week, stats in sorted(weekly_stats.items()):
-            percentage = round((stats["present"] / stats["sessions"]) * 100, 2) if stats["sessions"] > 0 else 0
-            timeline.append({"week": week, "percentage": percentage})
-        return jsonify({"viewData": timeline, "studentName": student.get('name')})
+        return jsonify({"viewData": timeline.weekly(), "studentName": student.get('name')})
     
     elif view_mode == 'monthly':
         month_str = request.args.get('month')
         if not month_str: return jsonify(msg="Month parameter is required"), 400
-        present_count, absent_count = 0, 0
-        for date_str in all_session_dates:
-            if date_str and date_str.startswith(month_str):
-                if date_str in student_present_dates:
-                    present_count += 1
-                else:
-                    absent_count += 1
+        present_count, absent_count = timeline.monthly(month_str)
         pie_data = [{"name": "Present", "value": present_count}, {"name": "Absent", "value": absent_count}]
         return jsonify({"viewData": pie_data, "studentName": student.get('name')})
         
     elif view_mode == 'daily':
-        daily_log = []
-        for date_str in sorted(all_session_dates, reverse=True):
-            status = "Present" if date_str in student_present_dates else "Absent"
-            daily_log.append({"date": date_str, "status": status})
-        return jsonify({"viewData": daily_log, "studentName": student.get('name')})
+        return jsonify({"viewData": timeline.daily(), "studentName": student.get('name')})
         
     return jsonify(msg="Invalid view mode"), 400
 
 
 # --- SHARED & OTHER ADMIN ROUTES ---
+def _fields_param(allowed=None):
+    """
+    Projection for a comma-separated `fields` argument, or None when it is
+    absent. Raises ValueError for fields outside `allowed`.
+    """
+    fields_str = request.args.get('fields')
+    if not fields_str:
+        return None
+    fields = [f.strip() for f in fields_str.split(',') if f.strip()]
+    unknown = [f for f in fields if (allowed is not None and f not in allowed) or not f.replace('_', '').isalnum()]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return {f: 1 for f in fields}
+
 @api_bp.route('/courses', methods=['GET'])
 @jwt_required()
 def get_courses():
-    courses = list(db.courses.find({}))
+    try:
+        projection = _fields_param()
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    courses = list(db.courses.find({}, projection))
     for course in courses:
         course['_id'] = str(course['_id'])
     return jsonify(courses)
 
+STUDENT_LIST_FIELDS = ("name", "roll_no", "course_id")
+STUDENT_PAGE_MAX = 500
+
+def _encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def _decode_cursor(cursor):
+    """The values of a cursor made by _encode_cursor; raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        *keys, last_id = values
+        return keys, ObjectId(last_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
 @api_bp.route('/students', methods=['GET'])
 @role_required('admin')
 def get_all_students():
-    students = list(db.users.find({"role": "student"}, {"name": 1, "roll_no": 1, "course_id": 1}))
+    """
+    Lists students. Without `limit` every student is returned as one array.
+    With `limit`, returns a page as {"students", "next_cursor", "total"}:
+    pass next_cursor back as `cursor` for the following page. `course_id`
+    filters by course and `fields` picks the returned fields. `q` is a
+    prefix of the roll number if it contains a digit, of the name
+    otherwise, matched case-insensitively; search results come in that
+    field's order. Every page is a range scan on one index. total is only
+    counted on the first page of a listing without `q`.
+    """
+    try:
+        projection = _fields_param(STUDENT_LIST_FIELDS) or {f: 1 for f in STUDENT_LIST_FIELDS}
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    query = {"role": "student"}
+    if request.args.get('course_id'):
+        query["course_id"] = request.args['course_id']
+    target = search_target(request.args.get('q', ''))
+    if target:
+        field, prefix = target
+        query[field] = prefix_range(prefix)
+
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        students = list(db.users.find(query, projection))
+        for student in students:
+            student['_id'] = str(student['_id'])
+        return jsonify(students)
+
+    limit = max(1, min(limit, STUDENT_PAGE_MAX))
+    cursor = request.args.get('cursor')
+    total = None
+    page_query = dict(query)
+    if cursor:
+        try:
+            keys, last_id = _decode_cursor(cursor)
+            if (target and len(keys) != 1) or (not target and keys):
+                raise ValueError("Invalid cursor")
+        except ValueError as e:
+            return jsonify(msg=str(e)), 400
+        if target:
+            # After (key, _id) in (field, _id) order
+            page_query[field] = {**query[field], "$gte": keys[0]}
+            page_query["$or"] = [{field: {"$gt": keys[0]}}, {"_id": {"$gt": last_id}}]
+        else:
+            page_query["_id"] = {"$gt": last_id}
+    elif not target:
+        total = db.users.count_documents(query)
+
+    sort = [(field, 1), ("_id", 1)] if target else [("_id", 1)]
+    find_projection = {**projection, field: 1} if target else projection
+    # One extra document tells whether another page follows
+    students = list(db.users.find(page_query, find_projection).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(students) > limit:
+        last = students[limit - 1]
+        next_cursor = _encode_cursor(last[field], str(last['_id'])) if target else _encode_cursor(str(last['_id']))
+    students = students[:limit]
     for student in students:
         student['_id'] = str(student['_id'])
-    return jsonify(students)
+        if target and field not in projection:
+            student.pop(field, None)
+    return jsonify(students=students, next_cursor=next_cursor, total=total)
 
 @api_bp.route('/admin/student-analytics/<student_id>', methods=['GET'])
 @role_required('admin')
+@cached_analytics(_student_course)
 def get_student_analytics(student_id):
     try:
         student_obj_id = ObjectId(student_id)
@@ -291,48 +582,22 @@ def get_student_analytics(student_id):
         return jsonify(msg="Invalid student ID format"), 400
     
     view_mode = request.args.get('view', 'weekly')
-    student = db.users.find_one({"_id": student_obj_id})
+    student = db.users.find_one({"_id": student_obj_id}, {"name": 1, "course_id": 1})
     if not student: return jsonify(msg="Student not found"), 404
     
-    student_course_id = student.get("course_id")
-    all_session_dates = sorted(db.attendance.distinct("date", {"course_id": student_course_id}))
-    student_present_dates = {rec['date'] for rec in db.attendance.find({"student_id": student_obj_id, "status": "Present"})}
+    timeline = student_timeline(student)
     
     if view_mode == 'weekly':
-        weekly_stats = defaultdict(lambda: {"sessions": 0, "present": 0})
-        for date_str in all_session_dates:
-            try:
-                dt_obj = datetime.datetime.strptime(date_str.strip(), "%Y-%m-%d")
-                year, week_num, _ = dt_obj.isocalendar()
-                week_key = f"{year}-W{week_num:02d}"
-                weekly_stats[week_key]["sessions"] += 1
-                if date_str in student_present_dates: weekly_stats[week_key]["present"] += 1
-            except (ValueError, TypeError):
-                continue
-        timeline = []
-        for week, stats in sorted(weekly_stats.items()):
-            percentage = round((stats["present"] / stats["sessions"]) * 100, 2) if stats["sessions"] > 0 else 0
-            timeline.append({"week": week, "percentage": percentage})
-        return jsonify(timeline)
+        return jsonify(timeline.weekly())
         
     elif view_mode == 'monthly':
         month_str = request.args.get('month')
         if not month_str: return jsonify(msg="Month parameter is required for monthly view"), 400
-        present_count, absent_count = 0, 0
-        for date_str in all_session_dates:
-            if date_str and date_str.startswith(month_str):
-                if date_str in student_present_dates:
-                    present_count += 1
-                else:
-                    absent_count += 1
+        present_count, absent_count = timeline.monthly(month_str)
         return jsonify([{"name": "Present", "value": present_count}, {"name": "Absent", "value": absent_count}])
         
     elif view_mode == 'daily':
-        daily_log = []
-        for date_str in sorted(all_session_dates, reverse=True):
-            status = "Present" if date_str in student_present_dates else "Absent"
-            daily_log.append({"date": date_str, "status": status})
-        return jsonify(daily_log)
+        return jsonify(timeline.daily())
         
     return jsonify(msg="Invalid view mode specified"), 400
 
@@ -340,7 +605,7 @@ def get_student_analytics(student_id):
 @jwt_required()
 def get_my_profile():
     current_user_id = get_jwt_identity()
-    user = db.users.find_one({"_id": ObjectId(current_user_id)}, {"password": 0})
+    user = db.users.find_one({"_id": ObjectId(current_user_id)}, {"password": 0, "face_encoding": 0, "face_encoding_format": 0, rollups.FORMER_COURSES: 0})
     if not user:
         return jsonify(msg="User not found"), 404
 
@@ -368,19 +633,39 @@ def update_student(student_id):
         update_data = {}
         if 'name' in data: update_data['name'] = data['name']
         if 'roll_no' in data: update_data['roll_no'] = data['roll_no']
+        update_data.update(search_fields(update_data.get('name'), update_data.get('roll_no')))
         if 'course_id' in data: update_data['course_id'] = data['course_id']
         if 'password' in data and data['password']:
-            hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+            hashed_password = hash_password(data['password'])
             update_data['password'] = hashed_password
         
         if not update_data:
             return jsonify(msg="No update data provided"), 400
         
-        result = db.users.update_one({"_id": student_obj_id, "role": "student"}, {"$set": update_data})
-        if result.matched_count == 0:
+        previous = db.users.find_one_and_update(
+            {"_id": student_obj_id, "role": "student"},
+            {"$set": update_data},
+            projection={"course_id": 1}
+        )
+        if previous is None:
             return jsonify(msg="Student not found"), 404
+
+        analytics_cache.bump(previous.get('course_id'), update_data.get('course_id', previous.get('course_id')))
+        if 'course_id' in update_data:
+            # Queued marks must reach the attendance collection before the counts move
+            attendance_buffer.flush([previous.get('course_id')])
+            rollups.move_student(student_obj_id, previous.get('course_id'), update_data['course_id'])
+            # Drop the student from their old roster; the new one reloads lazily
+            embedding_cache.remove_student(student_obj_id)
+            embedding_cache.invalidate(update_data['course_id'])
+        elif 'name' in update_data:
+            embedding_cache.update_student(student_obj_id, name=update_data['name'])
             
         return jsonify(msg="Student updated successfully"), 200
+    except DuplicateKeyError:
+        return jsonify(msg="Student with this roll number already exists"), 409
+    except AuthBusy:
+        return jsonify(msg="Server is busy, please try again shortly."), 503
     except Exception as e:
         return jsonify(msg=f"An error occurred: {str(e)}"), 500
 
@@ -389,68 +674,59 @@ def update_student(student_id):
 def delete_student(student_id):
     try:
         student_obj_id = ObjectId(student_id)
-        result = db.users.delete_one({"_id": student_obj_id, "role": "student"})
-        if result.deleted_count == 0:
+        student = db.users.find_one_and_delete({"_id": student_obj_id, "role": "student"}, projection={"course_id": 1})
+        if student is None:
             return jsonify(msg="Student not found"), 404
+        embedding_cache.remove_student(student_obj_id)
+        school_index.remove_student(student_obj_id)
+        attendance_buffer.discard_student(student_obj_id)
+        affected_courses = rollups.remove_student(student_obj_id, student.get('course_id'))
+        analytics_cache.bump(student.get('course_id'), *affected_courses)
+        for course_id in affected_courses:
+            session_calendars.invalidate(course_id)
         # Also delete associated attendance records
         db.attendance.delete_many({"student_id": student_obj_id})
         return jsonify(msg="Student and their attendance records deleted successfully"), 200
     except Exception as e:
         return jsonify(msg=f"An error occurred: {str(e)}"), 500
     
+def _send_report(sheets, filename, report_format):
+    """Sends report sheets as a streamed CSV or as an XLSX built on disk."""
+    if report_format == 'csv':
+        return Response(
+            stream_with_context(stream_csv(sheets)),
+            mimetype='text/csv',
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+        )
+    return send_file(
+        build_xlsx(sheets),
+        as_attachment=True,
+        download_name=f'{filename}.xlsx',
+        mimetype=XLSX_MIMETYPE
+    )
+
 @api_bp.route('/teacher/report/<course_id>', methods=['GET'])
 @role_required('teacher')
 def get_course_report(course_id):
     month_str = request.args.get('month')
     if not month_str:
         return jsonify(msg="Month parameter is required"), 400
+    report_format = request.args.get('format', 'xlsx')
 
-    students = list(db.users.find({"role": "student", "course_id": course_id}, {"name": 1, "roll_no": 1}))
-    
-    date_filter = {"course_id": course_id, "date": {"$regex": f"^{month_str}"}}
-    distinct_dates = sorted(db.attendance.distinct("date", date_filter))
-
-    wb = Workbook()
-    ws = wb.active
-    
     try:
-        course_name = db.courses.find_one({"_id": ObjectId(course_id)})['name']
+        course = db.courses.find_one({"_id": ObjectId(course_id)})
     except Exception:
-        course_name = db.courses.find_one({"_id": course_id})['name']
-
-    ws.title = f"{course_name} Attendance"
+        course = db.courses.find_one({"_id": course_id})
+    if not course:
+        return jsonify(msg="Course not found"), 404
+    course_name = course['name']
 
-    headers = ["Roll No", "Student Name"] + distinct_dates
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-
-    for student in students:
-        student_id = student['_id']
-        row_data = [student.get('roll_no', 'N/A'), student.get('name', 'N/A')]
-        
-        present_dates = set(rec['date'] for rec in db.attendance.find({
-            "student_id": student_id,
-            "date": {"$in": distinct_dates},
-            "status": "Present"
-        }))
+    students = db.users.find({"role": "student", "course_id": course_id}, {"name": 1, "roll_no": 1})
+    read_your_writes([course_id])
+    dates, present = fetch_course_attendance([course_id], month_str)
+    rows = report_rows(course_id, students, dates.get(course_id, []), present)
 
-        for date in distinct_dates:
-            status = "P" if date in present_dates else "A"
-            row_data.append(status)
-        ws.append(row_data)
-
-    mem_file = BytesIO()
-    wb.save(mem_file)
-    mem_file.seek(0)
-
-    return send_file(
-        mem_file,
-        as_attachment=True,
-        download_name=f'attendance_report_{course_name}_{month_str}.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    return _send_report([(f"{course_name} Attendance", rows)], f'attendance_report_{course_name}_{month_str}', report_format)
 
 @api_bp.route('/admin/full-report', methods=['GET'])
 @role_required('admin')
@@ -460,6 +736,7 @@ def get_full_school_report():
 
     if not month_str or not course_ids_str:
         return jsonify(msg="Month and course IDs are required"), 400
+    report_format = request.args.get('format', 'xlsx')
 
     course_ids = course_ids_str.split(',')
     
@@ -469,53 +746,19 @@ def get_full_school_report():
     except Exception:
         courses = list(db.courses.find({"_id": {"$in": course_ids}}))
 
-    students = list(db.users.find({"role": "student", "course_id": {"$in": course_ids}}, {"name": 1, "roll_no": 1, "course_id": 1}))
-    
-    wb = Workbook()
-    wb.remove(wb.active)
+    students_by_course = defaultdict(list)
+    for student in db.users.find({"role": "student", "course_id": {"$in": course_ids}}, {"name": 1, "roll_no": 1, "course_id": 1}):
+        students_by_course[student.get('course_id')].append(student)
+    read_your_writes(course_ids)
+    dates, present = fetch_course_attendance(course_ids, month_str)
 
+    sheets = []
     for course in courses:
         course_id_str = str(course['_id'])
-        course_name = course['name']
-        ws = wb.create_sheet(title=course_name[:31])
+        rows = report_rows(course_id_str, students_by_course[course_id_str], dates.get(course_id_str, []), present)
+        sheets.append((course['name'][:31], rows))
 
-        date_filter = {"course_id": course_id_str, "date": {"$regex": f"^{month_str}"}}
-        distinct_dates = sorted(db.attendance.distinct("date", date_filter))
-
-        headers = ["Roll No", "Student Name"] + distinct_dates
-        ws.append(headers)
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        students_in_course = [s for s in students if s.get('course_id') == course_id_str]
-
-        for student in students_in_course:
-            student_id = student['_id']
-            row_data = [student.get('roll_no', 'N/A'), student.get('name', 'N/A')]
-            
-            present_dates = set(rec['date'] for rec in db.attendance.find({
-                "student_id": student_id,
-                "date": {"$in": distinct_dates},
-                "status": "Present"
-            }))
-            
-            for date in distinct_dates:
-                status = "P" if date in present_dates else "A"
-                row_data.append(status)
-            
-            ws.append(row_data)
-
-    mem_file = BytesIO()
-    wb.save(mem_file)
-    mem_file.seek(0)
-
-    return send_file(
-        mem_file,
-        as_attachment=True,
-        download_name=f'school_report_{month_str}.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    return _send_report(sheets, f'school_report_{month_str}', report_format)
 
 @api_bp.route('/admin/student/<student_id>/update-face', methods=['POST'])
 @role_required('admin')
@@ -526,18 +769,27 @@ def update_student_face(student_id):
             return jsonify(msg="No face image provided"), 400
         
         face_image = request.files['face_image']
-        face_encoding = get_face_encoding(face_image)
+        try:
+            profile = _profile_param(ENROLL_PROFILE)
+        except ValueError as e:
+            return jsonify(msg=str(e)), 400
+        face_encoding = get_face_encoding(face_image, profile)
 
         if face_encoding is None:
             return jsonify(msg="Could not detect a single face in the image."), 400
 
-        result = db.users.update_one(
+        student = db.users.find_one_and_update(
             {"_id": student_obj_id, "role": "student"},
-            {"$set": {"face_encoding": face_encoding}}
+            {"$set": encoding_fields(face_encoding)},
+            projection={"name": 1, "course_id": 1}
         )
 
-        if result.matched_count == 0:
+        if student is None:
             return jsonify(msg="Student not found"), 404
+
+        if not embedding_cache.update_student(student_obj_id, face_encoding=face_encoding):
+            embedding_cache.add_student(student.get('course_id'), student_obj_id, student.get('name'), face_encoding)
+        school_index.add_student(student_obj_id, face_encoding)
             
         return jsonify(msg="Student face image updated successfully"), 200
     except Exception as e:
@@ -1,68 +1,276 @@
-import face_recognition
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+import os
+import time
+from collections import namedtuple
+from .metrics import stage
 
-def get_face_encoding(image_file):
+# Maximum face distance accepted as a match (face_recognition's default)
+MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", "0.6"))
+# Minimum gap between the best and second-best candidate for a confident match
+MATCH_MARGIN = float(os.getenv("FACE_MATCH_MARGIN", "0.05"))
+# Longest side, in pixels, of the image that face detection runs on
+DETECTION_MAX_SIDE = int(os.getenv("FACE_DETECTION_MAX_SIDE", "800"))
+# Group photos hold many small faces, so they are detected at a larger size
+GROUP_DETECTION_MAX_SIDE = int(os.getenv("FACE_GROUP_DETECTION_MAX_SIDE", "1600"))
+# Encode faces on the full-resolution image instead of the downscaled copy
+ENCODE_FULL_RESOLUTION = os.getenv("FACE_ENCODE_FULL_RES", "false").lower() == "true"
+
+EXIF_ORIENTATION = 0x0112
+
+# Speed/accuracy settings for one recognition pass. upsample and detector go
+# to face_locations, landmarks ("small" 5-point or "large" 68-point) and
+# jitters to face_encodings, max_side is the detection image size.
+RecognitionProfile = namedtuple("RecognitionProfile", ["name", "upsample", "detector", "landmarks", "jitters", "max_side"])
+
+PROFILES = {
+    "fast": RecognitionProfile("fast", 0, "hog", "small", 1, min(DETECTION_MAX_SIDE, 640)),
+    # face_recognition's own defaults, used by every path before profiles existed
+    "balanced": RecognitionProfile("balanced", 1, "hog", "small", 1, DETECTION_MAX_SIDE),
+    "accurate": RecognitionProfile("accurate", 1, "hog", "large", 10, max(DETECTION_MAX_SIDE, 1280)),
+}
+# Profile used to encode enrolment photos, where latency matters little
+ENROLL_PROFILE = os.getenv("FACE_ENROLL_PROFILE", "accurate")
+# Profile used for attendance marking and identification
+MATCH_PROFILE = os.getenv("FACE_MATCH_PROFILE", "balanced")
+
+_face_recognition = None
+
+def face_recognition_api():
+    """
+    Returns the face_recognition module, importing it on first use. The import
+    loads dlib and its model files, which takes seconds and a few hundred MB,
+    so workers that only serve login and analytics never pay for it.
+    """
+    global _face_recognition
+    if _face_recognition is None:
+        import face_recognition
+        _face_recognition = face_recognition
+    return _face_recognition
+
+def warm_up():
+    """
+    Runs one detection and one encoding with every landmark model on a blank
+    image, so the first real request does not pay dlib's first-call costs.
+    Returns the seconds taken, including the model import if still needed.
+    """
+    started = time.perf_counter()
+    face_recognition = face_recognition_api()
+    image = np.zeros((160, 160, 3), dtype=np.uint8)
+    face_recognition.face_locations(image, 0, "hog")
+    for landmarks in sorted({profile.landmarks for profile in PROFILES.values()}):
+        face_recognition.face_encodings(image, [(40, 120, 120, 40)], 1, landmarks)
+    return time.perf_counter() - started
+
+def get_profile(profile=None, default=MATCH_PROFILE):
+    """
+    Resolves a profile name (or an existing RecognitionProfile) to a
+    RecognitionProfile, falling back to `default` when none is given.
+    Raises ValueError for unknown names.
+    """
+    if isinstance(profile, RecognitionProfile):
+        return profile
+    name = profile or default
+    if name not in PROFILES:
+        raise ValueError(f"Unknown recognition profile: {name}")
+    return PROFILES[name]
+
+def load_image(image_stream, max_side=DETECTION_MAX_SIDE, full_resolution=ENCODE_FULL_RESOLUTION):
     """
-    Takes an image file stream and returns the face encoding.
+    Shared preprocessing stage for every face path. Decodes an image stream,
+    applies its EXIF orientation and returns a downscaled RGB array for face
+    detection. JPEGs are decoded straight at reduced scale (draft mode).
+    Returns (detection_image, encoding_image, scale) where scale maps
+    detection coordinates back to the original image. encoding_image is the
+    full-resolution array when full_resolution is set, else detection_image.
+    """
+    image = Image.open(image_stream)
+    original_width, original_height = image.size
+    if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        original_width, original_height = original_height, original_width
+
+    if image.format == 'JPEG' and not full_resolution:
+        image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    encoding_image = np.array(image) if full_resolution else None
+    image.thumbnail((max_side, max_side))
+    detection_image = np.array(image)
+    if encoding_image is None:
+        encoding_image = detection_image
+    return detection_image, encoding_image, original_width / image.width
+
+def scale_locations(face_locations, scale, width, height):
+    """Maps (top, right, bottom, left) boxes by `scale`, clipped to the image bounds."""
+    return [
+        (
+            max(0, int(round(top * scale))),
+            min(width, int(round(right * scale))),
+            min(height, int(round(bottom * scale))),
+            max(0, int(round(left * scale)))
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+def detect_faces(image_stream, max_side=None, profile=None):
+    """
+    Detection stage. Returns (detection_image, encoding_image, face_locations,
+    original_locations) where face_locations are in detection_image
+    coordinates and original_locations in original image coordinates.
+    max_side overrides the profile's detection size.
+    """
+    profile = get_profile(profile)
+    face_recognition = face_recognition_api()
+    with stage("decode"):
+        detection_image, encoding_image, scale = load_image(image_stream, max_side or profile.max_side)
+    with stage("detect"):
+        face_locations = face_recognition.face_locations(detection_image, profile.upsample, profile.detector)
+    height, width = detection_image.shape[:2]
+    original_locations = scale_locations(face_locations, scale, int(round(width * scale)), int(round(height * scale)))
+    return detection_image, encoding_image, face_locations, original_locations
+
+def encode_detected(detected, indices=None, profile=None):
+    """Encoding stage: encodes the detected faces at `indices` (all by default)."""
+    profile = get_profile(profile)
+    detection_image, encoding_image, face_locations, original_locations = detected
+    if indices is None:
+        indices = range(len(face_locations))
+    if encoding_image is detection_image:
+        image, locations = detection_image, [face_locations[i] for i in indices]
+    else:
+        image, locations = encoding_image, [original_locations[i] for i in indices]
+    with stage("encode"):
+        return face_recognition_api().face_encodings(image, locations, profile.jitters, profile.landmarks)
+
+def detect_and_encode(image_stream, max_side=None, profile=None):
+    """
+    Runs detection on the downscaled image and encoding on whichever image
+    load_image returned for it. Returns (face_locations, face_encodings) with
+    boxes in original image coordinates.
+    """
+    profile = get_profile(profile)
+    detected = detect_faces(image_stream, max_side, profile)
+    if not detected[2]:
+        return [], []
+    return detected[3], encode_detected(detected, profile=profile)
+
+def get_face_encoding(image_file, profile=None):
+    """
+    Takes an uploaded image file (or a raw binary stream) and returns the face
+    encoding as a float32 array, using the enrolment profile by default.
     Returns None if no face is found or more than one face is found.
     """
     try:
-        # Read the image file
-        image = Image.open(image_file.stream)
-        
-        # Convert image to RGB (face_recognition requirement)
-        image = image.convert('RGB')
-        
-        # Convert PIL image to numpy array
-        np_image = np.array(image)
-        
-        # Find face locations
-        face_locations = face_recognition.face_locations(np_image)
+        profile = get_profile(profile, ENROLL_PROFILE)
+        face_locations, face_encodings = detect_and_encode(getattr(image_file, 'stream', image_file), profile=profile)
         
         # Ensure exactly one face is detected
         if len(face_locations) != 1:
             return None
-            
-        # Get the face encoding
-        face_encodings = face_recognition.face_encodings(np_image, face_locations)
         
-        return face_encodings[0].tolist() # Convert numpy array to list for MongoDB
+        return face_encodings[0].astype(np.float32) # Packed by encoding_fields() for MongoDB
     except Exception as e:
         print(f"Error getting face encoding: {e}")
         return None
 
-def match_face(known_encodings, unknown_image_stream):
+def face_distance_matrix(known_encodings, unknown_encodings):
     """
-    Takes a list of known face encodings and an unknown image stream.
-    Returns the index of the matched face or None if no match.
+    Returns the Euclidean distance between every unknown and every known
+    encoding as a (len(unknown), len(known)) matrix, in one batched operation.
     """
-    try:
-        # Load the unknown image
-        unknown_image = face_recognition.load_image_file(unknown_image_stream)
-        
-        # Find faces in the unknown image
-        unknown_face_locations = face_recognition.face_locations(unknown_image)
-        if not unknown_face_locations:
-            return None # No faces found in the image
+    known = np.asarray(known_encodings, dtype=np.float32).reshape(-1, 128)
+    unknown = np.asarray(unknown_encodings, dtype=np.float32).reshape(-1, 128)
+    # |a - b|^2 = |a|^2 + |b|^2 - 2a.b, so the bulk of the work is one matmul
+    squared = (
+        np.einsum('ij,ij->i', unknown, unknown)[:, None]
+        + np.einsum('ij,ij->i', known, known)[None, :]
+        - 2.0 * (unknown @ known.T)
+    )
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared)
+
+def match_encodings(known_encodings, unknown_encodings, tolerance=MATCH_TOLERANCE, margin=MATCH_MARGIN):
+    """
+    Assigns every unknown encoding to its nearest known encoding.
+    Returns one dict per unknown face with the known "index" (or None), the
+    nearest "distance" and a "status" of matched, unmatched or ambiguous.
+    A face is ambiguous when the runner-up is also within tolerance and less
+    than `margin` further away than the best candidate.
+    """
+    known = np.asarray(known_encodings, dtype=np.float32)
+    if len(unknown_encodings) == 0:
+        return []
+    if len(known) == 0:
+        return [{"index": None, "distance": None, "status": "unmatched"} for _ in unknown_encodings]
 
-        # Get encodings for faces in the unknown image
-        unknown_face_encodings = face_recognition.face_encodings(unknown_image, unknown_face_locations)
+    with stage("match"):
+        distances = face_distance_matrix(known, unknown_encodings)
+        best = np.argmin(distances, axis=1)
+        best_distances = distances[np.arange(len(best)), best]
+        if distances.shape[1] > 1:
+            runner_up = np.partition(distances, 1, axis=1)[:, 1]
+        else:
+            runner_up = np.full(len(best), np.inf, dtype=distances.dtype)
 
-        # Convert list of lists back to numpy arrays for comparison
-        known_np_encodings = [np.array(enc) for enc in known_encodings]
-        
-        # Iterate through each face found in the unknown image
-        for unknown_encoding in unknown_face_encodings:
-            matches = face_recognition.compare_faces(known_np_encodings, unknown_encoding, tolerance=0.6)
-            
-            # Check if there is a match
-            if True in matches:
-                first_match_index = matches.index(True)
-                return first_match_index
-        
-        return None
+    results = []
+    for index, distance, second in zip(best, best_distances, runner_up):
+        distance = float(distance)
+        if distance > tolerance:
+            results.append({"index": None, "distance": distance, "status": "unmatched"})
+        elif second <= tolerance and second - distance < margin:
+            results.append({"index": int(index), "distance": distance, "status": "ambiguous"})
+        else:
+            results.append({"index": int(index), "distance": distance, "status": "matched"})
+    return results
+
+def resolve_duplicate_matches(results):
+    """
+    Ensures no student is assigned to more than one face: the closest face
+    keeps the match and the others are downgraded to ambiguous.
+    """
+    claimed = {}
+    for position, result in enumerate(results):
+        if result["status"] != "matched":
+            continue
+        other = claimed.get(result["index"])
+        if other is None:
+            claimed[result["index"]] = position
+        elif result["distance"] < results[other]["distance"]:
+            results[other]["status"] = "ambiguous"
+            claimed[result["index"]] = position
+        else:
+            result["status"] = "ambiguous"
+    return results
+
+def encode_faces(image_stream, max_side=None, profile=None):
+    """
+    Detects every face in an image stream and encodes them in one pass.
+    Returns (face_locations, face_encodings), or None if the image is unreadable.
+    """
+    try:
+        return detect_and_encode(image_stream, max_side, profile)
     except Exception as e:
-        print(f"Error matching face: {e}")
-        return None
\ No newline at end of file
+        print(f"Error encoding faces: {e}")
+        return None
+
+def best_match(known_encodings, unknown_encodings):
+    """
+    Returns the closest confident match among the unknown encodings as a
+    dict with "index" and "distance", or None if none of them matched.
+    """
+    matches = [m for m in match_encodings(known_encodings, unknown_encodings) if m["status"] == "matched"]
+    if not matches:
+        return None
+    return min(matches, key=lambda m: m["distance"])
+
+def match_face(known_encodings, unknown_image_stream):
+    """
+    Takes a matrix (or list) of known face encodings and an unknown image stream.
+    Returns the closest confident match among all faces in the image as a dict
+    with "index" and "distance", or None if no face matched.
+    """
+    encoded = encode_faces(unknown_image_stream)
+    if not encoded or not encoded[1]:
+        return None # No faces found in the image
+    return best_match(known_encodings, encoded[1])
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+import uuid
+from .attendance import mark_present, today_str
+from .embedding_cache import embedding_cache
+from .services import detect_faces, encode_detected, match_encodings, resolve_duplicate_matches, get_profile
+
+# Seconds without a frame after which a live session is closed
+LIVE_SESSION_IDLE_TIMEOUT = float(os.getenv("LIVE_SESSION_IDLE_TIMEOUT", "900"))
+# Open live sessions allowed per worker process
+LIVE_SESSION_MAX = int(os.getenv("LIVE_SESSION_MAX", "50"))
+# Minimum overlap (intersection over union) for a face to keep the identity
+# it had in the previous frame without being encoded again
+LIVE_TRACK_IOU = float(os.getenv("LIVE_TRACK_IOU", "0.5"))
+
+
+class TooManySessions(Exception):
+    """Raised when a session is opened while LIVE_SESSION_MAX are open."""
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class LiveSession:
+    """
+    Attendance state of one class being captured continuously: a snapshot of
+    the course roster, the students already marked and the boxes of faces
+    identified in the previous frame. A face that overlaps one of those boxes
+    keeps its identity, so only faces new to the frame are encoded and only
+    newly recognised students are written. A session left open past midnight
+    starts over for the new date.
+    """
+    def __init__(self, course_id, owner, roster, profile=None):
+        self.session_id = uuid.uuid4().hex
+        self.course_id = course_id
+        self.owner = owner
+        self.roster = roster
+        self.profile = get_profile(profile)
+        self.date = today_str()
+        self.present = set()
+        self.tracks = []
+        self.frames = 0
+        self.encoded_faces = 0
+        self.last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _tracked_student(self, box):
+        best, best_iou = None, LIVE_TRACK_IOU
+        for tracked_box, index in self.tracks:
+            iou = box_iou(box, tracked_box)
+            if iou >= best_iou:
+                best, best_iou = index, iou
+        return best
+
+    def _face(self, box, index, status, distance=None):
+        face = {"box": list(box), "status": status, "distance": None if distance is None else round(distance, 4)}
+        if index is not None:
+            face["student_id"] = str(self.roster.student_ids[index])
+            face["name"] = self.roster.names[index]
+        return face
+
+    def _rotate_date(self):
+        today = today_str()
+        if today != self.date:
+            # Students present yesterday have to be seen again today
+            self.date = today
+            self.present = set()
+            self.tracks = []
+
+    def process_frame(self, image_stream):
+        """
+        Handles one captured frame and returns the per-frame summary. Returns
+        None if the frame cannot be read.
+        """
+        with self._lock:
+            self.last_activity = time.monotonic()
+            self._rotate_date()
+            try:
+                detected = detect_faces(image_stream, profile=self.profile)
+            except Exception as e:
+                print(f"Error reading live session frame: {e}")
+                return None
+            boxes = detected[3]
+            self.frames += 1
+
+            faces, tracks, new_ids = [], [], []
+            identities = [self._tracked_student(box) for box in boxes]
+            seen = {index for index in identities if index is not None}
+            untracked = [i for i, index in enumerate(identities) if index is None]
+            results = []
+            if untracked:
+                results = resolve_duplicate_matches(match_encodings(self.roster.matrix, encode_detected(detected, untracked, self.profile)))
+                self.encoded_faces += len(untracked)
+            matches = dict(zip(untracked, results))
+
+            for i, box in enumerate(boxes):
+                index = identities[i]
+                if index is not None:
+                    faces.append(self._face(box, index, "tracked"))
+                    tracks.append((box, index))
+                    continue
+                result = matches[i]
+                index = result["index"]
+                if result["status"] == "matched" and index in seen:
+                    # Already in frame under another box
+                    result["status"] = "ambiguous"
+                faces.append(self._face(box, index if result["status"] != "unmatched" else None, result["status"], result["distance"]))
+                if result["status"] != "matched":
+                    continue
+                seen.add(index)
+                tracks.append((box, index))
+                if index not in self.present:
+                    self.present.add(index)
+                    new_ids.append(index)
+
+            self.tracks = tracks
+            if new_ids:
+                mark_present(self.course_id, [self.roster.student_ids[i] for i in new_ids], self.date)
+            return {
+                "faces": faces,
+                "new": [{"student_id": str(self.roster.student_ids[i]), "name": self.roster.names[i]} for i in new_ids],
+                "present_count": len(self.present),
+                "encoded_faces": len(untracked),
+            }
+
+    def summary(self):
+        return {
+            "session_id": self.session_id,
+            "course_id": self.course_id,
+            "date": self.date,
+            "frames": self.frames,
+            "encoded_faces": self.encoded_faces,
+            "roster_size": len(self.roster),
+            "profile": self.profile.name,
+            "present": [
+                {"student_id": str(self.roster.student_ids[i]), "name": self.roster.names[i]}
+                for i in sorted(self.present)
+            ],
+        }
+
+
+class SessionStore:
+    """
+    Open live sessions of this worker process. Sessions live in memory, so
+    every frame of a session must reach the worker that opened it; `enabled`
+    is turned off when several workers share the traffic.
+    """
+    def __init__(self, idle_timeout=LIVE_SESSION_IDLE_TIMEOUT, max_sessions=LIVE_SESSION_MAX):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.enabled = True
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for session_id in [k for k, s in self._sessions.items() if s.last_activity < cutoff]:
+            del self._sessions[session_id]
+
+    def open(self, course_id, owner, profile=None):
+        """Starts a session for a course; returns None if it has no enrolled faces."""
+        roster = embedding_cache.get(course_id)
+        if not len(roster):
+            return None
+        session = LiveSession(course_id, owner, roster, profile)
+        with self._lock:
+            self._prune()
+            if len(self._sessions) >= self.max_sessions:
+                raise TooManySessions()
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id, owner=None):
+        with self._lock:
+            self._prune()
+            session = self._sessions.get(session_id)
+        if session is None or session.owner != owner:
+            return None
+        return session
+
+    def close(self, session_id, owner=None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return None
+            return self._sessions.pop(session_id)
+
+
+live_sessions = SessionStore()
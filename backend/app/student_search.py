@@ -0,0 +1,38 @@
+import re
+
+# Normalised copies of a student's name and roll number, written next to
+# them so prefix searches are one range scan on an index
+SEARCH_NAME = "search_name"
+SEARCH_ROLL_NO = "search_roll_no"
+
+
+def normalise_name(value):
+    """Case-folded name with runs of whitespace collapsed: "  Ana  de Souza" -> "ana de souza"."""
+    return " ".join(str(value).split()).casefold()
+
+
+def normalise_roll_no(value):
+    return str(value).strip().upper()
+
+
+def search_fields(name=None, roll_no=None):
+    """The search fields to store for a student's (new) name and/or roll number."""
+    fields = {}
+    if name is not None:
+        fields[SEARCH_NAME] = normalise_name(name)
+    if roll_no is not None:
+        fields[SEARCH_ROLL_NO] = normalise_roll_no(roll_no)
+    return fields
+
+
+def search_target(q):
+    """
+    Returns the (field, normalised prefix) a search string is matched on:
+    text containing a digit is a roll number prefix, anything else a name
+    prefix. Returns None for blank input.
+    """
+    if not q or not q.strip():
+        return None
+    if re.search(r"\d", q):
+        return SEARCH_ROLL_NO, normalise_roll_no(q)
+    return SEARCH_NAME, normalise_name(q)
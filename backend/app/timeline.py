@@ -0,0 +1,170 @@
+import bisect
+import datetime
+import os
+import threading
+import time
+from . import db
+from .analytics import course_session_dates
+
+# Seconds before a course's session calendar is reloaded from the rollup in
+# full, picking up sessions removed or back-filled through another worker.
+TIMELINE_CACHE_TTL = float(os.getenv("TIMELINE_CACHE_TTL", "900"))
+# Seconds between checks for sessions newer than the last cached one
+TIMELINE_SYNC_INTERVAL = float(os.getenv("TIMELINE_SYNC_INTERVAL", "30"))
+
+
+def week_key(date_str):
+    """Returns the ISO week ("2024-W05") of a "%Y-%m-%d" date, or None if it does not parse."""
+    try:
+        year, week_num, _ = datetime.datetime.strptime(date_str.strip(), "%Y-%m-%d").isocalendar()
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return f"{year}-W{week_num:02d}"
+
+
+class CourseCalendar:
+    """
+    Sorted session dates of one course with their ISO weeks precomputed.
+    The dates of each week form one bucket, so weekly figures are a bucket
+    lookup per attended date instead of a pass over the calendar. Buckets
+    are keyed by week because dates that sort by string are not always in
+    week order (a malformed or padded date can fall between two of a week).
+    """
+    def __init__(self, dates, weeks=None):
+        self.dates = dates
+        self.weeks = weeks if weeks is not None else [week_key(d) for d in dates]
+        self.buckets = []
+        self.bucket_of = []
+        positions = {}
+        for week in self.weeks:
+            if week is None:
+                self.bucket_of.append(None)
+                continue
+            if week not in positions:
+                positions[week] = len(self.buckets)
+                self.buckets.append([week, 0])
+            self.buckets[positions[week]][1] += 1
+            self.bucket_of.append(positions[week])
+        now = time.monotonic()
+        self.loaded_at = now
+        self.synced_at = now
+
+    def __len__(self):
+        return len(self.dates)
+
+    def index(self, date_str):
+        """Position of a session date in the calendar, or None."""
+        if not isinstance(date_str, str):
+            return None
+        pos = bisect.bisect_left(self.dates, date_str)
+        return pos if pos < len(self.dates) and self.dates[pos] == date_str else None
+
+    def prefix_bounds(self, prefix):
+        """Positions [start, end) of the sessions whose date starts with `prefix`."""
+        start = bisect.bisect_left(self.dates, prefix)
+        end = bisect.bisect_left(self.dates, prefix[:-1] + chr(ord(prefix[-1]) + 1)) if prefix else len(self.dates)
+        return start, end
+
+    def with_dates(self, new_dates):
+        """Returns a calendar that also contains `new_dates`, reusing the known weeks."""
+        known = dict(zip(self.dates, self.weeks))
+        merged = sorted(set(self.dates).union(new_dates))
+        calendar = CourseCalendar(merged, [known[d] if d in known else week_key(d) for d in merged])
+        calendar.loaded_at = self.loaded_at
+        return calendar
+
+
+class CalendarCache:
+    """
+    Process-level cache of course session calendars. A calendar is loaded
+    from the attendance_daily rollup once, extended with newer sessions as
+    they appear and reloaded in full after its TTL.
+    """
+    def __init__(self, ttl=TIMELINE_CACHE_TTL, sync_interval=TIMELINE_SYNC_INTERVAL):
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._calendars = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_id):
+        with self._lock:
+            calendar = self._calendars.get(course_id)
+        now = time.monotonic()
+        if calendar is None or now - calendar.loaded_at >= self.ttl:
+            calendar = CourseCalendar(course_session_dates(course_id))
+        elif now - calendar.synced_at >= self.sync_interval:
+            after = calendar.dates[-1] if calendar.dates else None
+            newer = course_session_dates(course_id, after=after)
+            if newer:
+                calendar = calendar.with_dates(newer)
+            calendar.synced_at = now
+        else:
+            return calendar
+        with self._lock:
+            self._calendars[course_id] = calendar
+        return calendar
+
+    def add_session(self, course_id, date):
+        """Adds a session date written through this process to a loaded calendar."""
+        with self._lock:
+            calendar = self._calendars.get(course_id)
+            if calendar is not None and calendar.index(date) is None:
+                extended = calendar.with_dates([date])
+                extended.synced_at = calendar.synced_at
+                self._calendars[course_id] = extended
+
+    def invalidate(self, course_id=None):
+        """Drops one calendar, or every calendar when no id is given."""
+        with self._lock:
+            if course_id is None:
+                self._calendars.clear()
+            else:
+                self._calendars.pop(course_id, None)
+
+
+session_calendars = CalendarCache()
+
+
+class StudentTimeline:
+    """
+    One student's attendance against their course's session calendar. Backs
+    the daily, weekly and monthly views of both the student and the admin
+    student analytics routes.
+    """
+    def __init__(self, student, calendar, present_dates):
+        self.student = student
+        self.calendar = calendar
+        self.present_dates = present_dates
+        self.attended = sorted(i for i in map(calendar.index, present_dates) if i is not None)
+
+    def daily(self):
+        dates, present = self.calendar.dates, self.present_dates
+        return [
+            {"date": date_str, "status": "Present" if date_str in present else "Absent"}
+            for date_str in reversed(dates)
+        ]
+
+    def weekly(self):
+        attended = [0] * len(self.calendar.buckets)
+        for pos in self.attended:
+            bucket = self.calendar.bucket_of[pos]
+            if bucket is not None:
+                attended[bucket] += 1
+        timeline = []
+        for (week, sessions), present in sorted(zip(self.calendar.buckets, attended)):
+            percentage = round((present / sessions) * 100, 2) if sessions > 0 else 0
+            timeline.append({"week": week, "percentage": percentage})
+        return timeline
+
+    def monthly(self, month_str):
+        """Returns (present, absent) session counts for a "YYYY-MM" or "YYYY" period."""
+        start, end = self.calendar.prefix_bounds(month_str)
+        present_count = bisect.bisect_left(self.attended, end) - bisect.bisect_left(self.attended, start)
+        return present_count, (end - start) - present_count
+
+
+def student_timeline(student):
+    """Builds the timeline of a student document (needs its _id and course_id)."""
+    calendar = session_calendars.get(student.get("course_id"))
+    cursor = db.attendance.find({"student_id": student['_id'], "status": "Present"}, {"date": 1, "_id": 0})
+    return StudentTimeline(student, calendar, {rec['date'] for rec in cursor})
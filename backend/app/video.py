@@ -0,0 +1,167 @@
+import math
+import os
+import numpy as np
+from .pool import get_process_pool, FACE_WORKERS
+from .services import face_distance_matrix, scale_locations, get_profile, face_recognition_api
+
+# Frames per second of video considered for detection
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "3"))
+# Upper bound on frames analysed per clip; long clips are sampled more sparsely
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "48"))
+# Mean grayscale change (0-255) below which a sampled frame is skipped as a
+# near-copy of the previous analysed one
+VIDEO_MOTION_THRESHOLD = float(os.getenv("VIDEO_MOTION_THRESHOLD", "1"))
+# Faces from different frames closer than this are treated as the same person
+VIDEO_DEDUPE_DISTANCE = float(os.getenv("VIDEO_DEDUPE_DISTANCE", "0.45"))
+
+
+_cv2 = None
+
+
+def load_cv2():
+    """Imports OpenCV on first use. Returns None when it is not installed."""
+    global _cv2
+    if _cv2 is None:
+        try:
+            import cv2
+        except ImportError:  # optional dependency: pip install opencv-python-headless
+            return None
+        _cv2 = cv2
+    return _cv2
+
+
+def video_supported():
+    return load_cv2() is not None
+
+
+def sample_step(frame_count, fps, sample_fps=VIDEO_SAMPLE_FPS, max_frames=VIDEO_MAX_FRAMES):
+    """Returns the distance, in frames, between frames considered for detection."""
+    step = max(1, int(round(fps / sample_fps))) if fps and fps > 0 else 1
+    if frame_count > 0 and frame_count / step > max_frames:
+        step = math.ceil(frame_count / max_frames)
+    return step
+
+
+def _resize(frame, max_side):
+    cv2 = load_cv2()
+    height, width = frame.shape[:2]
+    scale = max(height, width) / max_side
+    if scale <= 1:
+        return frame, 1.0
+    size = (int(round(width / scale)), int(round(height / scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), width / size[0]
+
+
+def _encode_segment(path, start, end, step, profile, motion_threshold, max_frames):
+    """
+    Runs in a pool worker: decodes frames [start, end) of a video, analyses
+    every `step`-th frame that moved enough since the last analysed one and
+    returns (analysed_count, [(frame_index, box, encoding), ...]).
+    """
+    cv2 = load_cv2()
+    face_recognition = face_recognition_api()
+    capture = cv2.VideoCapture(path)
+    faces, analysed, previous = [], 0, None
+    try:
+        if start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        index = start
+        while index < end and analysed < max_frames:
+            if (index - start) % step:
+                # Skipped frames are only grabbed, never converted
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            index += 1
+            small, scale = _resize(frame, profile.max_side)
+            thumb = cv2.resize(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (64, 64), interpolation=cv2.INTER_AREA)
+            if previous is not None and float(np.mean(cv2.absdiff(thumb, previous))) < motion_threshold:
+                continue
+            previous = thumb
+            analysed += 1
+            rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            locations = face_recognition.face_locations(rgb, profile.upsample, profile.detector)
+            if not locations:
+                continue
+            encodings = face_recognition.face_encodings(rgb, locations, profile.jitters, profile.landmarks)
+            height, width = frame.shape[:2]
+            boxes = scale_locations(locations, scale, width, height)
+            faces.extend((index - 1, box, enc.astype(np.float32)) for box, enc in zip(boxes, encodings))
+    finally:
+        capture.release()
+    return analysed, faces
+
+
+def encode_video(path, profile=None, max_frames=VIDEO_MAX_FRAMES):
+    """
+    Samples a video file and encodes the faces of the sampled frames. The
+    clip is split into contiguous segments that pool workers decode and
+    encode in parallel. Returns (analysed_frames, faces) with faces ordered
+    by frame, or None if the file cannot be decoded.
+    """
+    cv2 = load_cv2()
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            return None
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    finally:
+        capture.release()
+
+    profile = get_profile(profile)
+    step = sample_step(frame_count, fps, max_frames=max_frames)
+    if frame_count <= 0:
+        # Unknown length: decode sequentially up to the frame budget
+        segments = [(0, max_frames * step)]
+    else:
+        parts = max(1, min(FACE_WORKERS, math.ceil(frame_count / step)))
+        bounds = [round(frame_count * i / parts) for i in range(parts + 1)]
+        segments = [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+    per_segment = math.ceil(max_frames / len(segments))
+
+    pool = get_process_pool()
+    futures = [
+        pool.submit(_encode_segment, path, start, end, step, profile, VIDEO_MOTION_THRESHOLD, per_segment)
+        for start, end in segments
+    ]
+    analysed, faces = 0, []
+    for future in futures:
+        count, segment_faces = future.result()
+        analysed += count
+        faces.extend(segment_faces)
+    if analysed == 0:
+        return None
+    return analysed, faces
+
+
+def dedupe_faces(faces, threshold=VIDEO_DEDUPE_DISTANCE):
+    """
+    Groups sightings of the same person across frames. Each sighting joins
+    the nearest existing group whose mean encoding is within `threshold`,
+    otherwise starts a new one. Returns one dict per group with the mean
+    "encoding", the number of "frames" it was seen in and its first "frame"
+    and "box".
+    """
+    groups = []
+    sums = np.empty((0, 128), dtype=np.float32)
+    counts = np.empty(0, dtype=np.int64)
+    for frame_index, box, encoding in faces:
+        if len(groups):
+            distances = face_distance_matrix(sums / counts[:, None], encoding)[0]
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= threshold:
+                sums[nearest] += encoding
+                counts[nearest] += 1
+                continue
+        groups.append({"frame": frame_index, "box": list(box)})
+        sums = np.vstack([sums, encoding.reshape(1, 128)])
+        counts = np.append(counts, 1)
+    for group, total, count in zip(groups, sums, counts):
+        group["encoding"] = total / count
+        group["frames"] = int(count)
+    return groups
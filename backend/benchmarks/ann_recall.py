@@ -0,0 +1,99 @@
+"""
+Offline recall/latency benchmark for the school-wide ANN index.
+
+Compares IVFIndex at several nprobe settings against the exact
+face_recognition.face_distance baseline. Run from the backend directory:
+
+    python -m benchmarks.ann_recall --source mongo
+    python -m benchmarks.ann_recall --source synthetic --students 50000
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import face_recognition
+from benchmarks.common import DEFAULT_MONGO_URI, synthetic_encodings
+
+
+def load_mongo_encodings():
+    from app import db
+    from app.encoding_format import stack_encodings
+    students = list(db.users.find(
+        {"role": "student", "face_encoding": {"$exists": True}},
+        {"face_encoding": 1, "face_encoding_format": 1}
+    ))
+    ids = [s['_id'] for s in students]
+    return ids, stack_encodings(students)
+
+
+def make_queries(ids, matrix, count, noise, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.choice(len(ids), size=min(count, len(ids)), replace=False)
+    queries = matrix[picks] + rng.normal(0.0, noise, size=(len(picks), 128)).astype(np.float32)
+    return queries
+
+
+def exact_baseline(ids, matrix, queries):
+    started = time.perf_counter()
+    answers = [ids[int(np.argmin(face_recognition.face_distance(matrix, q)))] for q in queries]
+    elapsed = time.perf_counter() - started
+    return answers, elapsed / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["mongo", "synthetic"], default="synthetic")
+    parser.add_argument("--students", type=int, default=20000, help="synthetic index size")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.02, help="per-dimension noise added to query encodings")
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.source == "mongo":
+        ids, matrix = load_mongo_encodings()
+    else:
+        # Importing the app package builds its (lazy) Mongo client, which needs
+        # a database name even though the synthetic path never connects
+        os.environ.setdefault("MONGO_URI", DEFAULT_MONGO_URI)
+        ids, matrix = list(range(args.students)), synthetic_encodings(args.students, np.random.default_rng(args.seed))
+    from app.ann_index import IVFIndex
+    if not len(ids):
+        raise SystemExit("No encodings to benchmark.")
+
+    queries = make_queries(ids, matrix, args.queries, args.noise, args.seed)
+    truth, exact_latency = exact_baseline(ids, matrix, queries)
+
+    started = time.perf_counter()
+    index = IVFIndex(nlist=args.nlist, seed=args.seed).build(ids, matrix)
+    build_seconds = time.perf_counter() - started
+
+    rows = []
+    for nprobe in args.nprobe:
+        hits = 0
+        started = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            result = index.search(query, k=1, nprobe=nprobe)
+            hits += bool(result) and result[0][0] == expected
+        latency = (time.perf_counter() - started) / len(queries)
+        rows.append({
+            "nprobe": nprobe,
+            "recall_at_1": round(hits / len(queries), 4),
+            "latency_ms": round(latency * 1000, 3),
+            "speedup_vs_exact": round(exact_latency / latency, 2) if latency else None,
+        })
+
+    print(json.dumps({
+        "students": len(ids),
+        "queries": len(queries),
+        "nlist": len(index.centroids),
+        "build_seconds": round(build_seconds, 3),
+        "exact_latency_ms": round(exact_latency * 1000, 3),
+        "ivf": rows,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Shared setup for the benchmark suite: database selection, synthetic data
+and latency summaries. `connect` must run before anything from `app` other
+than the package itself is imported, because the app modules bind the
+database handle when they are first imported.
+"""
+import datetime
+import os
+import numpy as np
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/faceauth_benchmark"
+BENCHMARK_PASSWORD = "benchmark"
+SEEDED_COLLECTIONS = ("users", "courses", "attendance", "attendance_daily", "student_monthly")
+
+
+def add_database_arguments(parser):
+    parser.add_argument("--backend", choices=["mongomock", "mongo"], default="mongomock",
+                        help="in-memory mongomock stand-in or a real MongoDB")
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCHMARK_MONGO_URI", DEFAULT_MONGO_URI),
+                        help="database the benchmark may wipe (--backend mongo)")
+    parser.add_argument("--force", action="store_true",
+                        help="allow a --mongo-uri whose database name does not contain 'bench'")
+
+
+def connect(args):
+    """Points the app at the benchmark database and returns it."""
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+    if args.backend == "mongomock":
+        # mongomock ignores partial indexes, so the startup indexes cannot be built
+        os.environ["ENSURE_INDEXES"] = "false"
+        os.environ["MONGO_URI"] = DEFAULT_MONGO_URI
+        import mongomock  # optional: pip install mongomock
+        import app
+        app.client = mongomock.MongoClient()
+        app.db = app.client.get_database("faceauth_benchmark")
+        return app.db
+
+    os.environ["MONGO_URI"] = args.mongo_uri
+    import app
+    if "bench" not in app.db.name and not args.force:
+        raise SystemExit(f"Refusing to wipe database '{app.db.name}'; use a *bench* database or --force.")
+    return app.db
+
+
+def synthetic_encodings(count, rng):
+    # Real dlib encodings sit at roughly unit norm with ~0.1 spread per dimension
+    return rng.normal(0.0, 0.09, size=(count, 128)).astype(np.float32)
+
+
+def seed(db, courses=4, students_per_course=40, days=60, attendance_rate=0.9, seed=0, start=None):
+    """
+    Replaces the benchmark database contents with synthetic courses,
+    students (with encodings), teachers, an admin and `days` school days of
+    attendance, then rebuilds the rollups. Every account uses
+    BENCHMARK_PASSWORD. Returns a summary with the created ids.
+    """
+    from app import rollups
+    from app.encoding_format import encoding_fields
+    from app.student_search import search_fields
+    from app.passwords import make_hash
+
+    rng = np.random.default_rng(seed)
+    for name in SEEDED_COLLECTIONS:
+        db[name].delete_many({})
+
+    # One hash for everybody: seeding should not spend minutes in bcrypt
+    password = make_hash(BENCHMARK_PASSWORD)
+    course_ids = [f"BENCH{c:02d}" for c in range(courses)]
+    db.courses.insert_many([{"_id": c, "name": f"Benchmark course {c}"} for c in course_ids])
+    db.users.insert_one({"email": "admin@bench", "password": password, "role": "admin", "name": "Bench Admin"})
+    db.users.insert_many([
+        {"email": f"teacher{c}@bench", "password": password, "role": "teacher", "name": f"Bench Teacher {c}"}
+        for c in range(courses)
+    ])
+
+    encodings = synthetic_encodings(courses * students_per_course, rng)
+    students = []
+    for c, course_id in enumerate(course_ids):
+        for n in range(students_per_course):
+            students.append({
+                "name": f"Student {c}-{n}", "roll_no": f"B{c:02d}{n:05d}", "password": password,
+                "role": "student", "course_id": course_id,
+                **search_fields(f"Student {c}-{n}", f"B{c:02d}{n:05d}"),
+                **encoding_fields(encodings[c * students_per_course + n]),
+            })
+    db.users.insert_many(students)
+
+    start = start or datetime.date.today() - datetime.timedelta(days=days * 7 // 5 + 1)
+    school_days = []
+    day = start
+    while len(school_days) < days:
+        if day.weekday() < 5:
+            school_days.append(day)
+        day += datetime.timedelta(days=1)
+
+    batch = []
+    records = 0
+    for day in school_days:
+        date = day.isoformat()
+        typed_day = datetime.datetime(day.year, day.month, day.day)
+        present = rng.random(len(students)) < attendance_rate
+        for student, is_present in zip(students, present):
+            if is_present:
+                batch.append({"student_id": student["_id"], "course_id": student["course_id"],
+                              "date": date, "day": typed_day, "status": "Present"})
+        if len(batch) >= 10000:
+            db.attendance.insert_many(batch)
+            records += len(batch)
+            batch = []
+    if batch:
+        db.attendance.insert_many(batch)
+        records += len(batch)
+    rollups.rebuild()
+
+    # Drop whatever this process cached about the previous contents
+    from app.embedding_cache import embedding_cache
+    from app.response_cache import analytics_cache
+    from app.timeline import session_calendars
+    embedding_cache.invalidate()
+    analytics_cache.clear()
+    session_calendars.invalidate()
+
+    return {
+        "courses": course_ids,
+        "students": [s["_id"] for s in students],
+        "encodings": encodings,
+        "days": len(school_days),
+        "records": records,
+    }
+
+
+def summarize(samples):
+    """Latency summary, in milliseconds, of a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
@@ -0,0 +1,246 @@
+"""
+Load test: a morning burst of teachers taking attendance while students
+check their records.
+
+Every teacher logs in, then repeatedly marks attendance from a photo and
+opens the course analytics. Every student logs in and loads their daily and
+weekly attendance and their profile. Users start at random moments within
+--ramp seconds and run concurrently, one thread each.
+
+By default the app runs in-process on a seeded mongomock database. With
+--target the requests go over HTTP to a running server; seed its database
+first (or pass --skip-seed if it already holds the benchmark data):
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --teachers 8 --students 200 --ramp 10
+    python -m benchmarks.load_test --target http://localhost:5000 --backend mongo \\
+        --mongo-uri mongodb://localhost:27017/faceauth_benchmark
+
+The accounts follow the seed naming (teacher<c>@bench, roll numbers
+B<cc><nnnnn>, password "benchmark"), so --courses and --students-per-course
+must match the seeded data. Results are printed as JSON.
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from benchmarks.common import BENCHMARK_PASSWORD, add_database_arguments, connect, seed, summarize
+from benchmarks.micro import sample_image
+
+# Statuses that are a normal answer for the endpoint rather than a failure.
+# mark-attendance answers 404 when the photo has no face (as the default
+# synthetic image) or no enrolled one; an unreadable image is a 400 failure.
+EXPECTED_STATUSES = {
+    "mark-attendance": {200, 404},
+}
+
+
+class HttpClient:
+    """Talks to a running server at `base_url`."""
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, token=None, json_body=None, form=None, files=None):
+        headers = {}
+        data = None
+        if token:
+            headers["Authorization"] = "Bearer " + token
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif files is not None:
+            boundary = uuid.uuid4().hex
+            data = encode_multipart(boundary, form or {}, files)
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class InProcessClient:
+    """Calls the app through the Flask test client, one client per thread."""
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, json_body=None, form=None, files=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        headers = {"Authorization": "Bearer " + token} if token else {}
+        kwargs = {}
+        if json_body is not None:
+            kwargs["json"] = json_body
+        elif files is not None:
+            data = dict(form or {})
+            for field, (filename, content) in files.items():
+                data[field] = (io.BytesIO(content), filename)
+            kwargs["data"] = data
+            kwargs["content_type"] = "multipart/form-data"
+        response = client.open("/api" + path, method=method, headers=headers, **kwargs)
+        return response.status_code, response.get_data()
+
+
+def encode_multipart(boundary, fields, files):
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts)
+
+
+class Recorder:
+    """Collects per-endpoint latencies and statuses from all user threads."""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, name, client, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            status, body = client.request(*args, **kwargs)
+        except Exception as e:
+            status, body = type(e).__name__, b""
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][status] += 1
+            if status not in EXPECTED_STATUSES.get(name, {200}):
+                self.errors[name] += 1
+        return status, body
+
+    def login(self, client, identifier):
+        status, body = self.call("login", client, "POST", "/auth/login",
+                                 json_body={"identifier": identifier, "password": BENCHMARK_PASSWORD})
+        return json.loads(body)["access_token"] if status == 200 else None
+
+    def report(self, duration):
+        endpoints = {}
+        for name in sorted(self.latencies):
+            endpoints[name] = {
+                "requests": len(self.latencies[name]),
+                "errors": self.errors[name],
+                "statuses": {str(k): v for k, v in self.statuses[name].items()},
+                "throughput_rps": round(len(self.latencies[name]) / duration, 2),
+                "latency_ms": summarize(self.latencies[name]),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "duration_s": round(duration, 3),
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(total / duration, 2),
+            "latency_ms": summarize([s for samples in self.latencies.values() for s in samples]),
+            "endpoints": endpoints,
+        }
+
+
+def teacher(client, recorder, course_index, image, args, month):
+    course = f"BENCH{course_index:02d}"
+    token = recorder.login(client, f"teacher{course_index}@bench")
+    if token is None:
+        return
+    for _ in range(args.iterations):
+        recorder.call("mark-attendance", client, "POST", "/teacher/mark-attendance", token=token,
+                      form={"course_id": course, "mode": args.mode}, files={"live_image": ("capture.jpg", image)})
+        recorder.call("teacher-analytics", client, "GET", f"/teacher/analytics/{course}?month={month}", token=token)
+        time.sleep(args.think)
+
+
+def student(client, recorder, roll_no, args):
+    token = recorder.login(client, roll_no)
+    if token is None:
+        return
+    recorder.call("student-daily", client, "GET", "/student/attendance?view=daily", token=token)
+    time.sleep(args.think)
+    recorder.call("student-weekly", client, "GET", "/student/attendance?view=weekly", token=token)
+    recorder.call("profile", client, "GET", "/profile/me", token=token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running server, e.g. http://localhost:5000")
+    add_database_arguments(parser)
+    parser.add_argument("--skip-seed", action="store_true", help="use the benchmark data already in the database")
+    parser.add_argument("--courses", type=int, default=4)
+    parser.add_argument("--students-per-course", type=int, default=40)
+    parser.add_argument("--days", type=int, default=60, help="attendance history to seed, in school days")
+    parser.add_argument("--teachers", type=int, default=4, help="concurrent teachers (one course each, round robin)")
+    parser.add_argument("--students", type=int, default=80, help="concurrent students")
+    parser.add_argument("--iterations", type=int, default=5, help="photos each teacher submits")
+    parser.add_argument("--mode", choices=["single", "group"], default="single")
+    parser.add_argument("--image", help="photo to submit; defaults to a synthetic image with no face")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users arrive")
+    parser.add_argument("--think", type=float, default=0.2, help="pause between a user's requests, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.target and args.backend == "mongomock" and not args.skip_seed:
+        parser.error("a --target server cannot see the mongomock database; use --backend mongo or --skip-seed")
+
+    if not (args.target and args.skip_seed):
+        db = connect(args)
+    if not args.skip_seed:
+        seed(db, courses=args.courses, students_per_course=args.students_per_course, days=args.days, seed=args.seed)
+    if args.target:
+        client = HttpClient(args.target)
+    else:
+        from app import create_app
+        client = InProcessClient(create_app())
+
+    rng = random.Random(args.seed)
+    image = sample_image(args.image)
+    month = time.strftime("%Y-%m")
+    recorder = Recorder()
+    users = [
+        (teacher, (client, recorder, i % args.courses, image, args, month))
+        for i in range(args.teachers)
+    ] + [
+        (student, (client, recorder, f"B{c:02d}{n:05d}", args))
+        for c, n in (divmod(rng.randrange(args.courses * args.students_per_course), args.students_per_course)
+                     for _ in range(args.students))
+    ]
+
+    def run(target, user_args, delay):
+        time.sleep(delay)
+        target(*user_args)
+
+    threads = [
+        threading.Thread(target=run, args=(target, user_args, rng.uniform(0, args.ramp)), daemon=True)
+        for target, user_args in users
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    print(json.dumps({
+        "target": args.target or "in-process",
+        "teachers": args.teachers,
+        "students": args.students,
+        "ramp_s": args.ramp,
+        **recorder.report(duration),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
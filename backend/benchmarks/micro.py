@@ -0,0 +1,148 @@
+"""
+Microbenchmarks for the face pipeline and the analytics/report routes.
+
+    face      get_face_encoding on one image, and match_face / best_match
+              as the roster grows
+    routes    every analytics and report route, timed through the Flask
+              test client as the attendance history grows
+
+Runs against an in-memory mongomock stand-in by default, or a real MongoDB
+with --backend mongo. Run from the backend directory:
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro routes --days 20 60 180 --repeat 20
+    python -m benchmarks.micro face --image path/to/portrait.jpg --rosters 30 300 3000
+
+--image takes any photo with exactly one face, such as a student's
+enrolment photo. Without it the face suite uses a generated image with no
+face in it, which only times detection. Results are printed as JSON.
+"""
+import argparse
+import io
+import json
+import time
+import numpy as np
+from benchmarks.common import add_database_arguments, connect, seed, summarize
+
+
+def sample_image(path=None):
+    if path:
+        with open(path, "rb") as image:
+            return image.read()
+    # No face in it, so only the detection stage is measured
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray((rng.random((960, 1280, 3)) * 255).astype(np.uint8)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def bench_face(args):
+    from app.services import get_face_encoding, match_face, best_match
+    from benchmarks.common import synthetic_encodings
+
+    image = sample_image(args.image)
+    encoding = get_face_encoding(io.BytesIO(image))
+    result = {
+        "image": args.image or "synthetic (no face)",
+        "face_found": encoding is not None,
+        "get_face_encoding": time_call(lambda: get_face_encoding(io.BytesIO(image)), args.repeat),
+        "rosters": [],
+    }
+    rng = np.random.default_rng(args.seed)
+    query = encoding if encoding is not None else synthetic_encodings(1, rng)[0]
+    for size in args.rosters:
+        roster = synthetic_encodings(size, rng)
+        result["rosters"].append({
+            "students": size,
+            "best_match": time_call(lambda: best_match(roster, [query]), max(args.repeat, 50)),
+            "match_face": time_call(lambda: match_face(roster, io.BytesIO(image)), args.repeat),
+        })
+    return result
+
+
+ROUTES = [
+    ("admin", "/api/admin/analytics"),
+    ("teacher", "/api/teacher/analytics/{course}?month={month}"),
+    ("student", "/api/student/attendance?view=daily"),
+    ("student", "/api/student/attendance?view=weekly"),
+    ("student", "/api/student/attendance?view=monthly&month={month}"),
+    ("admin", "/api/admin/student-analytics/{student}?view=weekly"),
+    ("teacher", "/api/teacher/report/{course}?month={month}"),
+    ("teacher", "/api/teacher/report/{course}?month={month}&format=csv"),
+    ("admin", "/api/admin/full-report?month={month}&courses={courses}&format=csv"),
+]
+
+
+def bench_routes(args, db):
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from app.response_cache import analytics_cache
+
+    flask_app = create_app()
+    client = flask_app.test_client()
+    if not args.with_cache:
+        analytics_cache.max_entries = 0
+
+    results = []
+    for days in args.days:
+        data = seed(db, courses=args.courses, students_per_course=args.students, days=days, seed=args.seed)
+        student = str(data["students"][0])
+        month = db.attendance_daily.find_one(sort=[("date", -1)])["date"][:7]
+        with flask_app.app_context():
+            headers = {
+                role: {"Authorization": "Bearer " + create_access_token(identity=identity, additional_claims={"role": role})}
+                for role, identity in (("admin", "admin"), ("teacher", "teacher"), ("student", student))
+            }
+        routes = []
+        for role, template in ROUTES:
+            path = template.format(course=data["courses"][0], courses=",".join(data["courses"]), month=month, student=student)
+            status = client.get(path, headers=headers[role]).status_code
+            routes.append({
+                "route": path.split("?")[0].replace(data["courses"][0], "<course_id>").replace(student, "<student_id>"),
+                "query": path.partition("?")[2].replace(month, "<month>").replace(",".join(data["courses"]), "<course_ids>"),
+                "status": status,
+                "latency_ms": time_call(lambda: client.get(path, headers=headers[role]).get_data(), args.repeat),
+            })
+        results.append({"days": data["days"], "attendance_records": data["records"], "routes": routes})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("suite", nargs="*", help="face and/or routes (default: both)")
+    add_database_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--image", help="photo with exactly one face for the face suite")
+    parser.add_argument("--rosters", type=int, nargs="+", default=[30, 300, 3000, 30000])
+    parser.add_argument("--courses", type=int, default=4)
+    parser.add_argument("--students", type=int, default=40, help="students per course for the routes suite")
+    parser.add_argument("--days", type=int, nargs="+", default=[20, 60, 180], help="history sizes, in school days")
+    parser.add_argument("--with-cache", action="store_true", help="keep the analytics response cache enabled")
+    args = parser.parse_args()
+    suites = args.suite or ["face", "routes"]
+    unknown = set(suites) - {"face", "routes"}
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+
+    db = connect(args)
+    output = {"backend": args.backend}
+    if "face" in suites:
+        output["face"] = bench_face(args)
+    if "routes" in suites:
+        output["routes"] = bench_routes(args, db)
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
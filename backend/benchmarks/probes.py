@@ -0,0 +1,103 @@
+"""
+Match accuracy and latency at scale, using the labelled probe set written by
+full_mock_data_generator.py. Every probe is matched the way the API matches
+a face:
+
+    course    against its course roster from the embedding cache, as
+              /teacher/mark-attendance does (impostors try a random course)
+    school    against the school-wide index, as /kiosk/identify does
+
+Runs against the database in MONGO_URI. From the backend directory:
+
+    python full_mock_data_generator.py --students 100000 --courses 200
+    python -m benchmarks.probes probes.npz
+    python -m benchmarks.probes probes.npz --paths school --nprobe 4 8 16
+"""
+import argparse
+import json
+import time
+import numpy as np
+from bson import ObjectId
+from app.embedding_cache import embedding_cache
+from app.ann_index import school_index
+from app.services import match_encodings, MATCH_TOLERANCE, MATCH_MARGIN
+from benchmarks.common import summarize
+
+
+def score(outcomes, latencies, warmup):
+    """outcomes holds (expected_id or None, matched_id or None, ambiguous) per probe."""
+    enrolled = [o for o in outcomes if o[0] is not None]
+    impostors = [o for o in outcomes if o[0] is None]
+    return {
+        "probes": len(outcomes),
+        "accuracy": round(sum(o[1] == o[0] for o in enrolled) / len(enrolled), 4) if enrolled else None,
+        "false_match_rate": round(sum(o[1] is not None and o[1] != o[0] for o in outcomes) / len(outcomes), 4),
+        "impostor_rejection": round(sum(o[1] is None for o in impostors) / len(impostors), 4) if impostors else None,
+        "ambiguous_rate": round(sum(o[2] for o in outcomes) / len(outcomes), 4),
+        "warmup_s": round(warmup, 3),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def course_path(encodings, expected, courses, rng):
+    started = time.perf_counter()
+    for course_id in set(courses) - {""}:
+        embedding_cache.get(course_id)
+    warmup = time.perf_counter() - started
+    known = sorted(set(courses) - {""})
+    outcomes, latencies = [], []
+    for query, student_id, course_id in zip(encodings, expected, courses):
+        course_id = course_id or known[rng.integers(len(known))]
+        started = time.perf_counter()
+        roster = embedding_cache.get(course_id)
+        result = match_encodings(roster.matrix, [query])[0]
+        latencies.append(time.perf_counter() - started)
+        matched = roster.student_ids[result["index"]] if result["status"] == "matched" else None
+        outcomes.append((student_id, matched, result["status"] == "ambiguous"))
+    return score(outcomes, latencies, warmup)
+
+
+def school_path(encodings, expected, nprobe):
+    started = time.perf_counter()
+    school_index.get()
+    warmup = time.perf_counter() - started
+    outcomes, latencies = [], []
+    for query, student_id in zip(encodings, expected):
+        started = time.perf_counter()
+        candidates = school_index.search(query, k=2, nprobe=nprobe)
+        latencies.append(time.perf_counter() - started)
+        matched, ambiguous = None, False
+        if candidates and candidates[0][1] <= MATCH_TOLERANCE:
+            second = candidates[1][1] if len(candidates) > 1 else np.inf
+            ambiguous = second <= MATCH_TOLERANCE and second - candidates[0][1] < MATCH_MARGIN
+            matched = None if ambiguous else candidates[0][0]
+        outcomes.append((student_id, matched, ambiguous))
+    return score(outcomes, latencies, warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("probe_file", help="probes.npz from full_mock_data_generator.py")
+    parser.add_argument("--paths", nargs="+", default=["course", "school"], help="course and/or school")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[None], help="IVF partitions scanned (school path)")
+    parser.add_argument("--limit", type=int, help="use only the first N probes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    probes = np.load(args.probe_file)
+    encodings = probes["encodings"][:args.limit]
+    expected = [ObjectId(s) if s else None for s in probes["student_ids"][:args.limit]]
+    courses = [str(c) for c in probes["course_ids"][:args.limit]]
+
+    output = {"probe_file": args.probe_file, "probes": len(encodings), "impostors": expected.count(None)}
+    if "course" in args.paths:
+        output["course"] = course_path(encodings, expected, courses, np.random.default_rng(args.seed))
+    if "school" in args.paths:
+        output["school"] = [
+            {"nprobe": nprobe, **school_path(encodings, expected, nprobe)} for nprobe in args.nprobe
+        ]
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
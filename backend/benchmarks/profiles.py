@@ -0,0 +1,141 @@
+"""
+Latency/accuracy benchmark for the recognition speed profiles.
+
+Expects a labelled image set with one directory per person:
+
+    faces/
+        alice/ 01.jpg 02.jpg ...
+        bob/   01.jpg ...
+
+The first image of each person (by name) is enrolled, the rest are used as
+probes. Every probe is detected, encoded and matched against the enrolled
+gallery with each profile. Run from the backend directory:
+
+    python -m benchmarks.profiles faces/
+    python -m benchmarks.profiles faces/ --profiles fast balanced --enroll-profile accurate
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from app.services import PROFILES, ENROLL_PROFILE, detect_and_encode, match_encodings, get_profile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_image_set(root):
+    people = {}
+    for person in sorted(os.listdir(root)):
+        folder = os.path.join(root, person)
+        if not os.path.isdir(folder):
+            continue
+        images = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if images:
+            people[person] = images
+    return people
+
+
+def timed_encode(path, profile):
+    with open(path, "rb") as image:
+        started = time.perf_counter()
+        locations, encodings = detect_and_encode(image, profile=profile)
+        return locations, encodings, time.perf_counter() - started
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else None
+
+
+def enroll(people, profile):
+    labels, rows, latencies, failed = [], [], [], []
+    for person, images in people.items():
+        locations, encodings, elapsed = timed_encode(images[0], profile)
+        latencies.append(elapsed)
+        if len(encodings) != 1:
+            failed.append(person)
+            continue
+        labels.append(person)
+        rows.append(np.asarray(encodings[0], dtype=np.float32))
+    matrix = np.vstack(rows) if rows else np.empty((0, 128), dtype=np.float32)
+    return labels, matrix, latencies, failed
+
+
+def evaluate(people, labels, gallery, profile):
+    latencies = []
+    probes = detected = correct = wrong = 0
+    for person, images in people.items():
+        for path in images[1:]:
+            probes += 1
+            locations, encodings, elapsed = timed_encode(path, profile)
+            latencies.append(elapsed)
+            if not encodings:
+                continue
+            detected += 1
+            if not len(gallery):
+                continue
+            # A probe is one person: judge the largest face in it
+            areas = [(bottom - top) * (right - left) for top, right, bottom, left in locations]
+            result = match_encodings(gallery, [encodings[areas.index(max(areas))]])[0]
+            if result["status"] != "matched":
+                continue
+            if labels[result["index"]] == person:
+                correct += 1
+            else:
+                wrong += 1
+    return {
+        "probes": probes,
+        "detection_rate": round(detected / probes, 4) if probes else None,
+        "accuracy": round(correct / probes, 4) if probes else None,
+        "false_match_rate": round(wrong / probes, 4) if probes else None,
+        "latency_ms": {
+            "mean": round(float(np.mean(latencies)) * 1000, 2) if latencies else None,
+            "p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "p95": round(percentile(latencies, 95), 2) if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="directory with one sub-directory of images per person")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--enroll-profile", default=ENROLL_PROFILE, choices=list(PROFILES) + ["same"],
+                        help="profile used to encode the gallery; 'same' enrolls with each tested profile")
+    args = parser.parse_args()
+
+    people = load_image_set(args.images)
+    if not people:
+        raise SystemExit("No labelled images found.")
+
+    shared_gallery = None
+    if args.enroll_profile != "same":
+        shared_gallery = enroll(people, get_profile(args.enroll_profile))
+
+    rows = []
+    for name in args.profiles:
+        profile = get_profile(name)
+        labels, gallery, enroll_latencies, failed = shared_gallery or enroll(people, profile)
+        row = {"profile": name, **profile._asdict()}
+        row.pop("name")
+        row["enrolled"] = len(labels)
+        row["enroll_failures"] = failed
+        if shared_gallery is None:
+            row["enroll_latency_ms"] = round(float(np.mean(enroll_latencies)) * 1000, 2)
+        row.update(evaluate(people, labels, gallery, profile))
+        rows.append(row)
+
+    print(json.dumps({
+        "people": len(people),
+        "images": sum(len(images) for images in people.values()),
+        "enroll_profile": args.enroll_profile,
+        "enroll_latency_ms": round(float(np.mean(shared_gallery[2])) * 1000, 2) if shared_gallery else None,
+        "profiles": rows,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
+"""
+Populates the database with mock students, face encodings and attendance.
+
+Students get clustered synthetic 128-d face encodings: every student is a
+random offset from one of a few "look-alike" cluster centres, so nearest
+neighbours are realistically close. A labelled probe set of noisy copies of
+enrolled encodings (plus unenrolled impostors) is written next to it for
+benchmarks.probes. Students and their attendance are generated and inserted
+in chunks by parallel worker processes, so memory stays flat at any scale.
+
+    python full_mock_data_generator.py
+    python full_mock_data_generator.py --students 100000 --courses 200 --days 1095 --workers 8
+"""
+import argparse
 import os
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+import numpy as np
+from bson import ObjectId
 from pymongo import MongoClient
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-import random
 import bcrypt
 
 # --- Configuration ---
-# You can customize the mock data generation here
+# Defaults for the command line options below
 CONFIG = {
-    "clear_existing_data": True,  # Set to False if you want to add to existing data
     "num_students_per_course": 20, # Increased number of students per course
     "num_days_of_attendance": 30,
     "attendance_chance": 0.92,  # Slightly varied the attendance chance
@@ -32,31 +49,148 @@ CONFIG = {
         "Rhea Pillai", "Zoya Hussain", "Mihir Khanna", "Dev Shah", "Anaya Singh"
     ]
 }
+PASSWORD = "password123"  # Common password for all mock students
+
+# Spread of synthetic encodings, per dimension. With 128 dimensions two
+# encodings drawn with spread s are about 16 * s apart, so students land
+# ~0.75 from cluster-mates and ~1.0 from other clusters (dlib's range for
+# different people), and probes ~0.35 from their student (the same person).
+CLUSTER_SPREAD = 0.045
+STUDENT_SPREAD = 0.047
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, help="total students (default: %d per course)" % CONFIG["num_students_per_course"])
+    parser.add_argument("--courses", type=int, default=len(CONFIG["courses_to_create"]),
+                        help="courses; beyond the built-in ones they are named C0009, C0010, ...")
+    parser.add_argument("--days", type=int, default=CONFIG["num_days_of_attendance"],
+                        help="calendar days of attendance ending today; weekends are skipped (1095 = 3 years)")
+    parser.add_argument("--attendance-chance", type=float, default=CONFIG["attendance_chance"])
+    parser.add_argument("--keep-existing", action="store_true", help="add to the existing students and attendance")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel insert processes")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="documents per insert_many")
+    parser.add_argument("--students-per-task", type=int, default=2000, help="students generated by one worker task")
+    parser.add_argument("--clusters", type=int, default=0, help="look-alike clusters; 0 picks about sqrt(students)")
+    parser.add_argument("--no-encodings", action="store_true", help="create students without face encodings")
+    parser.add_argument("--probes", type=int, default=1000, help="labelled probe encodings to write; 0 skips")
+    parser.add_argument("--probe-noise", type=float, default=0.03, help="per-dimension noise of a probe")
+    parser.add_argument("--impostor-rate", type=float, default=0.1, help="share of probes from unenrolled people")
+    parser.add_argument("--probe-file", default="probes.npz")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.students is None:
+        args.students = args.courses * CONFIG["num_students_per_course"]
+    return args
+
+
+def course_list(count):
+    courses = CONFIG["courses_to_create"][:count]
+    for n in range(len(courses), count):
+        courses.append({"_id": f"C{n + 1:04d}", "name": f"Mock Course {n + 1}"})
+    return courses
+
+
+def school_days(days):
+    today = datetime.now()
+    dates = []
+    for day_offset in range(days):
+        current_date = today - timedelta(days=day_offset)
+        # Skip weekends
+        if current_date.weekday() < 5:
+            dates.append(current_date.strftime("%Y-%m-%d"))
+    return dates
+
 
-# --- Script Starts ---
-load_dotenv()
-print("🚀 Starting full mock data generation...")
+def student_encodings(rng, centres, count):
+    clusters = rng.integers(len(centres), size=count)
+    noise = rng.normal(0.0, STUDENT_SPREAD, size=(count, 128))
+    return (centres[clusters] + noise).astype(np.float32)
 
-# 1. Connect to the database
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    print("❌ ERROR: MONGO_URI not found in .env file.")
-    exit()
 
-try:
-    client = MongoClient(MONGO_URI)
-    db = client.get_database()
-    db.command('ping')
-    print("✅ Database connection successful.")
-except Exception as e:
-    print(f"❌ ERROR: Could not connect to MongoDB. Details: {e}")
-    exit()
+def generate_chunk(task):
+    """
+    Runs in a worker process: creates students [start, end) with their
+    encodings and attendance, inserting every `chunk_size` documents.
+    Returns (students, records, probe_rows) where probe_rows pair a student's
+    encoding with its label.
+    """
+    from app.encoding_format import encoding_fields
+    from app.student_search import search_fields
+    start, end, options = task
+    rng = np.random.default_rng([options["seed"], start])
+    pick = random.Random(f"{options['seed']}-{start}")
+    db = MongoClient(options["mongo_uri"]).get_database()
+    courses, dates, chunk_size = options["courses"], options["dates"], options["chunk_size"]
 
+    count = end - start
+    encodings = None if options["no_encodings"] else student_encodings(rng, options["centres"], count)
+    students = []
+    for i in range(count):
+        index = start + i
+        student = {
+            "_id": ObjectId(),
+            "name": pick.choice(CONFIG["student_names"]),
+            "roll_no": f"S{options['roll_start'] + index}",
+            "password": options["password"],
+            "role": "student",
+            "course_id": courses[index * len(courses) // options["total"]],
+        }
+        student.update(search_fields(student["name"], student["roll_no"]))
+        if encodings is not None:
+            student.update(encoding_fields(encodings[i]))
+        students.append(student)
+    for offset in range(0, count, chunk_size):
+        db.users.insert_many(students[offset:offset + chunk_size], ordered=False)
 
-def generate_full_mock_data():
+    records, batch = 0, []
+    for date in dates:
+        day = datetime.strptime(date, "%Y-%m-%d")
+        present = rng.random(count) < options["attendance_chance"]
+        for student, is_present in zip(students, present):
+            if is_present:
+                batch.append({"student_id": student["_id"], "course_id": student["course_id"],
+                              "date": date, "day": day, "status": "Present"})
+        if len(batch) >= chunk_size:
+            db.attendance.insert_many(batch, ordered=False)
+            records += len(batch)
+            batch = []
+    if batch:
+        db.attendance.insert_many(batch, ordered=False)
+        records += len(batch)
+
+    probe_rows = []
+    if encodings is not None and options["probes_per_student"] > 0:
+        wanted = rng.binomial(count, min(1.0, options["probes_per_student"]))
+        for i in rng.choice(count, size=min(wanted, count), replace=False):
+            student = students[i]
+            probe_rows.append((encodings[i], str(student["_id"]), student["roll_no"], student["course_id"]))
+    db.client.close()
+    return count, records, probe_rows
+
+
+def write_probes(path, rows, impostors):
+    """
+    Saves the probe set: `encodings` (n, 128) float32 and, per probe, the
+    enrolled `student_ids`, `roll_nos` and `course_ids` it should match.
+    Impostors have empty labels and should match nobody.
+    """
+    labels = [row[1:] for row in rows] + [("", "", "")] * len(impostors)
+    matrix = np.vstack([np.array([row[0] for row in rows], dtype=np.float32).reshape(-1, 128), impostors])
+    np.savez_compressed(
+        path,
+        encodings=matrix.astype(np.float32),
+        student_ids=np.array([label[0] for label in labels]),
+        roll_nos=np.array([label[1] for label in labels]),
+        course_ids=np.array([label[2] for label in labels]),
+    )
+
+
+def generate_full_mock_data(args, db, mongo_uri):
     """Clears, creates, and populates student and attendance data."""
+    started = time.perf_counter()
 
-    if CONFIG["clear_existing_data"]:
+    if not args.keep_existing:
         print("\n🧹 Clearing existing data...")
         # Clear only mockable data, leave admins/teachers alone
         db.users.delete_many({"role": "student"})
@@ -65,76 +199,92 @@ def generate_full_mock_data():
 
     # 2. Create courses if they don't exist
     print("\n📚 Setting up courses...")
-    for course in CONFIG["courses_to_create"]:
+    courses = course_list(args.courses)
+    for course in courses:
         # update_one with upsert=True inserts if not found, updates if found
         db.courses.update_one({"_id": course["_id"]}, {"$set": {"name": course["name"]}}, upsert=True)
-    print(f"   Ensured {len(CONFIG['courses_to_create'])} courses exist.")
-
-    # 3. Create new students
-    print("\n🧑‍🎓 Creating new students...")
-    new_students = []
-    password = "password123"  # Common password for all mock students
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    name_pool = CONFIG["student_names"][:]  # Create a mutable copy
-    student_roll_start = 100
-
-    for course in CONFIG["courses_to_create"]:
-        for i in range(CONFIG["num_students_per_course"]):
-            if not name_pool:
-                print("   Warning: Ran out of unique names. Reusing names.")
-                name_pool = CONFIG["student_names"][:] # Reset pool if empty
-
-            student_name = random.choice(name_pool)
-            name_pool.remove(student_name) # Ensure unique names for now
-            roll_no = f"S{student_roll_start}"
-            student_roll_start += 1
-
-            student_doc = {
-                "name": student_name,
-                "roll_no": roll_no,
-                "password": hashed_password,
-                "role": "student",
-                "course_id": course["_id"],
-                # Face encoding would be added via the app, skipping here
-            }
-            new_students.append(student_doc)
-
-    if new_students:
-        db.users.insert_many(new_students)
-        print(f"   Successfully created {len(new_students)} new students.")
-        print(f"   Default password for all new students is: {password}")
-
-    # 4. Generate attendance for the new students
-    print("\n🗓️  Generating attendance records...")
-    students_from_db = list(db.users.find({"role": "student"}))
-    records_to_insert = []
-    today = datetime.now()
+    print(f"   Ensured {len(courses)} courses exist.")
 
-    for day_offset in range(CONFIG["num_days_of_attendance"]):
-        current_date = today - timedelta(days=day_offset)
-        # Skip weekends
-        if current_date.weekday() >= 5:
-            continue
-        
-        date_str = current_date.strftime("%Y-%m-%d")
+    # 3. Create students, face encodings and attendance in parallel chunks
+    dates = school_days(args.days)
+    print(f"\n🧑‍🎓 Creating {args.students} students with {len(dates)} school days of attendance "
+          f"using {args.workers} workers...")
+    rng = np.random.default_rng(args.seed)
+    clusters = args.clusters or max(1, int(args.students ** 0.5))
+    centres = rng.normal(0.0, CLUSTER_SPREAD, size=(clusters, 128)).astype(np.float32)
+    enrolled_probes = int(round(args.probes * (1 - args.impostor_rate)))
+    options = {
+        "mongo_uri": mongo_uri,
+        # Continue after existing mock students so roll numbers stay unique
+        "roll_start": 100 + db.users.count_documents({"role": "student"}),
+        "seed": args.seed,
+        "total": args.students,
+        "courses": [course["_id"] for course in courses],
+        "dates": dates,
+        "attendance_chance": args.attendance_chance,
+        "chunk_size": args.chunk_size,
+        "no_encodings": args.no_encodings,
+        "centres": centres,
+        "password": bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()),
+        "probes_per_student": enrolled_probes / args.students if args.students else 0,
+    }
+    tasks = [
+        (start, min(start + args.students_per_task, args.students), options)
+        for start in range(0, args.students, args.students_per_task)
+    ]
 
-        for student in students_from_db:
-            if 'course_id' in student and random.random() < CONFIG["attendance_chance"]:
-                record = {
-                    "student_id": student["_id"],
-                    "course_id": student["course_id"],
-                    "date": date_str,
-                    "status": "Present"
-                }
-                records_to_insert.append(record)
+    students = records = 0
+    probe_rows = []
+    with Pool(max(1, args.workers)) as pool:
+        for count, inserted, rows in pool.imap_unordered(generate_chunk, tasks):
+            students += count
+            records += inserted
+            probe_rows.extend(rows)
+            print(f"   {students}/{args.students} students, {records} attendance records "
+                  f"({time.perf_counter() - started:.0f}s)")
+    print(f"   Default password for all new students is: {PASSWORD}")
 
-    if records_to_insert:
-        db.attendance.insert_many(records_to_insert)
-        print(f"   Successfully inserted {len(records_to_insert)} attendance records.")
+    # 4. Labelled probe set for match accuracy and latency benchmarks
+    if args.probes and not args.no_encodings:
+        impostors = student_encodings(rng, centres, args.probes - enrolled_probes)
+        probe_rng = np.random.default_rng(args.seed + 1)
+        for row in range(len(probe_rows)):
+            noise = probe_rng.normal(0.0, args.probe_noise, size=128).astype(np.float32)
+            probe_rows[row] = (probe_rows[row][0] + noise,) + probe_rows[row][1:]
+        write_probes(args.probe_file, probe_rows, impostors)
+        print(f"\n🎯 Wrote {len(probe_rows)} enrolled and {len(impostors)} impostor probes to {args.probe_file}")
 
-    print("\n✨ Full mock data generation complete!")
+    # 5. Analytics read from rollups, so recompute them from the new records
+    print("\n📊 Rebuilding attendance rollups...")
+    from app import rollups
+    daily, monthly = rollups.rebuild()
+    print(f"   Wrote {daily} course-day and {monthly} student-month rollups.")
 
+    print(f"\n✨ Full mock data generation complete in {time.perf_counter() - started:.0f}s!")
 
-if __name__ == "__main__":
-    generate_full_mock_data()
 
+def main():
+    args = parse_args()
+    load_dotenv()
+    print("🚀 Starting full mock data generation...")
+
+    # 1. Connect to the database
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("❌ ERROR: MONGO_URI not found in .env file.")
+        exit()
+
+    try:
+        client = MongoClient(mongo_uri)
+        db = client.get_database()
+        db.command('ping')
+        print("✅ Database connection successful.")
+    except Exception as e:
+        print(f"❌ ERROR: Could not connect to MongoDB. Details: {e}")
+        exit()
+
+    generate_full_mock_data(args, db, mongo_uri)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+gunicorn settings for the API. Run from the backend directory:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers come from WEB_CONCURRENCY (gunicorn's own variable); every other
+gunicorn setting can still be passed on the command line. Jobs and live
+sessions of the default in-process backends live in one worker's memory and
+gunicorn has no sticky routing, so with several workers jobs default to the
+mongo backend and live sessions are turned off (see wsgi.start_worker).
+"""
+import os
+import time
+
+_started = time.perf_counter()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+if workers > 1:
+    # Read when the app is imported below, so a job can be polled through any worker
+    os.environ.setdefault("JOB_BACKEND", "mongo")
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# Face, video and report requests can take well over the default 30 seconds
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Import the app (and the face models) once in the master; workers share them copy-on-write.
+# pymongo resets the MongoClient in each child after the fork.
+preload_app = True
+
+
+def when_ready(server):
+    server.log.info("Master ready in %.2fs", time.perf_counter() - _started)
+
+
+def post_fork(server, worker):
+    from wsgi import start_worker
+    server.log.info("Worker %s ready in %.2fs", worker.pid, start_worker(server.cfg.workers))
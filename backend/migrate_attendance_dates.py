@@ -0,0 +1,55 @@
+import argparse
+import datetime
+import os
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+client = MongoClient(MONGO_URI)
+db = client.get_database()
+
+# Records written before the typed `day` field existed
+PENDING_FILTER = {"day": {"$exists": False}, "date": {"$type": "string"}}
+
+
+def migrate(batch_size):
+    """
+    Adds a typed `day` datetime to attendance records that only have the
+    "%Y-%m-%d" `date` string. Migrated records no longer match PENDING_FILTER,
+    so the script can be stopped and re-run to resume.
+    """
+    remaining = db.attendance.count_documents(PENDING_FILTER)
+    print(f"Found {remaining} attendance records without a typed day.")
+
+    migrated, skipped = 0, 0
+    last_id = None
+    while True:
+        query = dict(PENDING_FILTER)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.attendance.find(query, {"date": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        operations = []
+        for record in batch:
+            try:
+                day = datetime.datetime.strptime(record["date"].strip(), "%Y-%m-%d")
+            except ValueError:
+                skipped += 1
+                continue
+            operations.append(UpdateOne({"_id": record["_id"]}, {"$set": {"day": day}}))
+        if operations:
+            migrated += db.attendance.bulk_write(operations, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+        print(f"Migrated {migrated}/{remaining}...")
+
+    print(f"Done. Migrated {migrated} records, skipped {skipped} with unparseable dates.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the typed `day` field on attendance records.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    migrate(args.batch_size)
@@ -0,0 +1,62 @@
+import argparse
+import os
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+from app.encoding_format import encoding_fields, document_encoding
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+client = MongoClient(MONGO_URI)
+db = client.get_database()
+
+# Legacy encodings are stored as BSON arrays of doubles
+LEGACY_FILTER = {"face_encoding": {"$type": "array"}}
+
+
+def migrate(batch_size, dry_run=False):
+    """
+    Converts face encodings stored as arrays of doubles to packed float32
+    Binary. Converted documents no longer match LEGACY_FILTER, so the script
+    can be stopped at any point and simply run again to resume.
+    """
+    remaining = db.users.count_documents(LEGACY_FILTER)
+    print(f"Found {remaining} users with legacy face encodings.")
+    if dry_run or remaining == 0:
+        return
+
+    converted = 0
+    last_id = None
+    while True:
+        query = dict(LEGACY_FILTER)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.users.find(query, {"face_encoding": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        operations = []
+        for user in batch:
+            try:
+                encoding = document_encoding(user)
+            except ValueError as e:
+                # Left as it is; the student needs to be enrolled again
+                print(f"Error converting face encoding: {e}")
+                continue
+            # Re-check the type so a concurrent re-enrollment is never overwritten
+            operations.append(UpdateOne({"_id": user["_id"], **LEGACY_FILTER}, {"$set": encoding_fields(encoding)}))
+        if not operations:
+            continue
+        result = db.users.bulk_write(operations, ordered=False)
+        converted += result.modified_count
+        print(f"Converted {converted}/{remaining}...")
+
+    print(f"Done. Converted {converted} face encodings.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored face encodings to packed float32 Binary.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="only count documents that need converting")
+    args = parser.parse_args()
+    migrate(args.batch_size, args.dry_run)
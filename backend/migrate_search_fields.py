@@ -0,0 +1,43 @@
+import argparse
+from pymongo import UpdateOne
+from app import db
+from app.student_search import search_fields, SEARCH_NAME, SEARCH_ROLL_NO
+
+# Students written before the normalised search fields existed
+PENDING_FILTER = {"role": "student", "$or": [{SEARCH_NAME: {"$exists": False}}, {SEARCH_ROLL_NO: {"$exists": False}}]}
+
+
+def migrate(batch_size):
+    """
+    Adds the normalised search_name and search_roll_no used by the student
+    search to students that lack them. Migrated students no longer match
+    PENDING_FILTER, so the script can be stopped and re-run to resume.
+    """
+    remaining = db.users.count_documents(PENDING_FILTER)
+    print(f"Found {remaining} students without search fields.")
+
+    migrated = 0
+    last_id = None
+    while True:
+        query = dict(PENDING_FILTER)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.users.find(query, {"name": 1, "roll_no": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        operations = [
+            UpdateOne({"_id": student["_id"]}, {"$set": search_fields(student.get("name", ""), student.get("roll_no", ""))})
+            for student in batch
+        ]
+        migrated += db.users.bulk_write(operations, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+        print(f"Migrated {migrated}/{remaining}...")
+
+    print(f"Done. Migrated {migrated} students.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the normalised student search fields.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    migrate(args.batch_size)
@@ -0,0 +1,23 @@
+import argparse
+from app import rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the attendance rollup collections from raw attendance.")
+    parser.add_argument("--verify", action="store_true", help="only compare the stored rollups with a fresh recomputation")
+    args = parser.parse_args()
+
+    if args.verify:
+        mismatches = rollups.verify()
+        for collection, key, stored, expected in mismatches[:50]:
+            print(f"{collection} {key}: stored={stored} expected={expected}")
+        print(f"{len(mismatches)} mismatches found.")
+        raise SystemExit(1 if mismatches else 0)
+
+    print("Rebuilding attendance rollups...")
+    daily, monthly = rollups.rebuild()
+    print(f"Done. Wrote {daily} course-day and {monthly} student-month rollups.")
+
+
+if __name__ == "__main__":
+    main()
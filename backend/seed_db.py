@@ -2,6 +2,7 @@ import os
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import bcrypt
+from app.student_search import search_fields
 
 load_dotenv()
 
@@ -25,7 +26,7 @@ def seed():
     users = [
         {"email": "admin@example.com", "password": hashed_password, "role": "admin", "name": "Admin User"},
         {"email": "teacher@example.com", "password": hashed_password, "role": "teacher", "name": "Teacher Bob"},
-        {"roll_no": "S001", "password": hashed_password, "role": "student", "name": "Student Alice", "course_id": "CS101"},
+        {"roll_no": "S001", "password": hashed_password, "role": "student", "name": "Student Alice", "course_id": "CS101", **search_fields("Student Alice", "S001")},
     ]
     db.users.insert_many(users)
     print(f"Inserted {len(users)} users.")
@@ -0,0 +1,53 @@
+"""
+Shared fixtures. The app runs against an in-memory mongomock database, so
+the tests need neither a MongoDB server nor the face models.
+"""
+import os
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost/faceauth_test")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-for-the-test-suite-only")
+os.environ["ENSURE_INDEXES"] = "false"
+os.environ["METRICS_ENABLED"] = "false"
+
+import app as app_package
+
+# Swapped in before any app module binds `db`
+app_package.client = mongomock.MongoClient()
+app_package.db = app_package.client.get_database("faceauth_test")
+
+from flask_jwt_extended import create_access_token
+from app import create_app
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    return create_app(start_jobs=False)
+
+
+@pytest.fixture
+def db(flask_app):
+    """The mongomock database, emptied and with every process cache reset."""
+    from app.embedding_cache import embedding_cache
+    from app.response_cache import analytics_cache
+    from app.timeline import session_calendars
+    for name in app_package.db.list_collection_names():
+        app_package.db.drop_collection(name)
+    embedding_cache.invalidate()
+    analytics_cache.clear()
+    session_calendars.invalidate()
+    return app_package.db
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def admin_headers(flask_app):
+    with flask_app.app_context():
+        token = create_access_token(identity="000000000000000000000001", additional_claims={"role": "admin"})
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,127 @@
+"""
+GET /admin/analytics reads the attendance rollups. These tests compare it
+with the original implementation, which scanned the attendance collection
+once per course.
+"""
+import datetime
+import random
+import pytest
+from bson import ObjectId
+from app.attendance import mark_present
+
+
+def reference_admin_analytics(db, selected_course_ids):
+    """The endpoint as it was before the rollups, kept as the expected result."""
+    student_filter = {"role": "student"}
+    course_filter = {}
+    if selected_course_ids:
+        student_filter["course_id"] = {"$in": selected_course_ids}
+        try:
+            object_ids = [ObjectId(cid) for cid in selected_course_ids]
+            course_filter["_id"] = {"$in": object_ids}
+        except Exception:
+            course_filter["_id"] = {"$in": selected_course_ids}
+
+    current_student_ids = [s['_id'] for s in db.users.find(student_filter, {"_id": 1})]
+    total_students = len(current_student_ids)
+    if total_students == 0:
+        return {"totalStudents": 0, "overallAttendancePercentage": 0, "courseAnalytics": []}
+
+    attendance_filter = {"student_id": {"$in": current_student_ids}}
+    if selected_course_ids:
+        attendance_filter["course_id"] = {"$in": selected_course_ids}
+    total_attendance_records = db.attendance.count_documents(attendance_filter)
+    distinct_dates = db.attendance.distinct("date", attendance_filter)
+    total_possible_attendance = total_students * len(distinct_dates)
+    overall_percentage = (total_attendance_records / total_possible_attendance) * 100 if total_possible_attendance > 0 else 0
+
+    course_analytics = []
+    for course in db.courses.find(course_filter if selected_course_ids else {}):
+        course_id_str = str(course['_id'])
+        student_ids_in_course = [s['_id'] for s in db.users.find({"role": "student", "course_id": course_id_str}, {"_id": 1})]
+        students_in_course_count = len(student_ids_in_course)
+        if students_in_course_count == 0:
+            course_analytics.append({"name": course['name'], "attendance": 0})
+            continue
+        course_attendance_filter = {"course_id": course_id_str, "student_id": {"$in": student_ids_in_course}}
+        attendance_in_course = db.attendance.count_documents(course_attendance_filter)
+        distinct_dates_in_course = db.attendance.distinct("date", course_attendance_filter)
+        possible_in_course = students_in_course_count * len(distinct_dates_in_course)
+        course_percentage = (attendance_in_course / possible_in_course) * 100 if possible_in_course > 0 else 0
+        course_analytics.append({"name": course['name'], "attendance": round(course_percentage, 2)})
+
+    return {
+        "totalStudents": total_students,
+        "overallAttendancePercentage": round(overall_percentage, 2),
+        "courseAnalytics": course_analytics
+    }
+
+
+@pytest.fixture
+def school(db):
+    """Four courses (the last without students) and 40 days of marked attendance."""
+    rng = random.Random(7)
+    course_ids = [str(db.courses.insert_one({"name": f"Course {i}"}).inserted_id) for i in range(4)]
+    students = {course_id: [] for course_id in course_ids}
+    for n in range(30):
+        course_id = course_ids[n % 3]
+        result = db.users.insert_one({"name": f"Student {n}", "roll_no": f"R{n:03d}", "role": "student", "course_id": course_id})
+        students[course_id].append(result.inserted_id)
+    start = datetime.date(2024, 4, 1)
+    for offset in range(40):
+        date = (start + datetime.timedelta(days=offset)).isoformat()
+        for course_id in course_ids[:3]:
+            if rng.random() < 0.8:
+                present = [s for s in students[course_id] if rng.random() < 0.7]
+                mark_present(course_id, present, date)
+    return course_ids, students
+
+
+def admin_analytics(client, headers, courses=None):
+    query = {"courses": ",".join(courses)} if courses else {}
+    response = client.get("/api/admin/analytics", headers=headers, query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def assert_matches_reference(db, client, headers, selections):
+    for courses in selections:
+        assert admin_analytics(client, headers, courses) == reference_admin_analytics(db, courses), courses
+
+
+def test_all_and_selected_courses(db, client, admin_headers, school):
+    course_ids, _ = school
+    assert_matches_reference(db, client, admin_headers, [
+        None, course_ids[:1], course_ids[1:3], course_ids, [course_ids[3]],
+    ])
+
+
+def test_empty_and_unknown_courses(db, client, admin_headers, school):
+    course_ids, _ = school
+    assert_matches_reference(db, client, admin_headers, [
+        [str(ObjectId())], ["CS101"], [course_ids[0], str(ObjectId())],
+    ])
+
+
+def test_no_students(db, client, admin_headers):
+    db.courses.insert_one({"name": "Empty"})
+    assert_matches_reference(db, client, admin_headers, [None])
+
+
+def test_student_changed_course(db, client, admin_headers, school):
+    course_ids, students = school
+    moved = students[course_ids[0]][0]
+    response = client.put(f"/api/admin/student/{moved}", headers=admin_headers, json={"course_id": course_ids[1]})
+    assert response.status_code == 200
+    # Attendance in the new course after the move
+    mark_present(course_ids[1], [moved], "2024-06-03")
+    assert_matches_reference(db, client, admin_headers, [
+        None, course_ids[:1], course_ids[1:2], course_ids[:2], course_ids[1:3],
+    ])
+
+
+def test_deleted_student(db, client, admin_headers, school):
+    course_ids, students = school
+    response = client.delete(f"/api/admin/student/{students[course_ids[2]][0]}", headers=admin_headers)
+    assert response.status_code == 200
+    assert_matches_reference(db, client, admin_headers, [None, course_ids[2:3]])
@@ -0,0 +1,112 @@
+"""
+Matching of face encodings against a roster. Encodings are synthetic: points
+on a few axes of the 128-d space, placed so that distances are exact binary
+fractions and boundaries can be tested without float32 rounding.
+"""
+import numpy as np
+from app.services import best_match, match_encodings, resolve_duplicate_matches
+
+
+def point(**axes):
+    """A 128-d float32 encoding with the given values on axes named a0, a1, ..."""
+    encoding = np.zeros(128, dtype=np.float32)
+    for name, value in axes.items():
+        encoding[int(name[1:])] = value
+    return encoding
+
+
+def statuses(results):
+    return [(r["index"], r["status"]) for r in results]
+
+
+def test_distance_at_tolerance_matches():
+    known = [point(), point(a0=4)]
+    results = match_encodings(known, [point(a1=0.5), point(a1=0.5, a2=0.0625)], tolerance=0.5)
+    assert results[0] == {"index": 0, "distance": 0.5, "status": "matched"}
+    assert results[1]["distance"] > 0.5
+    assert statuses(results[1:]) == [(None, "unmatched")]
+
+
+def test_default_tolerance():
+    known = [point(), point(a0=4)]
+    assert statuses(match_encodings(known, [point(a1=0.59), point(a1=0.61)])) == [(0, "matched"), (None, "unmatched")]
+
+
+def test_ambiguous_margin():
+    # Runner-up 0.0625 further away than the best candidate
+    known = [point(a0=0.25), point(a1=0.3125)]
+    assert statuses(match_encodings(known, [point()], tolerance=0.5, margin=0.125)) == [(0, "ambiguous")]
+    # Runner-up exactly `margin` further away is no longer ambiguous
+    known = [point(a0=0.25), point(a1=0.375)]
+    assert statuses(match_encodings(known, [point()], tolerance=0.5, margin=0.125)) == [(0, "matched")]
+
+
+def test_runner_up_outside_tolerance_is_not_ambiguous():
+    known = [point(a0=0.5), point(a1=0.5625)]
+    assert statuses(match_encodings(known, [point()], tolerance=0.5, margin=0.125)) == [(0, "matched")]
+
+
+def test_single_known_encoding():
+    assert statuses(match_encodings([point(a0=0.25)], [point()], tolerance=0.5)) == [(0, "matched")]
+
+
+def test_empty_inputs():
+    assert match_encodings([point()], []) == []
+    assert match_encodings(np.empty((0, 128), dtype=np.float32), [point(), point(a0=1)]) == [
+        {"index": None, "distance": None, "status": "unmatched"},
+        {"index": None, "distance": None, "status": "unmatched"},
+    ]
+
+
+def test_best_match_picks_closest_matched_face():
+    known = [point(), point(a0=4)]
+    faces = [point(a1=0.375), point(a0=4, a1=0.25), point(a0=-4)]
+    assert best_match(known, faces) == {"index": 1, "distance": 0.25, "status": "matched"}
+
+
+def test_best_match_skips_ambiguous_faces():
+    # The second face is closest to student 1 but student 2 is almost as close
+    known = [point(), point(a0=4), point(a0=4, a2=0.0625)]
+    faces = [point(a1=0.375), point(a0=4, a1=0.25)]
+    assert statuses(match_encodings(known, faces)) == [(0, "matched"), (1, "ambiguous")]
+    assert best_match(known, faces)["index"] == 0
+
+
+def test_best_match_without_match():
+    known = [point(), point(a0=4)]
+    assert best_match(known, [point(a1=2)]) is None
+    assert best_match(known, []) is None
+
+
+def test_closest_face_keeps_duplicate_match():
+    results = [
+        {"index": 3, "distance": 0.4, "status": "matched"},
+        {"index": 1, "distance": 0.3, "status": "matched"},
+        {"index": 3, "distance": 0.2, "status": "matched"},
+        {"index": 3, "distance": 0.3, "status": "matched"},
+    ]
+    assert statuses(resolve_duplicate_matches(results)) == [(3, "ambiguous"), (1, "matched"), (3, "matched"), (3, "ambiguous")]
+
+
+def test_duplicate_match_tie_keeps_first_face():
+    results = [
+        {"index": 2, "distance": 0.25, "status": "matched"},
+        {"index": 2, "distance": 0.25, "status": "matched"},
+    ]
+    assert statuses(resolve_duplicate_matches(results)) == [(2, "matched"), (2, "ambiguous")]
+
+
+def test_duplicate_resolution_ignores_unconfident_faces():
+    results = [
+        {"index": 0, "distance": 0.1, "status": "ambiguous"},
+        {"index": None, "distance": 0.9, "status": "unmatched"},
+        {"index": 0, "distance": 0.3, "status": "matched"},
+    ]
+    assert statuses(resolve_duplicate_matches(results)) == [(0, "ambiguous"), (None, "unmatched"), (0, "matched")]
+
+
+def test_two_faces_of_one_student():
+    known = [point(), point(a0=4)]
+    faces = [point(a1=0.375), point(a1=-0.25)]
+    results = resolve_duplicate_matches(match_encodings(known, faces))
+    assert statuses(results) == [(0, "ambiguous"), (0, "matched")]
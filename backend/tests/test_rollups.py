@@ -0,0 +1,187 @@
+"""
+The attendance_daily and student_monthly rollups are maintained incrementally
+by marks, course changes and deletions. These tests compare them, and the
+analytics read from them, with aggregations over the raw attendance records.
+"""
+import datetime
+import random
+import pytest
+from app import rollups
+from app.analytics import _percentage, former_course_records, period_filter, teacher_course_analytics
+from app.attendance import mark_present
+
+MONTHS = [None, "2024-04", "2024-05", "2024"]
+
+
+def current_students(db):
+    return {s['_id']: s.get('course_id') for s in db.users.find({"role": "student"}, {"course_id": 1})}
+
+
+def raw_daily(db):
+    """(course_id, date) -> (records, present of students currently in the course)."""
+    current = current_students(db)
+    records = {
+        (row["_id"]["course_id"], row["_id"]["date"]): row["count"]
+        for row in db.attendance.aggregate([
+            {"$group": {"_id": {"course_id": "$course_id", "date": "$date"}, "count": {"$sum": 1}}},
+        ])
+    }
+    present = dict.fromkeys(records, 0)
+    for record in db.attendance.find({"status": "Present"}, {"student_id": 1, "course_id": 1, "date": 1}):
+        if current.get(record['student_id']) == record['course_id']:
+            present[(record['course_id'], record['date'])] += 1
+    return {key: (count, present[key]) for key, count in records.items()}
+
+
+def raw_monthly(db):
+    """(student_id, course_id, month) -> present records in the student's current course."""
+    current = current_students(db)
+    monthly = {}
+    for row in db.attendance.aggregate([
+        {"$match": {"status": "Present"}},
+        {"$group": {
+            "_id": {"student_id": "$student_id", "course_id": "$course_id", "month": {"$substr": ["$date", 0, 7]}},
+            "count": {"$sum": 1},
+        }},
+    ]):
+        key = (row["_id"]["student_id"], row["_id"]["course_id"], row["_id"]["month"])
+        if current.get(key[0]) == key[1]:
+            monthly[key] = row["count"]
+    return monthly
+
+
+def stored_daily(db):
+    return {(d["course_id"], d["date"]): (d["records"], d["present"]) for d in db[rollups.DAILY].find({"records": {"$gt": 0}})}
+
+
+def stored_monthly(db):
+    return {(d["student_id"], d["course_id"], d["month"]): d["present"] for d in db[rollups.MONTHLY].find({"present": {"$gt": 0}})}
+
+
+def reference_teacher_analytics(db, course_id, month_str):
+    """The aggregation teacher analytics ran over attendance before the rollups."""
+    current_student_ids = [s['_id'] for s in db.users.find({"role": "student", "course_id": course_id}, {"_id": 1})]
+    students_in_course_count = len(current_student_ids)
+    if students_in_course_count == 0:
+        return {"studentsInCourse": 0, "overallAttendancePercentage": 0, "dailyStats": [], "totalClasses": 0}
+    match = {"course_id": course_id, "student_id": {"$in": current_student_ids}}
+    month_match = {**match, **period_filter(month_str)} if month_str else match
+    month = list(db.attendance.aggregate([
+        {"$match": month_match},
+        {"$group": {"_id": None, "records": {"$sum": 1}, "dates": {"$addToSet": "$date"}}},
+        {"$project": {"records": 1, "sessions": {"$size": "$dates"}}},
+    ]))
+    month = month[0] if month else {"records": 0, "sessions": 0}
+    recent = db.attendance.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$date", "present": {"$sum": {"$cond": [{"$eq": ["$status", "Present"]}, 1, 0]}}}},
+        {"$sort": {"_id": -1}},
+        {"$limit": 7},
+    ])
+    return {
+        "studentsInCourse": students_in_course_count,
+        "overallAttendancePercentage": round(_percentage(month["records"], students_in_course_count, month["sessions"]), 2),
+        "dailyStats": [
+            {"date": day["_id"], "Present": day["present"], "Absent": students_in_course_count - day["present"]}
+            for day in recent
+        ],
+        "totalClasses": month["sessions"],
+    }
+
+
+def reference_former_records(db):
+    """Attendance each student holds in a course other than their current one."""
+    current = current_students(db)
+    return sorted(
+        (r['student_id'], r['course_id'], r['date'])
+        for r in db.attendance.find({}, {"student_id": 1, "course_id": 1, "date": 1})
+        if r['student_id'] in current and current[r['student_id']] != r['course_id']
+    )
+
+
+def assert_consistent(db, course_ids):
+    assert stored_daily(db) == raw_daily(db)
+    assert stored_monthly(db) == raw_monthly(db)
+    assert rollups.verify() == []
+    for course_id in course_ids:
+        for month in MONTHS:
+            assert teacher_course_analytics(course_id, month) == reference_teacher_analytics(db, course_id, month), (course_id, month)
+    former = sorted((r['student_id'], r['course_id'], r['date']) for r in former_course_records(None))
+    assert former == reference_former_records(db)
+
+
+@pytest.fixture
+def school(db):
+    """Three courses of six students with two months of marked attendance."""
+    rng = random.Random(13)
+    course_ids = [str(db.courses.insert_one({"name": f"Course {i}"}).inserted_id) for i in range(3)]
+    students = {course_id: [] for course_id in course_ids}
+    for n in range(18):
+        course_id = course_ids[n % 3]
+        result = db.users.insert_one({"name": f"Student {n}", "roll_no": f"R{n:03d}", "role": "student", "course_id": course_id})
+        students[course_id].append(result.inserted_id)
+    start = datetime.date(2024, 4, 15)
+    for offset in range(30):
+        date = (start + datetime.timedelta(days=offset)).isoformat()
+        for course_id in course_ids:
+            if rng.random() < 0.8:
+                mark_present(course_id, [s for s in students[course_id] if rng.random() < 0.7], date)
+    return course_ids, students
+
+
+def test_marks(db, school):
+    course_ids, students = school
+    assert_consistent(db, course_ids)
+    # Marking students already present changes nothing
+    mark_present(course_ids[0], students[course_ids[0]], "2024-04-15")
+    mark_present(course_ids[0], students[course_ids[0]], "2024-04-15")
+    assert_consistent(db, course_ids)
+
+
+def test_move_student(db, client, admin_headers, school):
+    course_ids, students = school
+    moved = students[course_ids[0]][0]
+    response = client.put(f"/api/admin/student/{moved}", headers=admin_headers, json={"course_id": course_ids[1]})
+    assert response.status_code == 200
+    assert db.users.find_one({"_id": moved})[rollups.FORMER_COURSES] == [course_ids[0]]
+    mark_present(course_ids[1], [moved], "2024-05-20")
+    assert_consistent(db, course_ids)
+
+    # Back to the first course: its old records count again, the second course's become former ones
+    response = client.put(f"/api/admin/student/{moved}", headers=admin_headers, json={"course_id": course_ids[0]})
+    assert response.status_code == 200
+    assert sorted(db.users.find_one({"_id": moved})[rollups.FORMER_COURSES]) == sorted(course_ids[:2])
+    assert_consistent(db, course_ids)
+
+
+def test_remove_student(db, client, admin_headers, school):
+    course_ids, students = school
+    removed = students[course_ids[2]][0]
+    response = client.delete(f"/api/admin/student/{removed}", headers=admin_headers)
+    assert response.status_code == 200
+    assert db[rollups.MONTHLY].count_documents({"student_id": removed}) == 0
+    assert_consistent(db, course_ids)
+
+
+def test_remove_moved_student(db, client, admin_headers, school):
+    course_ids, students = school
+    moved = students[course_ids[1]][0]
+    client.put(f"/api/admin/student/{moved}", headers=admin_headers, json={"course_id": course_ids[2]})
+    mark_present(course_ids[2], [moved], "2024-05-20")
+    response = client.delete(f"/api/admin/student/{moved}", headers=admin_headers)
+    assert response.status_code == 200
+    assert_consistent(db, course_ids)
+
+
+def test_rebuild(db, school):
+    course_ids, students = school
+    # Changes made behind the rollups' back: a direct insert and a course
+    # change that skipped move_student
+    db.attendance.insert_one({"student_id": students[course_ids[0]][1], "course_id": course_ids[0], "date": "2024-06-01", "day": datetime.datetime(2024, 6, 1), "status": "Present"})
+    moved = students[course_ids[2]][1]
+    db.users.update_one({"_id": moved}, {"$set": {"course_id": course_ids[0]}})
+    assert rollups.verify() != []
+
+    rollups.rebuild(chunk_size=7)
+    assert db.users.find_one({"_id": moved})[rollups.FORMER_COURSES] == [course_ids[2]]
+    assert_consistent(db, course_ids)
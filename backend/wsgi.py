@@ -0,0 +1,54 @@
+"""
+Production entry point for a pre-fork server:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py preloads this module in the master, so the app and, unless
+FACE_PRELOAD is off, the dlib face models are loaded once and shared
+copy-on-write by every worker. start_worker() then runs in each worker after
+the fork. run.py remains the development server.
+"""
+import os
+import time
+
+_started = time.perf_counter()
+
+from app import create_app
+from app.services import face_recognition_api, warm_up
+
+# Load the face models in the master and warm them up in every worker. Turn
+# off for workers that only serve login and analytics; the models are then
+# loaded by the first face request instead.
+FACE_PRELOAD = os.getenv("FACE_PRELOAD", "true").lower() == "true"
+
+app = create_app(start_jobs=False)
+app_seconds = time.perf_counter() - _started
+if FACE_PRELOAD:
+    face_recognition_api()
+startup_seconds = time.perf_counter() - _started
+print(f"App loaded in {app_seconds:.2f}s, face models {'loaded' if FACE_PRELOAD else 'deferred'}, ready in {startup_seconds:.2f}s")
+
+
+def start_worker(workers=1):
+    """
+    Per-worker setup after the fork: starts the job threads and runs a
+    warmup inference. Returns the seconds taken.
+
+    With more than one worker, in-memory jobs would be polled through the
+    wrong worker half of the time, so the local job backend is refused and
+    live sessions, which cannot be shared, are turned off.
+    """
+    started = time.perf_counter()
+    from app.jobs import job_queue, JOB_BACKEND
+    from app.sessions import live_sessions
+    if workers > 1:
+        if JOB_BACKEND != "mongo":
+            raise RuntimeError(
+                f"JOB_BACKEND={JOB_BACKEND} keeps jobs in one worker's memory; "
+                "set JOB_BACKEND=mongo or run a single worker (WEB_CONCURRENCY=1)"
+            )
+        live_sessions.enabled = False
+    job_queue.start()
+    if FACE_PRELOAD:
+        warm_up()
+    return time.perf_counter() - started
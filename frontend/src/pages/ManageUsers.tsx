@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import Layout from '@/components/Layout';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -24,10 +24,27 @@ interface Course {
     name: string;
 }
 
+interface StudentPage {
+  students: Student[];
+  next_cursor: string | null;
+  total: number | null;
+}
+
+const PAGE_SIZE = 50;
+const ALL_COURSES = 'all';
+
 export default function ManageUsers() {
   const [students, setStudents] = useState<Student[]>([]);
   const [courses, setCourses] = useState<Course[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [total, setTotal] = useState<number | null>(null);
+  const [search, setSearch] = useState('');
+  const [query, setQuery] = useState('');
+  const [courseFilter, setCourseFilter] = useState(ALL_COURSES);
+  // Ignores responses of a search or filter that has since changed
+  const requestId = useRef(0);
   
   // State for Edit Dialog
   const [isEditDialogOpen, setIsEditDialogOpen] = useState(false);
@@ -47,23 +64,60 @@ export default function ManageUsers() {
   const [studentToUpdateImage, setStudentToUpdateImage] = useState<Student | null>(null);
 
 
+  const studentParams = (cursor?: string) => {
+    const params: Record<string, string | number> = { limit: PAGE_SIZE };
+    if (query) params.q = query;
+    if (courseFilter !== ALL_COURSES) params.course_id = courseFilter;
+    if (cursor) params.cursor = cursor;
+    return params;
+  };
+
   const fetchStudents = () => {
+    const id = ++requestId.current;
     setIsLoading(true);
-    api.get('/students')
-      .then(res => setStudents(res.data))
+    api.get<StudentPage>('/students', { params: studentParams() })
+      .then(res => {
+        if (id !== requestId.current) return;
+        setStudents(res.data.students);
+        setNextCursor(res.data.next_cursor);
+        setTotal(res.data.total);
+      })
       .catch(() => toast.error("Failed to load students."))
-      .finally(() => setIsLoading(false));
+      .finally(() => { if (id === requestId.current) setIsLoading(false); });
+  };
+
+  const fetchMoreStudents = () => {
+    if (!nextCursor) return;
+    const id = requestId.current;
+    setIsLoadingMore(true);
+    api.get<StudentPage>('/students', { params: studentParams(nextCursor) })
+      .then(res => {
+        if (id !== requestId.current) return;
+        setStudents(prev => [...prev, ...res.data.students]);
+        setNextCursor(res.data.next_cursor);
+      })
+      .catch(() => toast.error("Failed to load more students."))
+      .finally(() => setIsLoadingMore(false));
   };
 
   const fetchCourses = () => {
-      api.get('/courses').then(res => setCourses(res.data));
+      api.get('/courses', { params: { fields: 'name' } }).then(res => setCourses(res.data));
   }
 
   useEffect(() => {
-    fetchStudents();
     fetchCourses();
   }, []);
 
+  // Search once typing pauses
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(search.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  useEffect(() => {
+    fetchStudents();
+  }, [query, courseFilter]);
+
   // --- Edit Handlers ---
   const handleEditClick = (student: Student) => {
     setCurrentStudent(student);
@@ -137,7 +191,28 @@ export default function ManageUsers() {
       <Card>
         <CardHeader><CardTitle>Student List</CardTitle></CardHeader>
         <CardContent>
+          <div className="flex flex-col gap-2 mb-4 sm:flex-row sm:items-center">
+            <Input
+              placeholder="Search by name or roll number..."
+              value={search}
+              onChange={(e) => setSearch(e.target.value)}
+              className="sm:max-w-sm"
+            />
+            <Select value={courseFilter} onValueChange={setCourseFilter}>
+              <SelectTrigger className="sm:w-56"><SelectValue /></SelectTrigger>
+              <SelectContent>
+                <SelectItem value={ALL_COURSES}>All courses</SelectItem>
+                {courses.map(c => <SelectItem key={c._id} value={c._id}>{c.name}</SelectItem>)}
+              </SelectContent>
+            </Select>
+            {total !== null && (
+              <p className="text-sm text-muted-foreground sm:ml-auto">
+                Showing {students.length} of {total} students
+              </p>
+            )}
+          </div>
           {isLoading ? <p>Loading students...</p> : (
+            <>
             <Table>
               <TableHeader>
                 <TableRow>
@@ -166,6 +241,14 @@ export default function ManageUsers() {
                 ))}
               </TableBody>
             </Table>
+            {nextCursor && (
+              <div className="flex justify-center mt-4">
+                <Button variant="outline" onClick={fetchMoreStudents} disabled={isLoadingMore}>
+                  {isLoadingMore ? 'Loading...' : 'Load more'}
+                </Button>
+              </div>
+            )}
+            </>
           )}
         </CardContent>
       </Card>
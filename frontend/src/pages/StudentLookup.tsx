@@ -17,6 +17,9 @@ interface DailyRecord { date: string; status: string; }
 interface WeeklyRecord { week: string; percentage: number; }
 interface MonthlyRecord { name: string; value: number; }
 
+// Students offered in the picker for one search
+const SEARCH_LIMIT = 20;
+
 // A sub-component to neatly handle rendering the different views
 const AttendanceDisplay = ({ view, records, isLoading }: { view: string, records: any[], isLoading: boolean }) => {
     const COLORS = ['#16a34a', '#dc2626']; // green, red for Pie Chart
@@ -73,16 +76,34 @@ const AttendanceDisplay = ({ view, records, isLoading }: { view: string, records
 
 export default function StudentLookup() {
     const [students, setStudents] = useState<Student[]>([]);
+    const [search, setSearch] = useState('');
     const [selectedStudent, setSelectedStudent] = useState('');
+    const [selected, setSelected] = useState<Student | null>(null);
     const [view, setView] = useState('daily');
     const [month, setMonth] = useState(new Date().toISOString().slice(0, 7));
     const [records, setRecords] = useState<any[]>([]);
     const [isLoading, setIsLoading] = useState(false);
 
+    // Search once typing pauses; results of an older search are dropped
     useEffect(() => {
-        api.get('/students').then(res => setStudents(res.data))
-           .catch(() => toast.error("Failed to load student list."));
-    }, []);
+        let cancelled = false;
+        const timer = setTimeout(() => {
+            const params: Record<string, string | number> = { limit: SEARCH_LIMIT, fields: 'name,roll_no' };
+            if (search.trim()) params.q = search.trim();
+            api.get('/students', { params })
+               .then(res => { if (!cancelled) setStudents(res.data.students); })
+               .catch(() => toast.error("Failed to load student list."));
+        }, 300);
+        return () => { cancelled = true; clearTimeout(timer); };
+    }, [search]);
+
+    const handleSelect = (id: string) => {
+        setSelectedStudent(id);
+        setSelected(students.find(s => s._id === id) || null);
+    };
+
+    // Keep the chosen student in the list when a new search no longer matches them
+    const options = selected && !students.some(s => s._id === selected._id) ? [selected, ...students] : students;
 
     useEffect(() => {
         if (selectedStudent) {
@@ -111,12 +132,17 @@ export default function StudentLookup() {
                 <CardContent>
                     <div className="grid gap-2 mb-6">
                         <Label htmlFor="student-select">Student</Label>
-                        <Select onValueChange={setSelectedStudent}>
+                        <Input
+                            placeholder="Search by name or roll number..."
+                            value={search}
+                            onChange={(e) => setSearch(e.target.value)}
+                        />
+                        <Select value={selectedStudent} onValueChange={handleSelect}>
                             <SelectTrigger id="student-select">
                                 <SelectValue placeholder="Select a student to view their records..." />
                             </SelectTrigger>
                             <SelectContent>
-                                {students.map(s => (
+                                {options.map(s => (
                                     <SelectItem key={s._id} value={s._id}>{s.name} ({s.roll_no})</SelectItem>
                                 ))}
                             </SelectContent>